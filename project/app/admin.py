@@ -1,5 +1,9 @@
 from django.contrib import admin
-from .models import History
+from .models import Balance, BalanceCheckpoint, History, HistoryImport, RateSnapshot
 
 # Registered model
-admin.site.register(History)
\ No newline at end of file
+admin.site.register(History)
+admin.site.register(Balance)
+admin.site.register(BalanceCheckpoint)
+admin.site.register(RateSnapshot)
+admin.site.register(HistoryImport)
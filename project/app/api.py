@@ -0,0 +1,321 @@
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.models import User
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.generic import View
+from .conversion import ROUNDING_MODES, getCrossRates
+from .models import History, applyOperations
+from .money import MAX_AMOUNT, formatAmount, parseAmount
+from .pagination import InvalidCursor
+from .rates import parseTimestamp
+from .sqlite import runWrite
+from .viewcache import cachedForUser
+from .views import (
+    conditionalResponse, exportHistory, getCurrencyParams, getHistoryPageSize, getHistoryPaginator, getRateSnapshot,
+    historyVersion, makeEtag, renderBalance,
+)
+import json
+
+def compactJson(data, status=200):
+    '''
+    A function that returns a JSON response without the optional whitespace of the default separators.
+    '''
+    return JsonResponse(data, status=status, json_dumps_params={'separators': (',', ':')})
+
+def jsonError(message, status=400):
+    '''
+    A function that returns a JSON response {"error": message} with the given status code.
+    '''
+    return compactJson({'error': message}, status=status)
+
+class ApiLoginRequiredMixin(LoginRequiredMixin):
+    '''
+    LoginRequiredMixin for JSON endpoints: an anonymous request gets a 401 JSON response
+    instead of a redirect to the login page.
+    '''
+    def handle_no_permission(self):
+        return jsonError('Authentication required', status=401)
+
+
+class BatchOperationsView(ApiLoginRequiredMixin, View):
+    '''
+    A JSON endpoint that performs many deposits and withdrawals in one request.
+
+    The request body is a JSON object with a list of operations, applied in order:
+    {"operations": [{"type": "deposit", "amount": "12.50"}, {"type": "withdraw", "amount": 5, "user": "Tom"}]}
+
+    type - deposit or withdraw.
+    amount - a positive amount with at most two decimal places, as a string or a number.
+    user - optional username, the current user by default. Only staff users may operate on other accounts.
+
+    The response contains one result per operation, in the same order, and the balances after the batch:
+    {"results": [{"status": "success", "id": 12, "balance": "12.50"}, ...], "balances": {"Tom": "7.50"}}
+
+    status - success, failure (a withdrawal larger than the balance, recorded in the history as with the form)
+    or rejected (an invalid operation, not recorded). Failed and rejected results have an error message.
+
+    The valid operations are performed by applyOperations in a single transaction.
+    At most settings.API_BATCH_MAX_OPERATIONS operations are accepted per request.
+    '''
+    def post(self, request):
+        try:
+            payload = json.loads(request.body)
+        except ValueError:
+            return jsonError('Invalid JSON')
+        operations = payload.get('operations') if isinstance(payload, dict) else None
+        if not isinstance(operations, list) or not operations:
+            return jsonError('"operations" must be a non-empty list')
+        if len(operations) > settings.API_BATCH_MAX_OPERATIONS:
+            return jsonError(f'At most {settings.API_BATCH_MAX_OPERATIONS} operations are allowed per request')
+
+        # Other values, e.g. lists, are not hashable; validate() rejects their operations
+        usernames = {
+            item['user'] for item in operations if isinstance(item, dict) and isinstance(item.get('user'), str)
+        }
+        user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'pk'))
+        user_ids[request.user.username] = request.user.pk
+
+        results = []
+        valid = []
+        for item in operations:
+            user_id, type, amount, error = self.validate(request.user, item, user_ids)
+            if error:
+                results.append({'status': 'rejected', 'error': error})
+            else:
+                results.append(None)
+                valid.append((len(results) - 1, (user_id, type, amount)))
+
+        balances = {}
+        if valid:
+            entries, balances = runWrite(applyOperations, [operation for _, operation in valid])
+            for (index, _), entry in zip(valid, entries):
+                results[index] = {'status': entry.status, 'id': entry.id, 'balance': formatAmount(entry.balance_after)}
+                if entry.status == 'failure':
+                    results[index]['error'] = 'Insufficient balance'
+
+        usernames = {pk: username for username, pk in user_ids.items()}
+        return JsonResponse({
+            'results': results,
+            'balances': {usernames[user_id]: formatAmount(balance) for user_id, balance in balances.items()},
+        })
+
+    def validate(self, user, item, user_ids):
+        '''
+        Checks one operation of the batch and returns (user_id, type, amount in cents, error).
+        error is None for a valid operation.
+        '''
+        if not isinstance(item, dict):
+            return None, None, None, 'Invalid operation'
+        username = item.get('user', user.username)
+        if username != user.username and not user.is_staff:
+            return None, None, None, 'Permission denied'
+        if not isinstance(username, str) or username not in user_ids:
+            return None, None, None, 'Unknown user'
+        type = item.get('type')
+        if type not in ('deposit', 'withdraw'):
+            return None, None, None, 'Unknown operation'
+        amount = item.get('amount')
+        try:
+            # true and false are not amounts, even though bool is a subclass of int
+            amount = 0 if isinstance(amount, bool) else parseAmount(amount)
+        except ValueError:
+            amount = 0
+        if amount <= 0 or amount > MAX_AMOUNT:
+            return None, None, None, 'Invalid amount'
+        return user_ids[username], type, amount, None
+
+
+class BalanceAPIView(ApiLoginRequiredMixin, View):
+    def get(self, request):
+        '''
+        Returns the balance of the current user from getBalance, through the view cache:
+        {"username": "Tom", "balance": "12.50"}
+        '''
+        balance, _ = cachedForUser(request.user, 'balance', lambda: renderBalance(request.user))
+        return conditionalResponse(
+            request, makeEtag('balance', request.user.pk, request.user.username, balance),
+            lambda: compactJson({'username': request.user.username, 'balance': formatAmount(balance)}),
+        )
+
+
+class HistoryAPIView(ApiLoginRequiredMixin, View):
+    def get(self, request):
+        '''
+        Returns one page of the transaction history of the current user, newest first,
+        with the same keyset pagination as the history page (the cursor and page_size query parameters):
+        {"results": [{"id": 3, "datetime": "...", "type": "deposit", "status": "success",
+        "amount": "12.50", "balance_after": "12.50"}, ...], "next": "...", "previous": null}
+
+        next and previous are the cursors of the neighbouring pages or null.
+        The JSON of the page is kept in the view cache.
+        '''
+        cursor = request.GET.get('cursor')
+        page_size = getHistoryPageSize(request)
+
+        def serialize():
+            paginator = getHistoryPaginator(request.user, History.objects.filter(user=request.user), page_size)
+            page = paginator.page(cursor)
+            return compactJson({
+                'results': [
+                    {
+                        'id': transaction.id,
+                        'datetime': transaction.datetime,
+                        'type': transaction.type,
+                        'status': transaction.status,
+                        'amount': formatAmount(transaction.amount),
+                        'balance_after': formatAmount(transaction.balance_after),
+                    }
+                    for transaction in page
+                ],
+                'next': page.next_cursor,
+                'previous': page.previous_cursor,
+            }).content
+
+        def build():
+            try:
+                content = cachedForUser(request.user, 'api_history', serialize, cursor, page_size)
+            except InvalidCursor:
+                return jsonError('Invalid cursor')
+            return HttpResponse(content, content_type='application/json')
+
+        return conditionalResponse(request, makeEtag('history', request.user.pk, historyVersion(request.user), cursor, page_size), build)
+
+
+class HistoryStreamAPIView(ApiLoginRequiredMixin, View):
+    def get(self, request):
+        '''
+        Streams the entire transaction history of the current user, oldest first, as a single JSON array
+        written by exportHistory, so the memory used does not depend on the number of transactions.
+        '''
+        return conditionalResponse(
+            request, makeEtag('history-all', request.user.pk, historyVersion(request.user)),
+            lambda: StreamingHttpResponse(
+                exportHistory(request.user, 'json', chunk_size=settings.HISTORY_EXPORT_CHUNK_SIZE),
+                content_type='application/json',
+            ),
+        )
+
+
+class ExchangeAPIView(ApiLoginRequiredMixin, View):
+    def get(self, request):
+        '''
+        Returns the currency rates from getCurrencyParams: {"rates": {"USD": 1.15, ...}}.
+        With the currency and amount query parameters the converted amount is added:
+        {"rates": {...}, "currency": "USD", "amount": "10.00", "exchanged_amount": "11.50"}
+
+        The amount is converted exactly and rounded half up, as by the batch exchange API (see CrossRates).
+
+        Returns 503 if the rates are unavailable and 400 for an unknown currency or an invalid amount.
+        '''
+        rates, _ = getCurrencyParams()
+        if rates is None:
+            return jsonError('Currency rates are unavailable', status=503)
+        currency = request.GET.get('currency')
+        amount = request.GET.get('amount')
+
+        def build():
+            data = {'rates': rates}
+            if currency is None and amount is None:
+                return compactJson(data)
+            cross_rates = getCrossRates(rates)
+            if currency is None or currency not in cross_rates.index:
+                return jsonError('Unknown currency')
+            try:
+                cents = parseAmount(amount)
+            except ValueError:
+                return jsonError('Invalid amount')
+            if cents > MAX_AMOUNT:
+                return jsonError('Invalid amount')
+            exchanged = cross_rates.convert([cents], cross_rates.indices([None]), cross_rates.indices([currency]))
+            data.update({
+                'currency': currency,
+                'amount': formatAmount(cents),
+                'exchanged_amount': formatAmount(exchanged.tolist()[0]),
+            })
+            return compactJson(data)
+
+        snapshot = json.dumps(rates, sort_keys=True)
+        return conditionalResponse(request, makeEtag('exchange', snapshot, currency, amount), build)
+
+
+class BatchExchangeAPIView(ApiLoginRequiredMixin, View):
+    '''
+    A JSON endpoint that converts many amounts between currencies in one request.
+
+    The request body is a JSON object with a list of conversions:
+    {"conversions": [{"amount": "12.50", "to": "USD"}, {"amount": 100, "from": "GBP", "to": "JPY"}],
+    "rounding": "half_even", "at": "2024-03-01T12:00"}
+
+    amount - a non-negative amount with at most two decimal places, as a string or a number.
+    from, to - currency codes of the rates. Without from the amount is in the base currency of the API,
+    as on the currency exchange page.
+    rounding - optional, half_up (default) or half_even for amounts that fall exactly on half a cent.
+    at - optional date or date and time: convert at the rates that were current then (see getRateSnapshot).
+
+    The response has one converted amount per conversion, in the same order:
+    {"rates_at": null, "rounding": "half_up", "results": ["14.38", ...]}
+    rates_at is the time of the stored snapshot that was used, null for the current rates.
+
+    All amounts are converted at once with the cross-rate matrices of the snapshot, see CrossRates.
+    An invalid conversion rejects the whole request with its position in the error message.
+    At most settings.API_BATCH_MAX_CONVERSIONS conversions are accepted per request.
+    '''
+    def post(self, request):
+        try:
+            payload = json.loads(request.body)
+        except ValueError:
+            return jsonError('Invalid JSON')
+        if not isinstance(payload, dict):
+            return jsonError('Invalid JSON')
+        conversions = payload.get('conversions')
+        if not isinstance(conversions, list) or not conversions:
+            return jsonError('"conversions" must be a non-empty list')
+        if len(conversions) > settings.API_BATCH_MAX_CONVERSIONS:
+            return jsonError(f'At most {settings.API_BATCH_MAX_CONVERSIONS} conversions are allowed per request')
+        rounding = payload.get('rounding', 'half_up')
+        if rounding not in ROUNDING_MODES:
+            return jsonError(f'"rounding" must be one of {", ".join(ROUNDING_MODES)}')
+        at = payload.get('at')
+        if at in (None, ''):
+            at = None
+        elif not isinstance(at, str):
+            # parseTimestamp only accepts strings
+            return jsonError('Invalid "at" timestamp')
+        else:
+            try:
+                at = parseTimestamp(at)
+            except ValueError:
+                return jsonError('Invalid "at" timestamp')
+
+        snapshot = getRateSnapshot(at)
+        if snapshot is None:
+            return jsonError('Currency rates are unavailable', status=503)
+        rates_at, rates = snapshot
+        cross_rates = getCrossRates(rates)
+
+        amounts, sources, targets = [], [], []
+        for position, item in enumerate(conversions):
+            if not isinstance(item, dict):
+                return jsonError(f'conversions[{position}]: invalid conversion')
+            amount = item.get('amount')
+            try:
+                amount = -1 if isinstance(amount, bool) else parseAmount(amount)
+            except ValueError:
+                amount = -1
+            if amount < 0 or amount > MAX_AMOUNT:
+                return jsonError(f'conversions[{position}]: invalid amount')
+            source, target = item.get('from'), item.get('to')
+            if not isinstance(target, str) or not (source is None or isinstance(source, str)):
+                return jsonError(f'conversions[{position}]: "to" and "from" must be currency codes')
+            if source not in cross_rates.index or target not in cross_rates.index:
+                return jsonError(f'conversions[{position}]: unknown currency')
+            amounts.append(amount)
+            sources.append(source)
+            targets.append(target)
+
+        converted = cross_rates.convert(amounts, cross_rates.indices(sources), cross_rates.indices(targets), rounding)
+        return compactJson({
+            'rates_at': rates_at,
+            'rounding': rounding,
+            'results': [formatAmount(cents) for cents in converted.tolist()],
+        })
@@ -4,3 +4,16 @@ from django.apps import AppConfig
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete, post_save
+        from .metrics import installQueryWrapper
+        from .models import History, historyDeleted
+        from .sqlite import configureConnection
+        from .viewcache import historyChanged
+        connection_created.connect(installQueryWrapper)
+        connection_created.connect(configureConnection)
+        post_save.connect(historyChanged, sender=History)
+        post_delete.connect(historyChanged, sender=History)
+        post_delete.connect(historyDeleted, sender=History)
@@ -0,0 +1,165 @@
+'''
+Self-hosted static assets.
+
+Bootstrap and jQuery are vendored in app/static/app/vendor, so pages load without any third-party
+round trip and work offline. Without DEBUG, collectstatic copies the files to settings.STATIC_ROOT through
+CompressedManifestStaticFilesStorage: every file gets a copy with a content hash in its name
+(e.g. bootstrap.min.3f2a5e9c1b7d.css), which the {% static %} tag links to, and a gzip (.gz) and,
+if the brotli package is installed, a brotli (.br) variant next to it. Compressing is part of the build,
+requests never compress anything.
+
+serveStatic serves STATIC_ROOT under STATIC_URL: it picks the smallest variant the client accepts
+(Accept-Encoding), and caches hashed names for settings.STATIC_MAX_AGE as immutable, since a changed file
+gets a new name. Other names are cached for settings.STATIC_UNHASHED_MAX_AGE. With DEBUG the development
+server serves the files from the apps' static directories instead, unhashed and uncompressed.
+'''
+import gzip
+import mimetypes
+import os
+import re
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Files that compress well, images and fonts are already compressed
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.json', '.map', '.svg', '.txt', '.xml', '.html', '.ico'}
+# A variant is only kept if it saves at least this fraction of the size
+MIN_SAVING = 0.05
+
+# The names of ManifestStaticFilesStorage: 12 hexadecimal digits before the extension
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.\w+$')
+
+
+def compressGzip(data):
+    # mtime=0 makes the output depend only on the input, so builds are reproducible
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def compressBrotli(data):
+    return brotli.compress(data, quality=11)
+
+
+def encodings():
+    '''
+    Returns the (Content-Encoding, file suffix, compress function) of every variant that is built, best first.
+    '''
+    variants = [('gzip', '.gz', compressGzip)]
+    if brotli is not None:
+        variants.insert(0, ('br', '.br', compressBrotli))
+    return variants
+
+
+def compressFile(path, min_size=256):
+    '''
+    Writes the compressed variants of the file at path next to it and returns the suffixes written.
+    Small files, files of other types and variants that would not save MIN_SAVING are skipped,
+    variants that are newer than the file are kept.
+    '''
+    if os.path.splitext(path)[1].lower() not in COMPRESSIBLE_EXTENSIONS or os.path.getsize(path) < min_size:
+        return []
+    with open(path, 'rb') as file:
+        data = file.read()
+    written = []
+    for _, suffix, compress in encodings():
+        target = path + suffix
+        if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+            written.append(suffix)
+            continue
+        compressed = compress(data)
+        if len(compressed) > len(data) * (1 - MIN_SAVING):
+            if os.path.exists(target):
+                os.remove(target)
+            continue
+        with open(target, 'wb') as file:
+            file.write(compressed)
+        written.append(suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    '''
+    ManifestStaticFilesStorage that also writes the compressed variants of the collected files
+    (the original and the hashed names) at the end of collectstatic.
+    '''
+    def post_process(self, paths, dry_run=False, **options):
+        names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if not isinstance(processed, Exception):
+                names.update(n for n in (name, hashed_name) if n)
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for name in sorted(names):
+            if self.exists(name):
+                compressFile(self.path(name))
+
+
+def acceptedEncodings(header):
+    '''
+    Returns the content codings of an Accept-Encoding header that the client accepts (q > 0), lowercase.
+    '''
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+@require_safe
+def serveStatic(request, path):
+    '''
+    Serves the file path of settings.STATIC_ROOT, or its smallest compressed variant the client accepts.
+    Hashed names are cached by browsers and proxies for settings.STATIC_MAX_AGE without revalidation.
+    '''
+    if settings.STATIC_ROOT is None:
+        raise Http404
+    try:
+        fullpath = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+
+    content_type, _ = mimetypes.guess_type(fullpath)
+    accepted = acceptedEncodings(request.headers.get('Accept-Encoding', ''))
+    encoding, served = None, fullpath
+    for name, suffix, _ in encodings():
+        if (name in accepted or '*' in accepted) and os.path.isfile(fullpath + suffix):
+            encoding, served = name, fullpath + suffix
+            break
+
+    last_modified = int(os.path.getmtime(fullpath))
+    response = get_conditional_response(request, last_modified=last_modified)
+    if response is None:
+        response = FileResponse(
+            open(served, 'rb'), content_type=content_type or 'application/octet-stream',
+            filename=os.path.basename(fullpath),
+        )
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+    response.headers['Last-Modified'] = http_date(last_modified)
+    if HASHED_NAME.search(path):
+        patch_cache_control(response, public=True, max_age=settings.STATIC_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.STATIC_UNHASHED_MAX_AGE)
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
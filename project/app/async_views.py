@@ -0,0 +1,176 @@
+'''
+Async variants of the balance, history and currency exchange views.
+
+Under ASGI these views run on the event loop: database reads use the async ORM interface
+and the currency rates are fetched with an async HTTP client, so a request that waits for
+the database or the exchange API does not hold a thread. Only applyOperation, which needs
+a transaction, runs in a thread: the SQLite writer thread if the write queue is enabled
+(see app/sqlite.py), otherwise one of sync_to_async.
+They render the same templates with the same context as the synchronous views.
+'''
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import Http404
+from django.shortcuts import render
+from django.views.generic import View
+from .models import Balance, History, applyOperation
+from .money import MAX_AMOUNT, formatAmount, parseAmount
+from .pagination import InvalidCursor
+from .rates import parseTimestamp, rate_cache, rate_history
+from .sqlite import arunWrite
+from .views import (
+    BalanceOperationsView, CurrencyExchangeView, ViewTransactionHistoryView,
+    getCurrencyChoices, getHistoryPageSize, getHistoryPaginator,
+)
+
+async def agetBalance(user):
+    '''
+    The coroutine version of getBalance: the user's balance in cents read from the Balance row.
+    '''
+    balance = await Balance.objects.filter(pk=user.pk).values_list('amount', flat=True).afirst()
+    return balance or 0
+
+async def agetCurrencyParams():
+    '''
+    The coroutine version of getCurrencyParams.
+    '''
+    snapshot = await agetRateSnapshot()
+    if snapshot is None:
+        return [None, None]
+    data = snapshot[1]
+    return [data, getCurrencyChoices(data)]
+
+async def agetRateSnapshot(at=None):
+    '''
+    The coroutine version of getRateSnapshot, the current rates come from rate_cache.aget().
+    '''
+    if at is not None:
+        return await sync_to_async(rate_history.at)(at)
+    data = await rate_cache.aget()
+    if data is None:
+        return await sync_to_async(rate_history.latest)()
+    return None, data
+
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+    '''
+    LoginRequiredMixin for async views. The user is loaded with request.auser(),
+    because the lazy request.user would query the database synchronously.
+    '''
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = await request.auser()
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        return await super(LoginRequiredMixin, self).dispatch(request, *args, **kwargs)
+
+class AsyncBalanceOperationsView(AsyncLoginRequiredMixin, View):
+    template_name = BalanceOperationsView.template_name
+
+    async def get(self, request):
+        '''
+        Returns the operations page with the balance and username keys, see BalanceOperationsView.get.
+        '''
+        context = {
+            'balance': await agetBalance(request.user),
+            'username': request.user.username,
+        }
+        return render(request, self.template_name, context)
+
+    async def post(self, request):
+        '''
+        Processes a balance transaction like BalanceOperationsView.post.
+        '''
+        type = request.POST.get('operation')
+        try:
+            amount = parseAmount(request.POST.get('amount'))
+        except ValueError:
+            amount = 0
+        if type not in ('deposit', 'withdraw'):
+            messages.error(request, "Unknown operation")
+            balance = await agetBalance(request.user)
+        elif amount <= 0 or amount > MAX_AMOUNT:
+            messages.error(request, "Invalid amount")
+            balance = await agetBalance(request.user)
+        else:
+            # Transactions are not available in async code
+            entry, balance = await arunWrite(applyOperation, request.user, type, amount)
+            if entry.status == 'failure':
+                messages.error(request, "Insufficient balance")
+            elif type == 'withdraw':
+                messages.success(request, f"Amount: {formatAmount(amount)} was withdrawn")
+            else:
+                messages.success(request, f"Amount: {formatAmount(amount)} was deposited")
+
+        context = {
+            'balance': balance,
+            'username': request.user.username
+        }
+        return render(request, self.template_name, context)
+
+class AsyncTransactionHistoryView(AsyncLoginRequiredMixin, View):
+    template_name = ViewTransactionHistoryView.template_name
+
+    async def get(self, request):
+        '''
+        Returns one page of the transaction history, see ViewTransactionHistoryView.
+        '''
+        page_size = getHistoryPageSize(request)
+        paginator = getHistoryPaginator(request.user, History.objects.filter(user=request.user), page_size)
+        try:
+            page = await paginator.apage(request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404('Invalid cursor')
+        context = {
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': page.has_other_pages(),
+            'transactions': page.object_list,
+            'username': request.user.username,
+        }
+        return render(request, self.template_name, context)
+
+class AsyncCurrencyExchangeView(AsyncLoginRequiredMixin, View):
+    template_name = CurrencyExchangeView.template_name
+    empty_context = CurrencyExchangeView.empty_context
+
+    async def get(self, request):
+        '''
+        Returns the currency exchange page, see CurrencyExchangeView.get.
+        '''
+        _, currency_choices = await agetCurrencyParams()
+        context = {
+            **self.empty_context,
+            'currency_choices': currency_choices,
+            'username': request.user.username
+        }
+        return render(request, self.template_name, context)
+
+    async def post(self, request):
+        '''
+        Converts the amount from the form, see CurrencyExchangeView.post.
+        '''
+        amount = request.POST.get('amount')
+        try:
+            amount = float(amount) if amount else None
+        except ValueError:
+            amount = None
+        currency = request.POST.get('currency')
+        at = request.POST.get('at')
+        try:
+            snapshot = await agetRateSnapshot(parseTimestamp(at) if at else None)
+        except ValueError:
+            snapshot = None
+        if snapshot is None or amount is None:
+            return render(request, self.template_name, self.empty_context)
+        rates_at, data = snapshot
+        exchange_rate = data.get(currency)
+        exchanged_amount = round(amount * exchange_rate, 2) if exchange_rate is not None else None
+        context = {
+            'currency_choices': getCurrencyChoices(data),
+            'amount': amount,
+            'currency': currency,
+            'exchanged_amount': exchanged_amount,
+            'rates_at': rates_at,
+            'username': request.user.username
+        }
+        return render(request, self.template_name, context)
@@ -0,0 +1,109 @@
+'''
+Batch currency conversion with a cross-rate matrix.
+
+The exchange API publishes decimal rates against one base currency, e.g. {"USD": 1.15, "GBP": 0.88}.
+The factor from currency A to currency B is rates[B] / rates[A]. CrossRates keeps these factors for
+every pair as exact integer fractions, so a whole batch of amounts in cents is converted with a few
+array operations and every result is the exact value rounded once, half up or half to even.
+'''
+import functools
+import math
+from decimal import Decimal
+import numpy as np
+from .money import MAX_AMOUNT
+
+ROUNDING_MODES = ('half_up', 'half_even')
+
+# Numerators up to this value keep 2 * amount * numerator within int64
+INT64_SAFE = (2 ** 63 - 1) // (2 * MAX_AMOUNT)
+
+
+class CrossRates:
+    '''
+    The conversion factors between every pair of currencies of one rates snapshot.
+
+    rates - a dictionary of rates by currency code against the base currency of the API.
+    Rates that are not positive numbers are ignored.
+
+    currencies - the currency codes, the base currency is None and always comes first.
+    index - the position of every code in currencies, as used by the matrices.
+    numerators, denominators - square matrices with the factor from currencies[i] to currencies[j]
+    as the reduced fraction numerators[i, j] / denominators[i, j]. Every rate is read as the decimal
+    number it was published as, so the fractions are exact.
+
+    The matrices are int64 arrays; only if the rates have so many digits that a conversion
+    of MAX_AMOUNT could overflow they hold Python integers instead, which is slower but still exact.
+    '''
+    def __init__(self, rates):
+        rates = {
+            currency: Decimal(str(rate)) for currency, rate in rates.items()
+            if isinstance(rate, (int, float)) and not isinstance(rate, bool) and rate > 0
+        }
+        self.currencies = [None, *rates]
+        self.index = {currency: position for position, currency in enumerate(self.currencies)}
+        decimals = [Decimal(1), *rates.values()]
+        # A common power of ten turns every rate into an integer
+        exponent = max(-decimal.as_tuple().exponent for decimal in decimals)
+        scaled = [int(decimal.scaleb(exponent)) for decimal in decimals]
+
+        numerators, denominators = [], []
+        for source in scaled:
+            row_numerators, row_denominators = [], []
+            for target in scaled:
+                divisor = math.gcd(source, target)
+                row_numerators.append(target // divisor)
+                row_denominators.append(source // divisor)
+            numerators.append(row_numerators)
+            denominators.append(row_denominators)
+        exact = max(max(row) for row in numerators) <= INT64_SAFE
+        dtype = np.int64 if exact else object
+        self.numerators = np.array(numerators, dtype=dtype)
+        self.denominators = np.array(denominators, dtype=dtype)
+
+    def indices(self, currencies):
+        '''
+        Returns an array with the position of every currency code, None is the base currency.
+        Raises KeyError for an unknown code.
+        '''
+        return np.fromiter((self.index[currency] for currency in currencies), dtype=np.intp, count=len(currencies))
+
+    def convert(self, amounts, sources, targets, rounding='half_up'):
+        '''
+        Converts amounts in cents from the currencies at the positions sources to those at targets
+        and returns the converted amounts in cents as an array.
+
+        amounts - a sequence of non-negative integers, at most MAX_AMOUNT each.
+        sources, targets - arrays of positions, see indices().
+        rounding - half_up rounds a remainder of exactly half a cent up, half_even to the even cent.
+        '''
+        if rounding not in ROUNDING_MODES:
+            raise ValueError(f'Unknown rounding: {rounding!r}')
+        numerators = self.numerators[sources, targets]
+        denominators = self.denominators[sources, targets]
+        amounts = np.asarray(amounts, dtype=numerators.dtype)
+        products = amounts * numerators
+        # Not np.divmod, which has no loop for Python integers
+        quotients, remainders = products // denominators, products % denominators
+        twice = 2 * remainders
+        up = twice > denominators
+        tie = twice == denominators
+        if rounding == 'half_up':
+            up |= tie
+        else:
+            up |= tie & (quotients % 2 == 1)
+        return quotients + up
+
+
+@functools.lru_cache(maxsize=8)
+def _crossRates(items):
+    return CrossRates(dict(items))
+
+
+def getCrossRates(rates):
+    '''
+    A function that returns the CrossRates of a rates dictionary. The matrices are built once
+    per snapshot: the last few are cached by their content.
+    '''
+    return _crossRates(tuple(sorted(
+        (currency, rate) for currency, rate in rates.items() if isinstance(rate, (int, float))
+    )))
@@ -0,0 +1,90 @@
+import json
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+
+class CompactJSONEncoder(json.JSONEncoder):
+    '''
+    A JSON encoder without the spaces after the separators, for JSONFields whose values are stored often.
+    '''
+    item_separator = ','
+    key_separator = ':'
+
+
+class EnumDescriptor(DeferredAttribute):
+    '''
+    Stores an enum member or an integer value assigned to the attribute as the member name,
+    so instances always expose the same strings as rows loaded from the database.
+    '''
+    def __set__(self, instance, value):
+        if value is not None and not isinstance(value, str):
+            try:
+                value = self.field.member(value).name.lower()
+            except ValueError:
+                pass
+        instance.__dict__[self.field.attname] = value
+
+
+class EnumField(models.Field):
+    '''
+    A field that stores a member of an IntegerChoices enum as a small positive integer
+    but reads and writes the member name in lower case, e.g. 'deposit' for Type.DEPOSIT.
+
+    Code, lookups, forms and templates keep working with the strings ('deposit', 'success'),
+    while every row and every index entry holds a small integer instead of the whole word.
+    Enum members and their integer values are accepted as input as well.
+
+    enum is the IntegerChoices class or a list of (name, value, label) tuples. Migrations get the list,
+    so they keep their meaning when the enum class is changed or renamed later.
+    '''
+    description = 'Small integer enum exposed as a string'
+    descriptor_class = EnumDescriptor
+
+    def __init__(self, enum, *args, **kwargs):
+        if not isinstance(enum, type):
+            enum = models.IntegerChoices('Enum', [(name.upper(), (value, label)) for name, value, label in enum])
+        self.enum = enum
+        self.names = {member.name.lower(): member for member in enum}
+        kwargs['choices'] = [(name, member.label) for name, member in self.names.items()]
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        del kwargs['choices']
+        kwargs['enum'] = [(name, member.value, member.label) for name, member in self.names.items()]
+        return name, path, args, kwargs
+
+    def get_internal_type(self):
+        return 'PositiveSmallIntegerField'
+
+    def member(self, value):
+        '''
+        Returns the enum member for a name, a member or an integer value.
+        Raises ValueError for anything else.
+        '''
+        if isinstance(value, str):
+            try:
+                return self.names[value]
+            except KeyError:
+                raise ValueError(f"Field '{self.name}' expected one of {list(self.names)} but got {value!r}") from None
+        return self.enum(value)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return self.enum(value).name.lower()
+
+    def to_python(self, value):
+        if value is None:
+            return None
+        try:
+            return self.member(value).name.lower()
+        except ValueError as e:
+            raise ValidationError(str(e), code='invalid') from e
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None:
+            return None
+        return int(self.member(value))
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from app.models import buildCheckpoints, verifyCheckpoints
+from app.money import formatAmount
+
+class Command(BaseCommand):
+    '''
+    Writes balance checkpoints, so calculating a balance only sums the transactions after the latest one.
+    Meant to be run periodically: every run only reads the transactions added since the previous checkpoints.
+    With --verify nothing is written; the latest checkpoints and the materialized balances are compared
+    with balances recalculated from the whole history and every mismatch is reported.
+
+    Example:
+    python manage.py balance_checkpoints
+    python manage.py balance_checkpoints --every 1 --user Tom
+    python manage.py balance_checkpoints --verify
+    '''
+    help = 'Writes incremental balance checkpoints or verifies them against the full transaction history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='usernames', help='Only process this user (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of users processed per transaction')
+        parser.add_argument(
+            '--every', type=int, default=None,
+            help='Minimum number of new transactions for a new checkpoint (default: BALANCE_CHECKPOINT_EVERY)',
+        )
+        parser.add_argument('--verify', action='store_true', help='Recalculate from scratch and report mismatches instead')
+
+    def handle(self, *args, usernames=None, batch_size=1000, every=None, verify=False, **options):
+        user_ids = None
+        if usernames:
+            user_ids = list(User.objects.filter(username__in=usernames).values_list('pk', flat=True))
+
+        if not verify:
+            every = every or settings.BALANCE_CHECKPOINT_EVERY
+            written = buildCheckpoints(user_ids, batch_size=batch_size, every=every)
+            self.stdout.write(self.style.SUCCESS(f'Wrote {written} checkpoint(s)'))
+            return
+
+        mismatches = 0
+        for user_id, what, expected, actual in verifyCheckpoints(user_ids, batch_size=batch_size):
+            mismatches += 1
+            self.stdout.write(
+                f'user {user_id}: {what} is {formatAmount(actual)}, recalculated {formatAmount(expected)}'
+            )
+        if mismatches:
+            raise CommandError(f'{mismatches} mismatch(es) found')
+        self.stdout.write(self.style.SUCCESS('All checkpoints and balances match the history'))
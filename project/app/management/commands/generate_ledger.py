@@ -0,0 +1,126 @@
+import itertools
+import math
+import random
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from app.models import Balance, History, buildCheckpoints
+from app.money import MAX_AMOUNT
+
+class Command(BaseCommand):
+    '''
+    Generates synthetic users and transaction history for load tests and benchmarks.
+
+    Creates --users users named <prefix><n> (password: --password) and --transactions History rows
+    spread evenly over the last --days days, oldest first, so ids grow with the datetime as in real data.
+    Every user's first transaction is a deposit; after that each transaction is a withdrawal with
+    probability --withdraw-ratio. Amounts follow a log-normal distribution around --median-amount.
+    The users get transactions uniformly or, with --distribution zipf, with a few very active users
+    and a long tail (the n-th most active user is picked with a weight of 1 / n ** --zipf-exponent).
+    Withdrawals larger than the running balance are recorded as failures, as applyOperation would.
+
+    Rows are written with bulk_create in batches of --batch-size, and the Balance rows of the new users are
+    written from the running balances, so the result is consistent without History.save().
+    With --checkpoints balance checkpoints are written as well. The same --seed generates the same ledger.
+
+    Example:
+    python manage.py generate_ledger --users 1000 --transactions 1000000
+    python manage.py generate_ledger --users 50 --transactions 20000 --distribution zipf --seed 7 --checkpoints
+    '''
+    help = 'Generates synthetic users and transaction history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='Number of users to create')
+        parser.add_argument('--transactions', type=int, default=100000, help='Number of History rows to create')
+        parser.add_argument('--distribution', choices=['uniform', 'zipf'], default='uniform', help='Transactions per user')
+        parser.add_argument('--zipf-exponent', type=float, default=1.1)
+        parser.add_argument('--withdraw-ratio', type=float, default=0.4, help='Share of withdrawals after the first deposit')
+        parser.add_argument('--median-amount', type=float, default=50, help='Median amount of a transaction')
+        parser.add_argument('--days', type=float, default=365, help='The transactions cover this many days up to now')
+        parser.add_argument('--prefix', default='user', help='Prefix of the usernames')
+        parser.add_argument('--password', default='password', help='Password of the created users')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Number of rows inserted per query batch')
+        parser.add_argument('--seed', type=int, default=None, help='Seed of the random generator')
+        parser.add_argument('--checkpoints', action='store_true', help='Also write balance checkpoints')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['transactions'] < 0:
+            raise CommandError('--users must be positive and --transactions not negative')
+        generator = random.Random(options['seed'])
+        user_ids = self.create_users(options)
+        balances = self.create_history(generator, user_ids, options)
+        Balance.objects.bulk_create(
+            (Balance(user_id=user_id, amount=balances[user_id]) for user_id in user_ids),
+            batch_size=options['batch_size'],
+        )
+        if options['checkpoints']:
+            buildCheckpoints(user_ids, every=settings.BALANCE_CHECKPOINT_EVERY)
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(user_ids)} user(s) and {options["transactions"]} transaction(s)'
+        ))
+
+    def create_users(self, options):
+        '''
+        Creates the users, numbered after the existing users with the same prefix, and returns their ids.
+        '''
+        prefix = options['prefix']
+        numbers = [
+            int(username[len(prefix):])
+            for username in User.objects.filter(username__startswith=prefix).values_list('username', flat=True)
+            if username[len(prefix):].isdigit()
+        ]
+        start = max(numbers, default=0) + 1
+        usernames = [f'{prefix}{number}' for number in range(start, start + options['users'])]
+        # Hashing is slow on purpose, all users share one hash
+        password = make_password(options['password'])
+        User.objects.bulk_create(
+            (User(username=username, password=password) for username in usernames),
+            batch_size=options['batch_size'],
+        )
+        return list(User.objects.filter(username__in=usernames).order_by('pk').values_list('pk', flat=True))
+
+    def create_history(self, generator, user_ids, options):
+        '''
+        Inserts the transactions and returns the final balance of every user in cents.
+        '''
+        total = options['transactions']
+        if options['distribution'] == 'zipf':
+            weights = [1 / rank ** options['zipf_exponent'] for rank in range(1, len(user_ids) + 1)]
+            generator.shuffle(user_ids)
+            cum_weights = list(itertools.accumulate(weights))
+        else:
+            cum_weights = None
+        mu = math.log(options['median_amount'] * 100)
+        start = timezone.now() - timedelta(days=options['days'])
+        step = timedelta(days=options['days']) / max(total, 1)
+        balances = dict.fromkeys(user_ids, 0)
+        batch_size = options['batch_size']
+
+        for offset in range(0, total, batch_size):
+            count = min(batch_size, total - offset)
+            users = generator.choices(user_ids, cum_weights=cum_weights, k=count)
+            entries = []
+            for index, user_id in enumerate(users, offset):
+                amount = min(MAX_AMOUNT, max(1, round(generator.lognormvariate(mu, 1))))
+                balance = balances[user_id]
+                if balance and generator.random() < options['withdraw_ratio']:
+                    type = 'withdraw'
+                    status = 'success' if amount <= balance else 'failure'
+                    if status == 'success':
+                        balances[user_id] = balance - amount
+                else:
+                    type, status = 'deposit', 'success'
+                    balances[user_id] = balance + amount
+                entries.append(History(
+                    user_id=user_id, amount=amount, type=type, status=status,
+                    datetime=start + step * index,
+                ))
+            with transaction.atomic():
+                History.objects.bulk_create(entries, batch_size=batch_size)
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{offset + count} / {total}')
+        return balances
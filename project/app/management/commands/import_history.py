@@ -0,0 +1,239 @@
+import csv
+import hashlib
+import json
+import os
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from app.models import History, HistoryImport, buildCheckpoints, rebuildBalances
+from app.money import MAX_AMOUNT, parseAmount
+from app.rates import parseTimestamp
+
+# The number of bytes before the committed offset a resumed import compares with the file
+FINGERPRINT_SIZE = 4096
+
+
+class Lines:
+    '''
+    An iterator over the decoded lines of a binary file that knows the offset of the end of the last line it returned.
+    '''
+    def __init__(self, file):
+        self.file = file
+        self.offset = file.tell()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.file.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode('utf-8')
+
+
+class Command(BaseCommand):
+    '''
+    Imports past transactions into History from CSV or NDJSON files of any size.
+
+    Supported files, the format is taken from the extension unless --format is given:
+    csv - a header row and one transaction per row, e.g.
+          user,datetime,type,status,amount
+          Tom,2021-03-01T09:30:00,deposit,success,1250.00
+    ndjson (.ndjson, .jsonl) - one {"user": "Tom", "datetime": "2021-03-01T09:30:00", "type": "deposit", "amount": "1250.00"} object per line.
+
+    datetime is an ISO 8601 date or date and time, naive values are in settings.TIME_ZONE. type is deposit or withdraw,
+    status is success (the default) or failure and amount has at most two decimal places. Other columns are ignored,
+    so the files of the history export can be imported with --user, which assigns every row to one user.
+    The users must exist. Invalid rows stop the import, with --skip-invalid they are reported and skipped.
+
+    The file is read one line at a time and the rows are written with bulk_create, --batch-size rows per query
+    and --chunk-size rows per transaction, so memory use does not depend on the size of the file.
+    Every transaction also stores the byte offset of the file up to which the rows are committed (HistoryImport),
+    so an interrupted import continues after the last committed row when the command is run again.
+    A resumed import checks that the bytes before that offset did not change; the rest of the file may,
+    e.g. to fix the row an import stopped at. A finished file is not imported again unless --restart is given.
+
+    At the end the Balance rows of every user with imported rows are rebuilt from History and balance checkpoints
+    are written for them. Until then the materialized balances of these users do not include the imported rows.
+
+    Example:
+    python manage.py import_history transactions-2019-2023.csv
+    python manage.py import_history tom.ndjson --user Tom --chunk-size 50000
+    '''
+    help = 'Imports past transactions from CSV or NDJSON files, resumable'
+    formats = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='Transaction files to import')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Format of the files, by default taken from the extension')
+        parser.add_argument('--user', help='Username every row belongs to, instead of the user column')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of rows inserted per query')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Number of rows committed per transaction')
+        parser.add_argument('--skip-invalid', action='store_true', help='Report and skip invalid rows instead of stopping')
+        parser.add_argument('--restart', action='store_true', help='Import the files from the start even if they were imported before; '
+                            'rows that were already imported are imported again')
+
+    def handle(self, *args, files=(), format=None, user=None, batch_size=1000, chunk_size=10000,
+               skip_invalid=False, restart=False, **options):
+        if batch_size < 1 or chunk_size < 1:
+            raise CommandError('--batch-size and --chunk-size must be positive')
+        self.verbosity = options['verbosity']
+        self.users = {}
+        if user is not None:
+            self.users[user] = User.objects.filter(username=user).values_list('pk', flat=True).first()
+            if self.users[user] is None:
+                raise CommandError(f'Unknown user {user!r}')
+        for path in files:
+            file_format = format or self.formats.get(os.path.splitext(path)[1].lower())
+            if file_format is None:
+                raise CommandError(f'{path}: unknown format, use --format')
+            try:
+                with open(path, 'rb') as file, open(path, 'rb') as check:
+                    self.import_file(path, file, check, file_format, user, batch_size, chunk_size, skip_invalid, restart)
+            except OSError as e:
+                raise CommandError(f'{path}: {e}')
+
+    def import_file(self, path, file, check, file_format, user, batch_size, chunk_size, skip_invalid, restart):
+        state, created = HistoryImport.objects.get_or_create(
+            source=os.path.abspath(path),
+            defaults={'fingerprint': fingerprint(check, 0), 'after_id': lastHistoryId()},
+        )
+        if restart and not created:
+            state.offset = state.rows = state.skipped = 0
+            state.fingerprint, state.after_id, state.finished = fingerprint(check, 0), lastHistoryId(), None
+            state.save()
+        if state.finished:
+            self.stdout.write(f'{path}: imported on {state.finished:%Y-%m-%d %H:%M}, use --restart to import it again')
+            return
+        if state.fingerprint != fingerprint(check, state.offset):
+            raise CommandError(f'{path}: the file changed before byte {state.offset} where the import stopped, use --restart')
+        if state.offset:
+            self.stdout.write(f'{path}: resuming at byte {state.offset} after {state.rows} row(s)')
+
+        records = getattr(self, f'read_{file_format}')(file, state.offset)
+        chunk = []
+        end = state.offset
+        for start, end, record in records:
+            chunk.append((start, record))
+            if len(chunk) >= chunk_size:
+                self.write_chunk(path, state, check, chunk, end, user, batch_size, skip_invalid)
+                chunk = []
+        self.write_chunk(path, state, check, chunk, end, user, batch_size, skip_invalid)
+
+        user_ids = set(History.objects.filter(id__gt=state.after_id).values_list('user', flat=True).distinct().iterator())
+        with transaction.atomic():
+            rebuildBalances(user_ids)
+            buildCheckpoints(user_ids, every=settings.BALANCE_CHECKPOINT_EVERY)
+            state.finished = timezone.now()
+            state.save(update_fields=['finished'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{path}: imported {state.rows} row(s), skipped {state.skipped}, rebuilt {len(user_ids)} balance(s)'
+        ))
+
+    def write_chunk(self, path, state, check, chunk, end, user, batch_size, skip_invalid):
+        '''
+        Validates the records of a chunk and inserts them in one transaction together with the new offset end.
+        '''
+        usernames = (record.get('user') for _, record in chunk if user is None and record)
+        missing = {username for username in usernames if isinstance(username, str)} - self.users.keys()
+        if missing:
+            self.users.update(dict.fromkeys(missing))
+            self.users.update(User.objects.filter(username__in=missing).values_list('username', 'pk'))
+
+        entries = []
+        skipped = 0
+        for start, record in chunk:
+            try:
+                entries.append(self.parse_record(record, user))
+            except ValueError as e:
+                if not skip_invalid:
+                    raise CommandError(f'{path} at byte {start}: {e}; {state.rows} row(s) before it are imported, '
+                                       f'fix the row and run the command again to resume')
+                self.stderr.write(f'{path} at byte {start}: {e}, skipped')
+                skipped += 1
+
+        with transaction.atomic():
+            History.objects.bulk_create(entries, batch_size=batch_size)
+            state.offset = end
+            state.rows += len(entries)
+            state.skipped += skipped
+            state.fingerprint = fingerprint(check, end)
+            state.save(update_fields=['offset', 'rows', 'skipped', 'fingerprint'])
+        if chunk and self.verbosity > 1:
+            self.stdout.write(f'{path}: {state.rows} row(s) at byte {end}')
+
+    def parse_record(self, record, user):
+        '''
+        Returns an unsaved History entry for a record. Raises ValueError if the record is invalid.
+        '''
+        if record is None:
+            raise ValueError('not a JSON object')
+        username = user if user is not None else record.get('user')
+        user_id = self.users.get(username) if isinstance(username, str) else None
+        if user_id is None:
+            raise ValueError(f'unknown user {username!r}')
+        type = str(record.get('type') or '').strip().lower()
+        if type not in History._meta.get_field('type').names:
+            raise ValueError(f'invalid type {record.get("type")!r}')
+        status = str(record.get('status') or 'success').strip().lower()
+        if status not in History._meta.get_field('status').names:
+            raise ValueError(f'invalid status {record.get("status")!r}')
+        amount = parseAmount(record.get('amount'))
+        if amount > MAX_AMOUNT:
+            raise ValueError(f'amount {record.get("amount")!r} is too large')
+        when = parseTimestamp(str(record.get('datetime') or ''))
+        return History(user_id=user_id, type=type, status=status, amount=amount, datetime=when)
+
+    def read_csv(self, file, offset):
+        '''
+        Yields (start, end, record) for every non-empty row of a CSV file after the byte offset,
+        where start and end are the offsets of the row and record is a dictionary by column name.
+        '''
+        header = next(csv.reader(Lines(file)), None)
+        if not header:
+            return
+        header[0] = header[0].lstrip('\ufeff')
+        header = [name.strip().lower() for name in header]
+        if offset:
+            file.seek(offset)
+        lines = Lines(file)
+        reader = csv.reader(lines)
+        start = lines.offset
+        for row in reader:
+            if row:
+                yield start, lines.offset, dict(zip(header, row))
+            start = lines.offset
+
+    def read_ndjson(self, file, offset):
+        '''
+        Yields (start, end, record) for every non-empty line of an NDJSON file after the byte offset.
+        Lines that are not JSON objects are yielded as None, which is invalid.
+        '''
+        file.seek(offset)
+        lines = Lines(file)
+        start = lines.offset
+        for line in lines:
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                yield start, lines.offset, record if isinstance(record, dict) else None
+            start = lines.offset
+
+
+def fingerprint(file, offset):
+    '''
+    Returns the SHA-256 hash of the FINGERPRINT_SIZE bytes of the file before offset.
+    '''
+    start = max(0, offset - FINGERPRINT_SIZE)
+    file.seek(start)
+    return hashlib.sha256(file.read(offset - start)).hexdigest()
+
+
+def lastHistoryId():
+    return History.objects.aggregate(last=Max('id'))['last'] or 0
@@ -0,0 +1,113 @@
+import csv
+import json
+import os
+from django.core.management.base import BaseCommand, CommandError
+from app.models import RateSnapshot
+from app.rates import parseTimestamp
+
+class Command(BaseCommand):
+    '''
+    Bulk-loads historical currency rates into the rate history (RateSnapshot).
+
+    Supported files, the format is taken from the extension unless --format is given:
+    csv - a header row with the timestamp column first and one column per currency, e.g.
+          date,USD,GBP
+          2024-03-01,1.0842,0.8557
+          Empty and N/A cells are skipped.
+    ndjson (.ndjson, .jsonl) - one {"fetched_at": "2024-03-01T16:00:00Z", "rates": {"USD": 1.0842}} object per line.
+    json - an array of such objects.
+
+    Timestamps are ISO 8601 dates or dates and times, naive values are in settings.TIME_ZONE.
+    Snapshots with a timestamp that is already stored are skipped, so a file can be loaded again safely.
+    Running processes pick the new snapshots up within settings.CURRENCY_RATES_TTL seconds.
+
+    Example:
+    python manage.py load_rates eurofxref-hist.csv
+    python manage.py load_rates rates-2023.ndjson rates-2024.ndjson --batch-size 5000
+    '''
+    help = 'Loads historical currency rates from CSV, JSON or NDJSON files'
+    formats = {'.csv': 'csv', '.json': 'json', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='Rate files to load')
+        parser.add_argument('--format', choices=['csv', 'json', 'ndjson'], help='Format of the files, by default taken from the extension')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of snapshots inserted per query')
+
+    def handle(self, *args, files=(), format=None, batch_size=1000, **options):
+        before = RateSnapshot.objects.count()
+        read = 0
+        for path in files:
+            file_format = format or self.formats.get(os.path.splitext(path)[1].lower())
+            if file_format is None:
+                raise CommandError(f'{path}: unknown format, use --format')
+            try:
+                with open(path, newline='', encoding='utf-8') as file:
+                    batch = []
+                    for line, fetched_at, rates in getattr(self, f'read_{file_format}')(file):
+                        try:
+                            snapshot = RateSnapshot(fetched_at=parseTimestamp(fetched_at), rates=rates)
+                        except ValueError as e:
+                            raise CommandError(f'{path}:{line}: {e}')
+                        batch.append(snapshot)
+                        read += 1
+                        if len(batch) >= batch_size:
+                            RateSnapshot.objects.bulk_create(batch, ignore_conflicts=True)
+                            batch = []
+                    RateSnapshot.objects.bulk_create(batch, ignore_conflicts=True)
+            except OSError as e:
+                raise CommandError(f'{path}: {e}')
+        loaded = RateSnapshot.objects.count() - before
+        self.stdout.write(self.style.SUCCESS(f'Loaded {loaded} snapshot(s), {read - loaded} already stored'))
+
+    def read_csv(self, file):
+        '''
+        Yields (line number, timestamp, rates) for every row of a CSV file with at least one rate.
+        '''
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if not header:
+            return
+        currencies = [currency.strip() for currency in header[1:]]
+        for row in reader:
+            if not row:
+                continue
+            rates = {}
+            for currency, value in zip(currencies, row[1:]):
+                value = value.strip()
+                if currency and value and value.upper() != 'N/A':
+                    try:
+                        rates[currency] = float(value)
+                    except ValueError:
+                        raise CommandError(f'{file.name}:{reader.line_num}: invalid rate {value!r} for {currency}')
+            if rates:
+                yield reader.line_num, row[0], rates
+
+    def read_ndjson(self, file):
+        '''
+        Yields (line number, timestamp, rates) for every non-empty line of an NDJSON file.
+        '''
+        for number, line in enumerate(file, 1):
+            if line.strip():
+                yield self.parse_object(file, number, line)
+
+    def read_json(self, file):
+        '''
+        Yields (index, timestamp, rates) for every object of a JSON array.
+        '''
+        try:
+            data = json.load(file)
+        except ValueError as e:
+            raise CommandError(f'{file.name}: {e}')
+        if not isinstance(data, list):
+            raise CommandError(f'{file.name}: expected an array of snapshots')
+        for index, item in enumerate(data):
+            yield self.parse_object(file, index, item)
+
+    def parse_object(self, file, position, item):
+        try:
+            if isinstance(item, str):
+                item = json.loads(item)
+            rates = {currency: float(rate) for currency, rate in item['rates'].items()}
+            return position, item['fetched_at'], rates
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            raise CommandError(f'{file.name}:{position}: invalid snapshot ({e!r})')
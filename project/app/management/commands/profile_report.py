@@ -0,0 +1,72 @@
+import pstats
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from app.profiling import parseProfileFileName
+
+class Command(BaseCommand):
+    '''
+    Aggregates the request profiles written by ProfilingMiddleware into a report of the
+    hottest functions: the calls, own time and cumulative time of every function summed
+    over all selected profiles, the top --top by --sort.
+
+    Example:
+    python manage.py profile_report
+    python manage.py profile_report --view history --top 30 --sort tottime
+    python manage.py profile_report /tmp/profiles/20240301T120000.123456-history-q7-183ms-4242.prof
+    '''
+    help = 'Reports the hottest functions of the collected request profiles'
+    sort_keys = {'cumulative': 3, 'tottime': 2, 'calls': 1}
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='Profile files or directories (default: PROFILE_DIR)')
+        parser.add_argument('--view', action='append', dest='views', help='Only profiles of this URL name (repeatable)')
+        parser.add_argument('--top', type=int, default=20, help='Number of functions in the report')
+        parser.add_argument('--sort', choices=list(self.sort_keys), default='cumulative', help='Order of the functions')
+
+    def handle(self, *args, paths=(), views=None, top=20, sort='cumulative', **options):
+        files = []
+        for path in map(Path, paths or [settings.PROFILE_DIR]):
+            files.extend(sorted(path.glob('*.prof')) if path.is_dir() else [path])
+        profiles = []
+        for file in files:
+            tags = parseProfileFileName(file.name) or ('unknown', None)
+            if views and tags[0] not in views:
+                continue
+            profiles.append((file, *tags))
+        if not profiles:
+            raise CommandError('No profiles found')
+
+        try:
+            stats = pstats.Stats(*(str(file) for file, _, _ in profiles))
+        except (OSError, TypeError, ValueError, EOFError) as e:
+            raise CommandError(f'Cannot read the profiles: {e}')
+
+        per_view = {}
+        for _, view, queries in profiles:
+            per_view.setdefault(view, []).append(queries)
+        self.stdout.write(f'{len(profiles)} profile(s), {stats.total_tt:.3f}s in total')
+        for view, queries in sorted(per_view.items()):
+            known = [count for count in queries if count is not None]
+            summary = ''
+            if known:
+                low, high = min(known), max(known)
+                summary = f', {low} queries' if low == high else f', {low}-{high} queries'
+            self.stdout.write(f'  {view}: {len(queries)} request(s){summary}')
+
+        self.stdout.write('')
+        self.stdout.write(f'{"ncalls":>10}{"tottime":>10}{"cumtime":>10}{"per req":>10}  function')
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][self.sort_keys[sort]], reverse=True)
+        for (filename, line, function), (_, ncalls, tottime, cumtime, _) in rows[:top]:
+            where = function if filename == '~' else f'{self.shorten(filename)}:{line}({function})'
+            self.stdout.write(f'{ncalls:>10}{tottime:>10.4f}{cumtime:>10.4f}{cumtime / len(profiles):>10.4f}  {where}')
+
+    def shorten(self, filename):
+        '''
+        Returns the path of a source file relative to the project or to site-packages.
+        '''
+        project = str(settings.BASE_DIR) + '/'
+        if filename.startswith(project):
+            return filename[len(project):]
+        marker = 'site-packages/'
+        return filename.split(marker, 1)[1] if marker in filename else filename
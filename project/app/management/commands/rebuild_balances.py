@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from app.models import rebuildBalances
+
+class Command(BaseCommand):
+    '''
+    Rebuilds the materialized Balance table from History.
+    Used to backfill balances for existing data and to repair them if they ever drift.
+
+    Example:
+    python manage.py rebuild_balances
+    python manage.py rebuild_balances --user Tom --user Anna
+    '''
+    help = 'Rebuilds the materialized per-user balances from the transaction history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='usernames', help='Only rebuild the balance of this user (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of balance rows written per query')
+
+    def handle(self, *args, usernames=None, batch_size=1000, **options):
+        user_ids = None
+        if usernames:
+            user_ids = list(User.objects.filter(username__in=usernames).values_list('pk', flat=True))
+        written = rebuildBalances(user_ids, batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} balance(s)'))
@@ -0,0 +1,338 @@
+'''
+Request metrics in the Prometheus text format.
+
+MetricsMiddleware measures every request and records, per URL name (e.g. "operations"), the latency,
+the number of database queries, the response size and the time spent in the database,
+in requests to upstream APIs and in rendering templates. metrics_view serves them at /metrics/.
+
+The measurements of the current request are collected in a RequestMetrics object held in a context variable:
+- database queries through an execute wrapper installed on every connection when it is created,
+  so queries made in other threads for an async view are counted as well;
+- upstream requests through upstreamTimer() in UpstreamClient and AsyncUpstreamClient;
+- template rendering through the InstrumentedTemplates template backend.
+Outside a request (management commands, background rate refreshes) only a context variable lookup is added.
+
+A request that runs the same SQL statement settings.METRICS_N_PLUS_ONE_THRESHOLD times or more logs
+a warning, the typical sign of a query made in a loop (N+1 queries).
+
+The metrics are kept in memory: every server process has its own and they are reset when it restarts.
+'''
+import bisect
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+from collections import Counter
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    '''
+    The base class of the metrics: a name, a help text and the names of the labels.
+    Every combination of label values is a separate series.
+    '''
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def render(self):
+        '''
+        Returns the lines of the metric in the Prometheus text format.
+        '''
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        with self._lock:
+            series = sorted(self.series.items())
+            for values, value in series:
+                lines.extend(self.render_series(values, value))
+        return lines
+
+
+class CounterMetric(Metric):
+    '''
+    A value that only grows, e.g. a number of requests or a total time in seconds.
+    '''
+    type = 'counter'
+
+    def inc(self, values=(), amount=1):
+        with self._lock:
+            self.series[values] = self.series.get(values, 0) + amount
+
+    def render_series(self, values, value):
+        return [f'{self.name}{_labels(self.labels, values)} {value}']
+
+
+class HistogramMetric(Metric):
+    '''
+    The distribution of observed values over fixed buckets, with their sum and count.
+    '''
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, values, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(values)
+            if series is None:
+                # Counts per bucket, the last one is +Inf, then the sum
+                series = self.series[values] = [0] * (len(self.buckets) + 1) + [0]
+            series[index] += 1
+            series[-1] += value
+
+    def render_series(self, values, series):
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, '+Inf'), series):
+            cumulative += count
+            le = f'le="{bound}"'
+            lines.append(f'{self.name}_bucket{_labels(self.labels, values, le)} {cumulative}')
+        lines.append(f'{self.name}_sum{_labels(self.labels, values)} {series[-1]}')
+        lines.append(f'{self.name}_count{_labels(self.labels, values)} {cumulative}')
+        return lines
+
+
+class Registry:
+    '''
+    The metrics of the process.
+    '''
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def clear(self):
+        '''
+        Drops every series, the metrics stay registered.
+        '''
+        for metric in self.metrics:
+            with metric._lock:
+                metric.series.clear()
+
+    def render(self):
+        '''
+        Returns all metrics in the Prometheus text format.
+        '''
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+request_duration = registry.add(HistogramMetric(
+    'app_request_duration_seconds', 'Time to produce the response, by URL name.', ['view'],
+))
+requests_total = registry.add(CounterMetric(
+    'app_requests_total', 'Requests by URL name and status code.', ['view', 'status'],
+))
+request_queries = registry.add(HistogramMetric(
+    'app_request_queries', 'Database queries per request, by URL name.', ['view'], buckets=QUERY_BUCKETS,
+))
+response_size = registry.add(HistogramMetric(
+    'app_response_size_bytes', 'Size of non-streaming response bodies, by URL name.', ['view'], buckets=SIZE_BUCKETS,
+))
+db_seconds = registry.add(CounterMetric(
+    'app_db_query_seconds_total', 'Time spent executing database queries, by URL name.', ['view'],
+))
+upstream_seconds = registry.add(CounterMetric(
+    'app_upstream_seconds_total', 'Time spent in requests to upstream APIs, by URL name.', ['view'],
+))
+upstream_duration = registry.add(HistogramMetric(
+    'app_upstream_request_duration_seconds', 'Duration of single requests to upstream APIs, also outside requests.',
+))
+template_seconds = registry.add(CounterMetric(
+    'app_template_render_seconds_total', 'Time spent rendering templates, by URL name.', ['view'],
+))
+n_plus_one = registry.add(CounterMetric(
+    'app_n_plus_one_total', 'Requests that ran the same query METRICS_N_PLUS_ONE_THRESHOLD times or more.', ['view'],
+))
+view_cache_lookups = registry.add(CounterMetric(
+    'app_view_cache_lookups_total', 'Lookups in the per-user view cache, by entry name and result (hit or miss).',
+    ['name', 'result'],
+))
+
+
+class RequestMetrics:
+    '''
+    The measurements of one request, see the module docstring.
+    statements counts the executions of every SQL statement, without its parameters.
+    '''
+    __slots__ = ('queries', 'db_time', 'upstream_time', 'template_time', 'statements')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.upstream_time = 0.0
+        self.template_time = 0.0
+        self.statements = Counter()
+
+
+current = contextvars.ContextVar('request_metrics', default=None)
+
+
+def recordQuery(execute, sql, params, many, context):
+    '''
+    A database execute wrapper that adds the query to the metrics of the current request.
+    '''
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - start
+        metrics.queries += 1
+        metrics.statements[sql] += 1
+
+
+def installQueryWrapper(sender, connection, **kwargs):
+    '''
+    A connection_created receiver that installs recordQuery on every new database connection.
+    '''
+    if recordQuery not in connection.execute_wrappers:
+        connection.execute_wrappers.append(recordQuery)
+
+
+@contextlib.contextmanager
+def upstreamTimer():
+    '''
+    A context manager that records the duration of its block as one request to an upstream API.
+    '''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        upstream_duration.observe((), elapsed)
+        metrics = current.get()
+        if metrics is not None:
+            metrics.upstream_time += elapsed
+
+
+class InstrumentedTemplate:
+    '''
+    Wraps a template of the Django template backend and adds its render time to the current request.
+    '''
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        metrics = current.get()
+        if metrics is None:
+            return self.template.render(context, request)
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - start
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    '''
+    The Django template backend with the render time of every template recorded by the metrics.
+    Templates included by other templates are part of the time of the outer template.
+    '''
+    def from_string(self, template_code):
+        return InstrumentedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name))
+
+
+class MetricsMiddleware:
+    '''
+    Records the metrics of every request, see the module docstring.
+    Should be the first middleware, so the latency includes all others.
+    Works for synchronous and async views without switching between threads and the event loop.
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        self.finish(request, response, metrics, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        self.finish(request, response, metrics, time.perf_counter() - start)
+        return response
+
+    def finish(self, request, response, metrics, elapsed):
+        '''
+        Adds the measurements of a finished request to the metrics and warns about repeated queries.
+        '''
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or 'unmatched'
+        labels = (view,)
+        request_duration.observe(labels, elapsed)
+        requests_total.inc((view, str(response.status_code)))
+        request_queries.observe(labels, metrics.queries)
+        if not response.streaming:
+            response_size.observe(labels, len(response.content))
+        if metrics.db_time:
+            db_seconds.inc(labels, metrics.db_time)
+        if metrics.upstream_time:
+            upstream_seconds.inc(labels, metrics.upstream_time)
+        if metrics.template_time:
+            template_seconds.inc(labels, metrics.template_time)
+        if metrics.statements:
+            sql, count = metrics.statements.most_common(1)[0]
+            if count >= settings.METRICS_N_PLUS_ONE_THRESHOLD:
+                n_plus_one.inc(labels)
+                logger.warning(
+                    'Possible N+1 queries in %s %s (%s): %d executions of %s',
+                    request.method, request.path, view, count, sql[:300],
+                )
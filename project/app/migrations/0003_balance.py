@@ -0,0 +1,41 @@
+# Generated by Django 5.0.3 on 2026-10-18 13:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Case, F, Sum, When
+
+
+def backfill_balances(apps, schema_editor):
+    History = apps.get_model('app', 'History')
+    Balance = apps.get_model('app', 'Balance')
+    signed_amount = Case(
+        When(status='success', type='deposit', then=F('amount')),
+        When(status='success', type='withdraw', then=-F('amount')),
+        default=0,
+        output_field=models.DecimalField(max_digits=12, decimal_places=2),
+    )
+    rows = History.objects.values('user').annotate(balance=Sum(signed_amount)).order_by()
+    Balance.objects.bulk_create(
+        Balance(user_id=row['user'], amount=row['balance'] or 0) for row in rows
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_alter_history_datetime_alter_history_type'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Balance',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
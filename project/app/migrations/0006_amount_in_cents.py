@@ -0,0 +1,68 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:05
+
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Cast, Round
+
+
+def amounts_to_cents(apps, schema_editor):
+    for name in ('History', 'Balance'):
+        model = apps.get_model('app', name)
+        model.objects.update(amount_cents=Cast(Round(F('amount') * 100), models.BigIntegerField()))
+
+
+def amounts_to_decimal(apps, schema_editor):
+    for name in ('History', 'Balance'):
+        model = apps.get_model('app', name)
+        model.objects.update(amount=F('amount_cents') / Value(100.0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_history_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='history',
+            name='history_user_type_status_idx',
+        ),
+        migrations.AddField(
+            model_name='history',
+            name='amount_cents',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='balance',
+            name='amount_cents',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(amounts_to_cents, amounts_to_decimal),
+        migrations.RemoveField(
+            model_name='history',
+            name='amount',
+        ),
+        migrations.RemoveField(
+            model_name='balance',
+            name='amount',
+        ),
+        migrations.RenameField(
+            model_name='history',
+            old_name='amount_cents',
+            new_name='amount',
+        ),
+        migrations.RenameField(
+            model_name='balance',
+            old_name='amount_cents',
+            new_name='amount',
+        ),
+        migrations.AddIndex(
+            model_name='history',
+            index=models.Index(fields=['user', 'type', 'status', 'amount'], name='history_user_type_status_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='history',
+            constraint=models.CheckConstraint(check=models.Q(('amount__gte', 0), ('amount__lte', 9999999999)), name='history_amount_range'),
+        ),
+    ]
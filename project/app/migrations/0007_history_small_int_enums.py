@@ -0,0 +1,98 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:05
+
+import app.fields
+from django.db import migrations, models
+from django.db.models import Case, F, Value, When
+
+# The codes of History.Type and History.Status when this migration was written
+ENUMS = {
+    'type': {'deposit': 1, 'withdraw': 2},
+    'status': {'success': 1, 'failure': 2},
+}
+
+
+def names_to_codes(apps, schema_editor):
+    History = apps.get_model('app', 'History')
+    History.objects.update(**{
+        f'{field}_code': Case(*[When(**{field: name}, then=Value(code)) for name, code in codes.items()])
+        for field, codes in ENUMS.items()
+    })
+
+
+def codes_to_names(apps, schema_editor):
+    History = apps.get_model('app', 'History')
+    History.objects.update(**{
+        field: Case(*[When(**{f'{field}_code': code}, then=Value(name)) for name, code in codes.items()])
+        for field, codes in ENUMS.items()
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_amount_in_cents'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='history',
+            name='history_user_type_status_idx',
+        ),
+        migrations.AddField(
+            model_name='history',
+            name='type_code',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='history',
+            name='status_code',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.RunPython(names_to_codes, codes_to_names),
+        # A default only in the migration state, so unapplying the RemoveField
+        # operations below can re-add the string columns to a populated table
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='history',
+                name='type',
+                field=models.CharField(choices=[('deposit', 'Deposit'), ('withdraw', 'Withdraw')], default='', max_length=10),
+            ),
+            migrations.AlterField(
+                model_name='history',
+                name='status',
+                field=models.CharField(choices=[('success', 'Success'), ('failure', 'Failure')], default='', max_length=10),
+            ),
+        ]),
+        migrations.RemoveField(
+            model_name='history',
+            name='type',
+        ),
+        migrations.RemoveField(
+            model_name='history',
+            name='status',
+        ),
+        migrations.RenameField(
+            model_name='history',
+            old_name='type_code',
+            new_name='type',
+        ),
+        migrations.RenameField(
+            model_name='history',
+            old_name='status_code',
+            new_name='status',
+        ),
+        migrations.AlterField(
+            model_name='history',
+            name='type',
+            field=app.fields.EnumField(enum=[('deposit', 1, 'Deposit'), ('withdraw', 2, 'Withdraw')]),
+        ),
+        migrations.AlterField(
+            model_name='history',
+            name='status',
+            field=app.fields.EnumField(enum=[('success', 1, 'Success'), ('failure', 2, 'Failure')]),
+        ),
+        migrations.AddIndex(
+            model_name='history',
+            index=models.Index(fields=['user', 'type', 'status', 'amount'], name='history_user_type_status_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:30
+
+import app.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_balance_checkpoints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fetched_at', models.DateTimeField(unique=True)),
+                ('rates', models.JSONField(encoder=app.fields.CompactJSONEncoder)),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.3 on 2026-10-18 14:47
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_rate_snapshots'),
+    ]
+
+    # auto_now and a Python default do not change the column, but SQLite would rebuild the table
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='history',
+                    name='datetime',
+                    field=models.DateTimeField(default=django.utils.timezone.now),
+                ),
+            ],
+        ),
+    ]
@@ -1,21 +1,29 @@
-from django.db import models
+import random
+import time
+from django.db import OperationalError, models, transaction
+from django.db.models import Case, Count, F, Max, OuterRef, Subquery, Sum, When
 from django.contrib.auth.models import User
+from django.utils import timezone
+from .fields import CompactJSONEncoder, EnumField
+from .money import MAX_AMOUNT, formatAmount
+from .viewcache import invalidateAll, invalidateUsers
 
 class History(models.Model):
     '''
     History model with the following set of fields
 
-    status - a string with a maximum length of 10. The value are success or failure.
+    status - a small integer enum (History.Status) read and written as a string. The value are success or failure.
     The aliases are Success and Failure respectively.
 
-    amount - a fractional number. The maximum number of digits is 10, 2 decimal places. Default value is 0.00
+    amount - an integer number of cents (minor units), e.g. 1250 for 12.50. At most 10 digits. Default value is 0
     
-    type - a string with maximum length 10. The value must be deposit or debit.
-    The aliases are Deposit and Debit respectively.
+    type - a small integer enum (History.Type) read and written as a string. The value must be deposit or withdraw.
+    The aliases are Deposit and Withdraw respectively.
     
     user - the foreign key associated with User. The relationship type is one to many. 
     
-    datetime - the point in time when the record was created.
+    datetime - the point in time of the transaction, the time the record was created unless set explicitly
+    (e.g. by the generate_ledger and import_history management commands).
 
     A string mapping of the entity in the format:
     'User Name - Transaction Type - Transaction Amount - Status'
@@ -23,19 +31,462 @@ class History(models.Model):
     Example:
     'Tom - withdrawal - 100 - success'.
     '''
-    STATUS_CHOICES = [
-          ('success', 'Success'),
-          ('failure', 'Failure')
-    ]
-    TYPE_CHOICES = [
-          ('deposit', 'Deposit'),
-          ('withdraw', 'Withdraw')
-    ]
-    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
-    amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
-    type = models.CharField(max_length=10, choices=TYPE_CHOICES)
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    datetime = models.DateTimeField(auto_now=True)
+    class Status(models.IntegerChoices):
+        SUCCESS = 1, 'Success'
+        FAILURE = 2, 'Failure'
+
+    class Type(models.IntegerChoices):
+        DEPOSIT = 1, 'Deposit'
+        WITHDRAW = 2, 'Withdraw'
+
+    status = EnumField(Status)
+    amount = models.BigIntegerField(default=0)
+    type = EnumField(Type)
+    # Both composite indexes start with user, so the foreign key does not need an index of its own
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    datetime = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the history page, the export and the running balance
+            models.Index(fields=['user', 'datetime', 'id'], name='history_user_datetime_idx'),
+            # Balance aggregates over the rows after a checkpoint, type, status and amount make the index covering
+            models.Index(fields=['user', 'id', 'type', 'status', 'amount'], name='history_user_id_amount_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(check=models.Q(amount__gte=0, amount__lte=MAX_AMOUNT), name='history_amount_range'),
+        ]
+
+    def __str__(self):
+        return f'{self.user.username} - {self.type} - {formatAmount(self.amount)} - {self.status}'
+
+    def signed_amount(self):
+        '''
+        Returns the amount by which this entry changes the user's balance:
+        positive for a successful deposit, negative for a successful withdrawal and 0 otherwise.
+        '''
+        if self.status != 'success':
+            return 0
+        amount = int(self.amount)
+        if self.type == 'deposit':
+            return amount
+        if self.type == 'withdraw':
+            return -amount
+        return 0
+
+    def save(self, *args, **kwargs):
+        '''
+        Saves the entry. A newly inserted successful entry also updates the user's Balance row
+        in the same transaction, so the materialized balance never diverges from the history.
+        An edit of an existing entry (e.g. in the admin) applies the difference between the stored
+        and the new signed amount, to both users if the user changed; see changeBalances.
+        '''
+        if not self._state.adding:
+            with transaction.atomic():
+                before = _storedSignedAmount(self.pk)
+                super().save(*args, **kwargs)
+                # Read back, since update_fields may have kept some of the stored values
+                after = _storedSignedAmount(self.pk)
+                changes = {}
+                for (user_id, amount), sign in ((before, -1), (after, 1)):
+                    if user_id is not None:
+                        changes[user_id] = changes.get(user_id, 0) + sign * amount
+                changeBalances(changes, self.pk)
+            return
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            delta = self.signed_amount()
+            if delta:
+                Balance.add(self.user_id, delta)
+
+
+def _storedSignedAmount(pk):
+    '''
+    Returns the (user_id, signed amount) of the stored History row pk, locking it, or (None, 0) if there is none.
+    '''
+    row = History.objects.select_for_update().filter(pk=pk).values_list('user_id', signedAmount()).first()
+    return row or (None, 0)
+
+
+def signedAmount():
+    '''
+    An expression equal to History.signed_amount() for use inside queries:
+    amount for successful deposits, -amount for successful withdrawals and 0 for anything else.
+    '''
+    return Case(
+        When(status='success', type='deposit', then=F('amount')),
+        When(status='success', type='withdraw', then=-F('amount')),
+        default=0,
+        output_field=models.BigIntegerField(),
+    )
+
+
+def sumHistory(queryset):
+    '''
+    Returns the sum of signedAmount() over the History queryset in cents.
+    '''
+    return queryset.aggregate(balance=Sum(signedAmount()))['balance'] or 0
+
+
+def calculateBalance(user):
+    '''
+    Calculates the user's balance from History: the balance of the latest BalanceCheckpoint
+    plus the rows added after it, so the cost depends on the number of transactions since
+    the last checkpoint instead of the age of the account.
+    Without a checkpoint the whole history is summed.
+    This is the source of truth the Balance table is rebuilt from.
+    '''
+    checkpoint = BalanceCheckpoint.objects.filter(user=user).order_by('-upto_id').values_list('upto_id', 'balance').first()
+    upto_id, balance = checkpoint or (0, 0)
+    return balance + sumHistory(History.objects.filter(user=user, id__gt=upto_id))
+
+
+class Balance(models.Model):
+    '''
+    Materialized balance with one row per user.
+
+    user - the user the balance belongs to, also the primary key.
+    amount - the sum of the user's successful deposits minus successful withdrawals in cents.
+    updated - the point in time when the row was last changed.
+
+    The row is kept up to date by History.save() and historyDeleted() and can be rebuilt from History
+    with the rebuild_balances management command. QuerySet.update() and bulk_create() on History
+    bypass both and need a rebuild.
+    '''
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    amount = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.user.username} - {formatAmount(self.amount)}'
+
+    @classmethod
+    def add(cls, user_id, delta):
+        '''
+        Atomically adds delta to the user's balance. The row is created on the first change;
+        its initial value is calculated from History, which already contains the new entry.
+        '''
+        updated = cls.objects.filter(pk=user_id).update(amount=F('amount') + delta)
+        if not updated:
+            cls.objects.create(user_id=user_id, amount=calculateBalance(user_id))
+
+
+class BalanceCheckpoint(models.Model):
+    '''
+    The balance of a user over all History rows with an id up to upto_id.
+
+    user - the user the checkpoint belongs to.
+    upto_id - the id of the last History row of the user included in the balance.
+    balance - the sum of the user's successful deposits minus successful withdrawals up to upto_id in cents.
+    created - the point in time when the checkpoint was written.
+
+    History ids only grow, so rows added after a checkpoint, including rows with an earlier datetime,
+    always have a larger id. calculateBalance() adds the rows after the latest checkpoint to its balance.
+    Checkpoints are written by the balance_checkpoints management command;
+    older checkpoints are kept, there is at most one per BALANCE_CHECKPOINT_EVERY transactions.
+    '''
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    upto_id = models.BigIntegerField()
+    balance = models.BigIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # Also the index calculateBalance() finds the latest checkpoint with
+            models.UniqueConstraint(fields=['user', 'upto_id'], name='balance_checkpoint_user_upto_unique'),
+        ]
 
     def __str__(self):
-        return f'{self.user.username} - {self.type} - {self.amount} - {self.status}'
\ No newline at end of file
+        return f'{self.user.username} - {self.upto_id} - {formatAmount(self.balance)}'
+
+
+def changeBalances(changes, history_id, create=True):
+    '''
+    Applies {user_id: delta} to the Balance rows after the History row history_id was edited or deleted.
+    The users' checkpoints that include the row no longer match the history and are dropped first,
+    buildCheckpoints creates them again. With create=False a missing Balance row is not created,
+    since a cascading delete of the user may already have removed it; Balance.add() calculates it
+    on the next change.
+    '''
+    changes = {user_id: delta for user_id, delta in changes.items() if delta}
+    if not changes:
+        return
+    BalanceCheckpoint.objects.filter(user_id__in=changes, upto_id__gte=history_id).delete()
+    for user_id, delta in changes.items():
+        if create:
+            Balance.add(user_id, delta)
+        else:
+            Balance.objects.filter(pk=user_id).update(amount=F('amount') + delta)
+
+
+def historyDeleted(sender, instance, **kwargs):
+    '''
+    post_delete receiver for History: removes the deleted entry's signed amount from the user's balance.
+    Connected in AppConfig.ready(), so queryset and cascading deletes are covered as well.
+    '''
+    changeBalances({instance.user_id: -instance.signed_amount()}, instance.pk, create=False)
+
+
+class RateSnapshot(models.Model):
+    '''
+    One set of currency rates as returned by the exchange API.
+
+    fetched_at - the point in time the rates were obtained. Unique and indexed,
+    so loading the same rates file twice adds nothing.
+    rates - a dictionary of rates by currency code, e.g. {"USD": 1.15}, stored as compact JSON.
+
+    A snapshot is current from its fetched_at until the next one, see RateHistory.at().
+    Snapshots are written by fetchCurrencyRates, only when the rates changed, and by the load_rates management command.
+    '''
+    fetched_at = models.DateTimeField(unique=True)
+    rates = models.JSONField(encoder=CompactJSONEncoder)
+
+    def __str__(self):
+        return f'{self.fetched_at.isoformat()} - {len(self.rates)} rates'
+
+
+class HistoryImport(models.Model):
+    '''
+    The progress of a transaction file imported by the import_history management command.
+
+    source - the name of the import, by default the absolute path of the file.
+    fingerprint - a hash of the beginning of the file, a resumed import checks it is still the same file.
+    offset - the number of bytes of the file whose rows are committed; an interrupted import continues there.
+    rows - the number of History rows written.
+    skipped - the number of invalid rows that were skipped.
+    after_id - the largest History id before the import started. The imported rows have larger ids,
+    so the users whose balances must be rebuilt are found among the rows after it.
+    started - the point in time the import started.
+    finished - the point in time the import finished and the balances were rebuilt, empty while it is in progress.
+
+    The offset and the counts are updated in the transaction that inserts the rows,
+    so they always describe exactly the committed rows.
+    '''
+    source = models.CharField(max_length=1024, unique=True)
+    fingerprint = models.CharField(max_length=64)
+    offset = models.BigIntegerField(default=0)
+    rows = models.BigIntegerField(default=0)
+    skipped = models.BigIntegerField(default=0)
+    after_id = models.BigIntegerField(default=0)
+    started = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        state = 'finished' if self.finished else f'at byte {self.offset}'
+        return f'{self.source} - {self.rows} rows - {state}'
+
+
+def _userBatches(user_ids, batch_size):
+    '''
+    Yields lists of at most batch_size user ids: the given ones, or every user in primary key order.
+    '''
+    if user_ids is not None:
+        user_ids = sorted(user_ids)
+        for start in range(0, len(user_ids), batch_size):
+            yield user_ids[start:start + batch_size]
+        return
+    last = 0
+    while True:
+        batch = list(User.objects.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last = batch[-1]
+
+
+def _latestCheckpoints(user_ids):
+    '''
+    Returns a dictionary that maps the user ids to their latest BalanceCheckpoint.
+    '''
+    latest = BalanceCheckpoint.objects.filter(user=OuterRef('user')).order_by('-upto_id').values('upto_id')[:1]
+    checkpoints = BalanceCheckpoint.objects.filter(user_id__in=user_ids, upto_id=Subquery(latest))
+    return {checkpoint.user_id: checkpoint for checkpoint in checkpoints}
+
+
+def buildCheckpoints(user_ids=None, batch_size=1000, every=1):
+    '''
+    Writes a new BalanceCheckpoint for every user with at least every History rows after
+    the latest checkpoint and returns the number of checkpoints written.
+    If user_ids is given, only those users are processed, otherwise every user is, batch_size users at a time.
+
+    Only the rows after the previous checkpoint are read, so running it periodically is cheap.
+    Each batch is one transaction that first locks the users' Balance rows, so operations
+    that are still in flight for those users are either fully included or added after the checkpoint.
+    '''
+    written = 0
+    for batch in _userBatches(user_ids, batch_size):
+        with transaction.atomic():
+            list(Balance.objects.select_for_update().filter(pk__in=batch).values_list('pk'))
+            checkpoints = _latestCheckpoints(batch)
+            new = []
+            for user_id in batch:
+                previous = checkpoints.get(user_id)
+                upto_id, balance = (previous.upto_id, previous.balance) if previous else (0, 0)
+                rows = History.objects.filter(user_id=user_id, id__gt=upto_id).aggregate(
+                    delta=Sum(signedAmount()), last_id=Max('id'), count=Count('id')
+                )
+                if rows['count'] and rows['count'] >= every:
+                    new.append(BalanceCheckpoint(user_id=user_id, upto_id=rows['last_id'], balance=balance + rows['delta']))
+            BalanceCheckpoint.objects.bulk_create(new)
+            written += len(new)
+    return written
+
+
+def verifyCheckpoints(user_ids=None, batch_size=1000):
+    '''
+    Recalculates balances from scratch, without using any checkpoint, and yields a tuple
+    (user_id, what, expected, actual) for every mismatch, where what is 'checkpoint' for the latest
+    BalanceCheckpoint of the user and 'balance' for the materialized Balance row.
+    '''
+    for batch in _userBatches(user_ids, batch_size):
+        checkpoints = _latestCheckpoints(batch)
+        balances = dict(Balance.objects.filter(pk__in=batch).values_list('pk', 'amount'))
+        for user_id in batch:
+            history = History.objects.filter(user_id=user_id)
+            checkpoint = checkpoints.get(user_id)
+            if checkpoint is not None:
+                expected = sumHistory(history.filter(id__lte=checkpoint.upto_id))
+                if expected != checkpoint.balance:
+                    yield user_id, 'checkpoint', expected, checkpoint.balance
+            expected = sumHistory(history)
+            if expected != balances.get(user_id, 0):
+                yield user_id, 'balance', expected, balances.get(user_id, 0)
+
+
+def rebuildBalances(user_ids=None, batch_size=1000):
+    '''
+    Rebuilds Balance rows from History with a single grouped aggregate and returns the number of rows written.
+    If user_ids is given, only those users are rebuilt, otherwise every user is.
+    Users that no longer have any history get a zero balance.
+    The cached views of the rebuilt users are invalidated.
+    '''
+    history = History.objects.all()
+    balances = Balance.objects.all()
+    if user_ids is not None:
+        history = history.filter(user_id__in=user_ids)
+        balances = balances.filter(pk__in=user_ids)
+    rows = history.values_list('user').annotate(balance=Sum(signedAmount())).order_by().iterator(chunk_size=batch_size)
+
+    with transaction.atomic():
+        balances.update(amount=0)
+        written = 0
+        batch = []
+        for user_id, balance in rows:
+            batch.append(Balance(user_id=user_id, amount=balance or 0))
+            if len(batch) >= batch_size:
+                written += _upsertBalances(batch)
+                batch = []
+        written += _upsertBalances(batch)
+        if user_ids is None:
+            invalidateAll()
+        else:
+            invalidateUsers(user_ids)
+    return written
+
+
+def _upsertBalances(batch):
+    Balance.objects.bulk_create(
+        batch, update_conflicts=True, unique_fields=['user'], update_fields=['amount', 'updated']
+    )
+    return len(batch)
+
+
+def applyOperation(user, type, amount, retries=3):
+    '''
+    Performs a deposit or a withdrawal of amount cents for the user and returns the created History entry
+    together with the balance after the operation in cents.
+
+    The balance check and the History insert happen in one transaction while the user's
+    Balance row is locked, so two concurrent withdrawals cannot both pass the check.
+    The lock is taken by the first statement of the transaction: a no-op UPDATE of the row
+    locks just that row on PostgreSQL and MySQL, so other users are not blocked, and takes
+    the write lock up front on SQLite, where select_for_update() is a no-op and a read
+    followed by a write would otherwise fail with "database is locked".
+    Lock errors that still happen are retried up to retries times with a jittered backoff.
+
+    A withdrawal larger than the balance is recorded with the failure status.
+    '''
+    amount = int(amount)
+    if type not in ('deposit', 'withdraw'):
+        raise ValueError(f'Unknown operation type: {type}')
+
+    for attempt in range(retries + 1):
+        try:
+            with transaction.atomic():
+                # Lock the row before reading it
+                Balance.objects.filter(pk=user.pk).update(amount=F('amount'))
+                balance, _ = Balance.objects.select_for_update().get_or_create(
+                    pk=user.pk, defaults={'amount': lambda: calculateBalance(user)}
+                )
+                if type == 'withdraw' and balance.amount < amount:
+                    status = 'failure'
+                else:
+                    status = 'success'
+                entry = History.objects.create(status=status, amount=amount, type=type, user=user)
+                return entry, balance.amount + entry.signed_amount()
+        except OperationalError:
+            if attempt == retries:
+                raise
+            time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+
+
+def applyOperations(operations, retries=3):
+    '''
+    Performs a batch of deposits and withdrawals in one transaction and returns the created
+    History entries in the same order together with a dictionary of the balances after the batch
+    in cents, keyed by user id. Every entry also gets the balance_after attribute:
+    the user's balance right after that operation.
+
+    operations - a list of (user_id, type, amount) tuples with the amount in cents, for one or many users.
+
+    The operations are checked in order against a running balance per user, exactly as
+    applyOperation would check them one after another: a withdrawal larger than the running
+    balance is recorded with the failure status and does not change it.
+    The users' Balance rows are locked first, as in applyOperation. All entries are inserted with a
+    single bulk_create and every changed Balance row is written once, so a batch costs a handful
+    of queries however many operations it contains. bulk_create sends no post_save signals,
+    so the cached views of the users are invalidated here.
+    Lock errors, including deadlocks between batches that lock the same users, are retried up to retries times.
+    '''
+    for type in {type for _, type, _ in operations}:
+        if type not in ('deposit', 'withdraw'):
+            raise ValueError(f'Unknown operation type: {type}')
+    user_ids = sorted({user_id for user_id, _, _ in operations})
+
+    for attempt in range(retries + 1):
+        try:
+            with transaction.atomic():
+                # Lock the rows before reading them
+                Balance.objects.filter(pk__in=user_ids).update(amount=F('amount'))
+                locked = Balance.objects.select_for_update().filter(pk__in=user_ids).order_by('pk')
+                balances = {balance.pk: balance for balance in locked}
+                for user_id in user_ids:
+                    if user_id not in balances:
+                        balances[user_id], _ = Balance.objects.select_for_update().get_or_create(
+                            pk=user_id, defaults={'amount': lambda: calculateBalance(user_id)}
+                        )
+                running = {user_id: balance.amount for user_id, balance in balances.items()}
+
+                entries = []
+                for user_id, type, amount in operations:
+                    amount = int(amount)
+                    status = 'failure' if type == 'withdraw' and running[user_id] < amount else 'success'
+                    entry = History(status=status, amount=amount, type=type, user_id=user_id)
+                    running[user_id] += entry.signed_amount()
+                    entry.balance_after = running[user_id]
+                    entries.append(entry)
+                History.objects.bulk_create(entries)
+
+                changed = []
+                now = timezone.now()
+                for user_id, balance in balances.items():
+                    if balance.amount != running[user_id]:
+                        balance.amount, balance.updated = running[user_id], now
+                        changed.append(balance)
+                Balance.objects.bulk_update(changed, ['amount', 'updated'])
+                invalidateUsers(user_ids)
+                return entries, running
+        except OperationalError:
+            if attempt == retries:
+                raise
+            time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
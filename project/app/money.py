@@ -0,0 +1,28 @@
+import re
+
+AMOUNT_RE = re.compile(r'^\s*(\d+)(?:[.,](\d{0,2}))?\s*$')
+
+# The largest amount of a single transaction in cents: 10 digits, as in the former DecimalField(max_digits=10, decimal_places=2)
+MAX_AMOUNT = 9999999999
+
+
+def parseAmount(value):
+    '''
+    A function that converts an amount entered by the user, e.g. '12.5' or '100', into integer cents (1250, 10000).
+    Only digits with at most two decimal places are accepted, the conversion never goes through float.
+    Raises ValueError for anything else.
+    '''
+    match = AMOUNT_RE.match(str(value))
+    if match is None:
+        raise ValueError(f'Invalid amount: {value!r}')
+    units, fraction = match.groups()
+    return int(units) * 100 + int((fraction or '').ljust(2, '0'))
+
+
+def formatAmount(cents):
+    '''
+    A function that formats integer cents for presentation with two decimal places, e.g. 1250 -> '12.50'.
+    '''
+    sign = '-' if cents < 0 else ''
+    units, fraction = divmod(abs(int(cents)), 100)
+    return f'{sign}{units}.{fraction:02d}'
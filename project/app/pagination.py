@@ -0,0 +1,143 @@
+from datetime import datetime
+from django.core import signing
+from django.db.models import F, Q, RowRange, Sum, Value, Window
+
+class InvalidCursor(Exception):
+    '''
+    Raised when a cursor cannot be decoded or was tampered with.
+    '''
+
+
+class KeysetPage:
+    '''
+    One page produced by KeysetPaginator.
+
+    object_list - the rows of the page, newest first.
+    next_cursor - an opaque cursor of the page with older rows, or None on the last page.
+    previous_cursor - an opaque cursor of the page with newer rows, or None on the first page.
+    '''
+    def __init__(self, object_list, next_cursor, previous_cursor, page_size):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.page_size = page_size
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+
+class KeysetPaginator:
+    '''
+    Cursor based pagination of a History queryset ordered by (datetime, id), newest first.
+
+    A page is found by comparing (datetime, id) with the row at the edge of the neighbouring page,
+    so with an index on (user, datetime, id) every page costs the same as the first one:
+    there is no OFFSET and no COUNT query.
+
+    If running_sum and total are given, every row is also annotated with balance_after:
+    the sum of running_sum over this row and all rows before it in (datetime, id) order.
+    total is an expression for the sum over all rows. On the first page
+    balance_after = total - (window sum of running_sum over the rows from the newest one down to this row) + running_sum,
+    and the cursor carries the running sum at the edge of the page, so the other pages
+    use the same window over their own rows only. Either way the page is fetched with a single query.
+
+    Cursors are signed, so a client can pass them back but cannot forge them.
+    '''
+    salt = 'app.pagination.KeysetPaginator'
+
+    def __init__(self, queryset, page_size, running_sum=None, total=None):
+        self.queryset = queryset
+        self.page_size = page_size
+        self.running_sum = running_sum
+        self.total = total
+
+    def page(self, cursor=None):
+        '''
+        Returns the KeysetPage for the cursor, or the first page if the cursor is empty.
+        Raises InvalidCursor for a cursor that was not produced by this class.
+        '''
+        queryset, direction = self.query(cursor)
+        return self.make_page(list(queryset), direction)
+
+    async def apage(self, cursor=None):
+        '''
+        The coroutine version of page(), the rows are fetched with the async ORM interface.
+        '''
+        queryset, direction = self.query(cursor)
+        return self.make_page([row async for row in queryset], direction)
+
+    def query(self, cursor):
+        '''
+        Returns the queryset of page_size + 1 rows for the cursor and the direction of the cursor
+        (None for the first page). The extra row tells whether there is one more page.
+        '''
+        if not cursor:
+            queryset = self.with_balance(self.queryset, self.total, descending=True)
+            return queryset.order_by('-datetime', '-id')[:self.page_size + 1], None
+        direction, key_datetime, key_id, carry = self.decode(cursor)
+        if direction == 'next':
+            older = Q(datetime__lte=key_datetime) & (Q(datetime__lt=key_datetime) | Q(id__lt=key_id))
+            queryset = self.with_balance(self.queryset.filter(older), carry, descending=True)
+            return queryset.order_by('-datetime', '-id')[:self.page_size + 1], direction
+        newer = Q(datetime__gte=key_datetime) & (Q(datetime__gt=key_datetime) | Q(id__gt=key_id))
+        queryset = self.with_balance(self.queryset.filter(newer), carry, descending=False)
+        return queryset.order_by('datetime', 'id')[:self.page_size + 1], direction
+
+    def make_page(self, rows, direction):
+        more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if direction is None:
+            has_next, has_previous = more, False
+        elif direction == 'next':
+            has_next, has_previous = more, True
+        else:
+            # The rows of a previous page were fetched oldest first
+            has_next, has_previous = True, more
+            rows = rows[::-1]
+        next_cursor = self.encode('next', rows[-1]) if has_next and rows else None
+        previous_cursor = self.encode('previous', rows[0]) if has_previous and rows else None
+        return KeysetPage(rows, next_cursor, previous_cursor, self.page_size)
+
+    def with_balance(self, queryset, start, descending):
+        '''
+        Annotates the queryset with balance_after, given the running sum just above the rows
+        (descending, newest first) or just below them (ascending).
+        '''
+        if self.running_sum is None:
+            return queryset
+        if not hasattr(start, 'resolve_expression'):
+            start = Value(start, output_field=self.running_sum.output_field)
+        order_by = [F('datetime').desc(), F('id').desc()] if descending else [F('datetime').asc(), F('id').asc()]
+        window = Window(Sum(self.running_sum), order_by=order_by, frame=RowRange(start=None, end=0))
+        if descending:
+            return queryset.annotate(balance_after=start - window + self.running_sum)
+        return queryset.annotate(balance_after=start + window)
+
+    def encode(self, direction, row):
+        carry = None
+        if self.running_sum is not None:
+            # The next page continues below the last row, the previous page above the first one
+            carry = row.balance_after - row.signed_amount() if direction == 'next' else row.balance_after
+        return signing.dumps([direction, row.datetime.isoformat(), row.id, carry], salt=self.salt)
+
+    def decode(self, cursor):
+        try:
+            direction, key_datetime, key_id, carry = signing.loads(cursor, salt=self.salt)
+            return direction, datetime.fromisoformat(key_datetime), int(key_id), int(carry) if carry is not None else None
+        except (signing.BadSignature, TypeError, ValueError) as e:
+            raise InvalidCursor(str(e)) from e
@@ -0,0 +1,129 @@
+'''
+On-demand profiling of single requests.
+
+ProfilingMiddleware runs the view of a request under cProfile when the request is sampled
+(a settings.PROFILE_SAMPLE_RATE fraction of all requests) or when it carries the X-Profile header
+with the value of settings.PROFILE_TOKEN. The profile is written to settings.PROFILE_DIR
+as a pstats file named after the time, the URL name, the number of database queries and the latency:
+
+    20240301T120000.123456-history-q7-183ms-4242.prof
+
+The query count comes from the metrics of the request (see app/metrics.py), so MetricsMiddleware
+must come before this middleware. Requests profiled through the header get the file name in the
+X-Profile-File response header. The profile_report management command aggregates the files
+into a report of the hottest functions.
+
+cProfile only sees the thread it was enabled in, so only requests handled synchronously are profiled;
+under ASGI the middleware passes requests through unchanged.
+'''
+import cProfile
+import hmac
+import logging
+import os
+import random
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from .metrics import current
+
+logger = logging.getLogger(__name__)
+
+
+def profileFileName(view, queries, elapsed):
+    '''
+    Returns the name of a profile file for a request to the URL name view
+    that ran queries database queries in elapsed seconds.
+    '''
+    stamp = datetime.now().strftime('%Y%m%dT%H%M%S.%f')
+    view = re.sub(r'[^\w.-]+', '_', view)
+    queries = 'q?' if queries is None else f'q{queries}'
+    return f'{stamp}-{view}-{queries}-{round(elapsed * 1000)}ms-{os.getpid()}.prof'
+
+
+def parseProfileFileName(name):
+    '''
+    Returns the URL name and the query count (None if unknown) a profile file is tagged with,
+    or None if name is not the name of a profile file.
+    '''
+    match = re.fullmatch(r'[\dT.]+-(.+)-q(\d+|\?)-\d+ms-\d+\.prof', name)
+    if match is None:
+        return None
+    view, queries = match.groups()
+    return view, None if queries == '?' else int(queries)
+
+
+class ProfilingMiddleware:
+    '''
+    Profiles sampled and explicitly requested requests, see the module docstring.
+    Should be the last middleware, so the profile contains the view and little else.
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.get_response(request)
+        requested = self.requested(request)
+        if not requested and not self.sampled():
+            return self.get_response(request)
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Since Python 3.12 only one profiler can be active at a time, so under a threaded server
+            # a request that is sampled while another one is being profiled is served unprofiled
+            logger.debug('Request not profiled, another profiler is active')
+            return self.get_response(request)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.disable()
+        elapsed = time.perf_counter() - start
+
+        name = self.save(request, profile, elapsed)
+        if requested and name:
+            response.headers['X-Profile-File'] = name
+        return response
+
+    def requested(self, request):
+        '''
+        Returns True if the request carries the X-Profile header with the value of settings.PROFILE_TOKEN.
+        '''
+        token = settings.PROFILE_TOKEN
+        header = request.headers.get('X-Profile')
+        return bool(token and header) and hmac.compare_digest(header.encode(), token.encode())
+
+    def sampled(self):
+        rate = settings.PROFILE_SAMPLE_RATE
+        return rate > 0 and random.random() < rate
+
+    def save(self, request, profile, elapsed):
+        '''
+        Writes the profile to settings.PROFILE_DIR and returns the file name, or None
+        if settings.PROFILE_MAX_FILES profiles are already there or the file cannot be written.
+        '''
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or 'unmatched'
+        metrics = current.get()
+        name = profileFileName(view, metrics.queries if metrics else None, elapsed)
+        directory = Path(settings.PROFILE_DIR)
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            if sum(1 for _ in directory.glob('*.prof')) >= settings.PROFILE_MAX_FILES:
+                logger.warning('Profile of %s not written, %s already holds %d profiles', request.path, directory, settings.PROFILE_MAX_FILES)
+                return None
+            profile.dump_stats(directory / name)
+        except OSError as e:
+            logger.warning('Profile of %s not written: %s', request.path, e)
+            return None
+        return name
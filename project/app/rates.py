@@ -0,0 +1,331 @@
+import asyncio
+import bisect
+import datetime
+import logging
+import threading
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import RateSnapshot
+from .upstream import UpstreamError, async_currency_client, currency_client
+
+logger = logging.getLogger(__name__)
+
+
+class RateCache:
+    '''
+    A cache for the currency rates snapshot with a TTL and stale-while-revalidate.
+
+    fetch - a function without arguments that returns a fresh snapshot (a dictionary) or None on failure.
+    afetch - an optional coroutine function doing the same for aget(), by default fetch runs in a thread.
+    ttl - number of seconds a snapshot is served without contacting the upstream.
+    stale_ttl - number of seconds after the ttl during which the old snapshot is still served
+    while a single background refresh fetches a new one.
+
+    When the snapshot is missing or older than ttl + stale_ttl, the caller fetches it synchronously.
+    Concurrent callers in that situation wait for one shared fetch instead of starting their own (single-flight).
+    If a fetch fails, the last good snapshot is served, no matter how old it is.
+
+    aget() is the same for asyncio code: it awaits afetch and never blocks the event loop,
+    concurrent coroutines share one fetch and background refreshes run as tasks.
+
+    The counters hits, misses, stale_hits, refreshes and errors are available through stats().
+    '''
+    def __init__(self, fetch, afetch=None, ttl=60, stale_ttl=300, clock=time.monotonic):
+        self.fetch = fetch
+        self.afetch = afetch
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        '''
+        Drops the snapshot and resets the counters.
+        '''
+        with self._lock:
+            self._snapshot = None
+            self._fetched_at = None
+            self._inflight = None
+            self._ainflight = None
+            self._refreshing = False
+            self.hits = 0
+            self.misses = 0
+            self.stale_hits = 0
+            self.refreshes = 0
+            self.errors = 0
+
+    def get(self):
+        '''
+        Returns the current snapshot, fetching or refreshing it when needed.
+        Returns None only if no snapshot has ever been fetched successfully.
+        '''
+        with self._lock:
+            age = self.age()
+            if age is not None and age < self.ttl:
+                self.hits += 1
+                return self._snapshot
+            if age is not None and age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh, daemon=True).start()
+                return self._snapshot
+            self.misses += 1
+            inflight = self._inflight
+            if inflight is None:
+                inflight = self._inflight = threading.Event()
+                leader = True
+            else:
+                leader = False
+
+        if leader:
+            try:
+                self._store(self._fetch())
+            finally:
+                with self._lock:
+                    self._inflight = None
+                inflight.set()
+        else:
+            inflight.wait()
+        return self._snapshot
+
+    async def aget(self):
+        '''
+        The coroutine version of get().
+        '''
+        with self._lock:
+            age = self.age()
+            if age is not None and age < self.ttl:
+                self.hits += 1
+                return self._snapshot
+            if age is not None and age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                if not self._refreshing:
+                    self._refreshing = True
+                    # Keep a reference, the event loop only holds a weak one
+                    self._refresh_task = asyncio.ensure_future(self._arefresh())
+                return self._snapshot
+            self.misses += 1
+            inflight = self._ainflight
+            if inflight is None or inflight.get_loop() is not asyncio.get_running_loop():
+                inflight = self._ainflight = asyncio.ensure_future(self._afetchAndStore())
+
+        await asyncio.shield(inflight)
+        return self._snapshot
+
+    def age(self):
+        '''
+        Returns the number of seconds since the snapshot was fetched, or None without a snapshot.
+        '''
+        if self._fetched_at is None:
+            return None
+        return self.clock() - self._fetched_at
+
+    def stats(self):
+        '''
+        Returns the counters and the age of the snapshot as a dictionary.
+        '''
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale_hits': self.stale_hits,
+                'refreshes': self.refreshes,
+                'errors': self.errors,
+                'age': self.age(),
+            }
+
+    def _fetch(self):
+        try:
+            data = self.fetch()
+        except Exception:
+            data = None
+        if data is None:
+            with self._lock:
+                self.errors += 1
+        return data
+
+    def _store(self, data):
+        if data is None:
+            return
+        with self._lock:
+            self._snapshot = data
+            self._fetched_at = self.clock()
+
+    async def _afetch(self):
+        try:
+            data = await (self.afetch or sync_to_async(self.fetch, thread_sensitive=False))()
+        except Exception:
+            data = None
+        if data is None:
+            with self._lock:
+                self.errors += 1
+        return data
+
+    async def _afetchAndStore(self):
+        try:
+            self._store(await self._afetch())
+        finally:
+            with self._lock:
+                self._ainflight = None
+
+    async def _arefresh(self):
+        try:
+            self._store(await self._afetch())
+        finally:
+            with self._lock:
+                self.refreshes += 1
+                self._refreshing = False
+
+    def _refresh(self):
+        try:
+            self._store(self._fetch())
+        finally:
+            with self._lock:
+                self.refreshes += 1
+                self._refreshing = False
+
+
+class RateHistory:
+    '''
+    The stored rate snapshots (RateSnapshot) as an in-memory timeline for point-in-time lookups.
+
+    The timestamps are kept in a sorted list, so at(when) finds the snapshot that was current
+    at that moment with a binary search instead of a query. Snapshots written by other processes,
+    e.g. by the load_rates command, are picked up at most refresh_interval seconds later:
+    refresh() only reads the rows with an id above the last one it has seen.
+
+    record(rates) stores a freshly fetched snapshot unless it is equal to the newest one,
+    so the table only grows when the rates change.
+    '''
+    def __init__(self, refresh_interval=60, clock=time.monotonic):
+        self.refresh_interval = refresh_interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        '''
+        Forgets the loaded snapshots, the next lookup reads them again.
+        '''
+        with self._lock:
+            self._times = []
+            self._rates = []
+            self._last_id = 0
+            self._loaded_at = None
+
+    def refresh(self, force=False):
+        '''
+        Adds the snapshots stored since the last refresh to the timeline.
+        Without force it does nothing if the last refresh was less than refresh_interval seconds ago.
+        '''
+        with self._lock:
+            if not force and self._loaded_at is not None and self.clock() - self._loaded_at < self.refresh_interval:
+                return
+            rows = RateSnapshot.objects.filter(id__gt=self._last_id).order_by('id').values_list('id', 'fetched_at', 'rates')
+            for id, fetched_at, rates in rows:
+                # Loaded files usually add older snapshots, keep the lists sorted by time
+                index = bisect.bisect_right(self._times, fetched_at)
+                self._times.insert(index, fetched_at)
+                self._rates.insert(index, rates)
+                self._last_id = id
+            self._loaded_at = self.clock()
+
+    def at(self, when):
+        '''
+        Returns the (fetched_at, rates) pair that was current at the aware datetime when:
+        the newest snapshot fetched at or before it. Returns None if there is no such snapshot.
+        '''
+        self.refresh()
+        with self._lock:
+            index = bisect.bisect_right(self._times, when)
+            if index == 0:
+                return None
+            return self._times[index - 1], self._rates[index - 1]
+
+    def latest(self):
+        '''
+        Returns the (fetched_at, rates) pair of the newest snapshot, or None if nothing is stored.
+        '''
+        self.refresh()
+        with self._lock:
+            if not self._times:
+                return None
+            return self._times[-1], self._rates[-1]
+
+    def record(self, rates, fetched_at=None):
+        '''
+        Stores rates as a snapshot fetched at fetched_at (now by default) if they differ
+        from the newest stored snapshot. Database errors are logged, not raised,
+        so the rates are still served when they cannot be stored.
+        '''
+        latest = self.latest()
+        if latest is not None and latest[1] == rates:
+            return
+        try:
+            RateSnapshot.objects.create(fetched_at=fetched_at or timezone.now(), rates=rates)
+        except DatabaseError as e:
+            logger.warning('Currency rates not stored: %s', e)
+            return
+        self.refresh(force=True)
+
+
+def parseTimestamp(value):
+    '''
+    Converts an ISO 8601 date or date and time, e.g. '2024-03-01' or '2024-03-01T12:30', to an aware datetime.
+    Naive values are in the current time zone, a date is its midnight.
+    Raises ValueError if the value is not a date.
+    '''
+    value = (value or '').strip()
+    when = parse_datetime(value)
+    if when is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError(f'Invalid timestamp: {value!r}')
+        when = datetime.datetime.combine(date, datetime.time())
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    return when
+
+
+def fetchCurrencyRates():
+    '''
+    A function that requests the rates from the exchange API through the shared currency_client
+    and stores them in rate_history. It returns the dictionary of rates that came from the server, or None if the API is unavailable
+    or the circuit breaker is open.
+    '''
+    try:
+        data = currency_client.get_json()
+    except UpstreamError as e:
+        logger.warning('Currency rates unavailable: %s', e)
+        return None
+    rate_history.record(data)
+    return data
+
+
+async def afetchCurrencyRates():
+    '''
+    The coroutine version of fetchCurrencyRates, it requests the rates through async_currency_client.
+    '''
+    try:
+        data = await async_currency_client.get_json()
+    except UpstreamError as e:
+        logger.warning('Currency rates unavailable: %s', e)
+        return None
+    await sync_to_async(rate_history.record)(data)
+    return data
+
+
+rate_history = RateHistory(refresh_interval=settings.CURRENCY_RATES_TTL)
+
+rate_cache = RateCache(
+    fetchCurrencyRates,
+    afetchCurrencyRates,
+    ttl=settings.CURRENCY_RATES_TTL,
+    stale_ttl=settings.CURRENCY_RATES_STALE_TTL,
+)
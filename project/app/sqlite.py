@@ -0,0 +1,157 @@
+'''
+The SQLite production profile, enabled with settings.SQLITE_PRODUCTION.
+
+With the defaults every request opens a new connection to a database in rollback journal mode:
+a writer locks out every reader and a reader delays every writer, and concurrent operations end
+with "database is locked". The profile changes three things:
+
+- configureConnection, a connection_created receiver, sets settings.SQLITE_PRAGMAS on every new connection:
+  WAL journal mode (readers never block the writer and the writer never blocks readers),
+  synchronous=NORMAL (no fsync per commit in WAL mode), a busy timeout, a larger page cache and memory mapped I/O.
+- Connections are kept open between requests (CONN_MAX_AGE in settings.py), so the pragmas run once per connection.
+- Writes of the operation views go through write_queue when settings.SQLITE_WRITE_QUEUE is on: one writer thread
+  per process runs them one after another and commits all writes that queued up in the meantime in one transaction
+  (group commit). Writers of one process never compete for the database lock, and a burst of operations costs
+  one commit instead of one per operation. Every write runs in its own savepoint, so a failing write
+  is rolled back alone; callers get their result only after the transaction is committed.
+
+SQLite allows one writer at a time per database, so the queue does not limit throughput; it only turns
+lock contention and retries into an orderly line. Processes still compete with each other, which
+the busy timeout handles.
+'''
+import asyncio
+import contextvars
+import logging
+import os
+import queue
+import re
+import threading
+from concurrent.futures import Future
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+
+def configureConnection(sender, connection, **kwargs):
+    '''
+    A connection_created receiver that sets settings.SQLITE_PRAGMAS on new SQLite connections
+    when settings.SQLITE_PRODUCTION is on. The pragmas bypass the cursor wrappers,
+    so they are not counted as queries of the request.
+    '''
+    if connection.vendor != 'sqlite' or not settings.SQLITE_PRODUCTION:
+        return
+    for name, value in settings.SQLITE_PRAGMAS.items():
+        if not re.fullmatch(r'\w+', name) or not re.fullmatch(r'-?\w+', str(value)):
+            raise ValueError(f'Invalid SQLite pragma {name}={value!r}')
+        connection.connection.execute(f'PRAGMA {name} = {value}').fetchall()
+
+
+class WriteQueue:
+    '''
+    Runs database writes in a single writer thread with group commit, see the module docstring.
+
+    submit() queues a function and returns a Future of its result. The writer takes up to max_batch
+    queued functions at a time and runs each in a savepoint of one transaction; the futures are
+    resolved after the commit, or all get the error if the commit fails.
+    The thread is started on the first submit, again in a forked child process.
+    '''
+    def __init__(self, max_batch=100):
+        self.max_batch = max_batch
+        self.queue = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+
+    def submit(self, func, *args, **kwargs):
+        '''
+        Queues func(*args, **kwargs) and returns a concurrent.futures.Future of its result.
+        The function runs in a copy of the current context, so its queries count towards the request metrics.
+        '''
+        future = Future()
+        self.queue.put((future, contextvars.copy_context(), func, args, kwargs))
+        self.start()
+        return future
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self.run, name='sqlite-writer', daemon=True)
+            self.thread.start()
+
+    def in_writer(self):
+        '''
+        Returns True if called from the writer thread.
+        '''
+        return threading.current_thread() is self.thread
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.write(batch)
+
+    def write(self, batch):
+        '''
+        Runs a batch of queued functions in one transaction and resolves their futures.
+        '''
+        results = []
+        try:
+            with transaction.atomic():
+                for future, context, func, args, kwargs in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with transaction.atomic():
+                            results.append((future, True, context.run(func, *args, **kwargs)))
+                    except Exception as e:
+                        results.append((future, False, e))
+        except Exception as e:
+            logger.exception('Commit of %d queued write(s) failed', len(batch))
+            if isinstance(e, DatabaseError):
+                connection.close()
+            for future, *_ in batch:
+                if future.running():
+                    future.set_exception(e)
+            return
+        for future, ok, value in results:
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+
+write_queue = WriteQueue(max_batch=settings.SQLITE_WRITE_QUEUE_BATCH)
+
+
+def queued():
+    '''
+    Returns True if a write from the current thread goes through write_queue: the queue is enabled,
+    this is not the writer thread and no transaction is open, which the writer would wait for.
+    '''
+    return settings.SQLITE_WRITE_QUEUE and not write_queue.in_writer() and not connection.in_atomic_block
+
+
+def runWrite(func, *args, **kwargs):
+    '''
+    Returns func(*args, **kwargs), run through write_queue if settings.SQLITE_WRITE_QUEUE is on.
+    '''
+    if not queued():
+        return func(*args, **kwargs)
+    return write_queue.submit(func, *args, **kwargs).result()
+
+
+async def arunWrite(func, *args, **kwargs):
+    '''
+    The async version of runWrite. A queued write does not hold a thread while it waits.
+    '''
+    if not queued():
+        return await sync_to_async(func)(*args, **kwargs)
+    return await asyncio.wrap_future(write_queue.submit(func, *args, **kwargs))
@@ -0,0 +1,18 @@
+from django import template
+
+register = template.Library()
+
+@register.filter(expects_localtime=True)
+def strftime(value, format):
+    '''
+    Formats a date or datetime in the current time zone with datetime.strftime:
+    {{ transaction.datetime|strftime:"%d/%m/%Y %H:%M:%S" }} renders the same text as date:"d/m/Y H:i:s".
+    It is several times faster than the date filter, which matters in the loop over the rows of a history page,
+    but has no localized names: use date for formats with month or weekday names.
+    '''
+    if value in (None, ''):
+        return ''
+    try:
+        return value.strftime(format)
+    except AttributeError:
+        return ''
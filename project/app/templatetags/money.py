@@ -0,0 +1,13 @@
+from django import template
+from ..money import formatAmount
+
+register = template.Library()
+
+@register.filter
+def cents(value):
+    '''
+    Formats an amount stored in cents with two decimal places: {{ balance|cents }} renders 21500 as 215.00
+    '''
+    if value is None or value == '':
+        return ''
+    return formatAmount(value)
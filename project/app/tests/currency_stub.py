@@ -0,0 +1,93 @@
+'''
+A local stand-in for the currency exchange API, used by the tests and the benchmarks.
+
+with CurrencyStub() as stub:
+    stub.url  # e.g. 'http://127.0.0.1:54321/api/currency_exchange'
+    stub.latency = 0.2    # seconds to wait before answering
+    stub.status = 503     # answer every request with this status code
+    stub.fail_next = 2    # answer the next 2 requests with 503, then recover
+    stub.down = True      # drop connections without answering
+
+The stub speaks HTTP/1.1 with keep-alive, counts requests and counts
+accepted TCP connections, so connection reuse can be asserted.
+'''
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RATES = {
+    'AUD': 1.62,
+    'CAD': 1.48,
+    'CHF': 1.08,
+    'EUR': 1.0,
+    'GBP': 0.88,
+    'JPY': 129.5,
+    'USD': 1.15,
+}
+
+
+class CurrencyStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, without TCP_NODELAY every keep-alive
+    # response would wait for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.stub.lock:
+            self.server.stub.connections += 1
+
+    def do_GET(self):
+        stub = self.server.stub
+        with stub.lock:
+            stub.requests += 1
+            if stub.fail_next:
+                stub.fail_next -= 1
+                status = 503
+            else:
+                status = stub.status
+        if stub.down:
+            self.close_connection = True
+            return
+        if stub.latency:
+            time.sleep(stub.latency)
+        body = json.dumps(stub.rates).encode() if status == 200 else b'{}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CurrencyStub:
+    def __init__(self, rates=None, latency=0, status=200):
+        self.rates = dict(rates or RATES)
+        self.latency = latency
+        self.status = status
+        self.fail_next = 0
+        self.down = False
+        self.requests = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), CurrencyStubHandler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self.url = f'http://127.0.0.1:{self.server.server_port}/api/currency_exchange'
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
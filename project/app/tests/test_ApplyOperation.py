@@ -0,0 +1,55 @@
+from unittest.mock import patch
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.db import OperationalError
+from ..models import Balance, History, applyOperation
+from ..views import *
+
+class ApplyOperationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='testuser')
+
+    def test_deposit_and_withdraw(self):
+        entry, balance = applyOperation(self.user, 'deposit', 100)
+        self.assertEqual(entry.status, 'success')
+        self.assertEqual(balance, 100)
+
+        entry, balance = applyOperation(self.user, 'withdraw', 40)
+        self.assertEqual(entry.status, 'success')
+        self.assertEqual(balance, 60)
+        self.assertEqual(getBalance(self.user), 60)
+
+    def test_insufficient_balance_is_recorded_as_failure(self):
+        applyOperation(self.user, 'deposit', 10)
+        entry, balance = applyOperation(self.user, 'withdraw', 40)
+        self.assertEqual(entry.status, 'failure')
+        self.assertEqual(balance, 10)
+        self.assertEqual(History.objects.filter(user=self.user, status='failure').count(), 1)
+
+    def test_unknown_type_is_rejected(self):
+        with self.assertRaises(ValueError):
+            applyOperation(self.user, 'transfer', 10)
+        self.assertFalse(History.objects.exists())
+
+    def test_lock_errors_are_retried(self):
+        original = Balance.objects.select_for_update
+        calls = []
+
+        def flaky():
+            calls.append(1)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return original()
+
+        with patch.object(Balance.objects, 'select_for_update', flaky):
+            entry, balance = applyOperation(self.user, 'deposit', 5)
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(balance, 5)
+        self.assertEqual(History.objects.count(), 1)
+
+    def test_lock_errors_give_up_after_retries(self):
+        with patch.object(Balance.objects, 'select_for_update', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                applyOperation(self.user, 'deposit', 5, retries=2)
+        self.assertFalse(History.objects.exists())
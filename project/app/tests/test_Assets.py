@@ -0,0 +1,99 @@
+import gzip
+import os
+import tempfile
+from unittest.mock import patch
+from django.test import TestCase, Client, override_settings
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.templatetags.static import static
+from django.urls import reverse
+from ..assets import acceptedEncodings
+from ..views import *
+
+CSS = 'app/vendor/bootstrap-4.5.3/css/bootstrap.min.css'
+
+
+class FakeBrotli:
+    @staticmethod
+    def compress(data, quality):
+        return b'br:' + gzip.compress(data)
+
+
+class AssetsTestCase(TestCase):
+    def test_pages_use_vendored_assets(self):
+        caches['template_fragments'].clear()
+        response = Client().get(reverse('login'))
+        for name in (CSS, 'app/vendor/bootstrap-4.5.3/js/bootstrap.bundle.min.js', 'app/vendor/jquery-3.5.1/jquery.slim.min.js'):
+            self.assertContains(response, static(name))
+        self.assertNotContains(response, 'https://')
+
+    def test_accepted_encodings(self):
+        self.assertEqual(acceptedEncodings('gzip, deflate, br'), {'gzip', 'deflate', 'br'})
+        self.assertEqual(acceptedEncodings('br;q=0, GZIP;q=0.5, identity'), {'gzip', 'identity'})
+        self.assertEqual(acceptedEncodings(''), set())
+
+
+class CollectedAssetsTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        storages = {**settings.STORAGES, 'staticfiles': {'BACKEND': 'app.assets.CompressedManifestStaticFilesStorage'}}
+        override = override_settings(STATIC_ROOT=self.root, STORAGES=storages)
+        override.enable()
+        self.addCleanup(override.disable)
+        caches['template_fragments'].clear()
+        self.addCleanup(caches['template_fragments'].clear)
+        self.client = Client()
+
+    def collect(self):
+        call_command('collectstatic', interactive=False, verbosity=0)
+        return static(CSS)
+
+    def get(self, url, encoding=''):
+        return self.client.get(url, headers={'Accept-Encoding': encoding})
+
+    def test_collect(self):
+        url = self.collect()
+        self.assertRegex(url, r'/static/app/vendor/bootstrap-4\.5\.3/css/bootstrap\.min\.[0-9a-f]{12}\.css$')
+        hashed = os.path.join(self.root, url.removeprefix('/static/'))
+        with open(hashed, 'rb') as original, gzip.open(hashed + '.gz') as compressed:
+            self.assertEqual(compressed.read(), original.read())
+        self.assertFalse(os.path.exists(hashed + '.br'))
+        self.assertContains(self.client.get(reverse('login')), url)
+
+    def test_serve(self):
+        url = self.collect()
+        response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Cache-Control'], f'public, max-age={settings.STATIC_MAX_AGE}, immutable')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        plain = b''.join(response.streaming_content)
+
+        response = self.get(url, 'gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+        self.assertNotIn('Content-Encoding', self.get(url, 'gzip;q=0'))
+
+        response = self.get('/static/' + CSS)
+        self.assertEqual(response['Cache-Control'], f'public, max-age={settings.STATIC_UNHASHED_MAX_AGE}')
+        response = self.client.get('/static/' + CSS, headers={'If-Modified-Since': response['Last-Modified']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_brotli(self):
+        with patch('app.assets.brotli', FakeBrotli):
+            url = self.collect()
+            response = self.get(url, 'gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'br:'))
+
+    def test_not_found(self):
+        self.collect()
+        self.assertEqual(self.get('/static/missing.css').status_code, 404)
+        self.assertEqual(self.get('/static/../manage.py').status_code, 404)
+        self.assertEqual(self.get('/static/%2e%2e/manage.py').status_code, 404)
+        self.assertEqual(self.client.post('/static/' + CSS).status_code, 405)
@@ -0,0 +1,101 @@
+import asyncio
+import time
+from unittest.mock import patch
+from django.test import SimpleTestCase, TestCase
+from django.contrib.auth.models import User
+from django.urls import reverse
+from ..models import History
+from ..rates import RateCache
+from ..upstream import AsyncUpstreamClient, CircuitBreaker, UpstreamError
+from ..views import *
+from .currency_stub import RATES, CurrencyStub
+
+
+class AsyncUpstreamClientTestCase(SimpleTestCase):
+    def setUp(self):
+        self.stub = CurrencyStub().start()
+        self.addCleanup(self.stub.stop)
+
+    def upstream(self, **kwargs):
+        options = {'connect_timeout': 1, 'read_timeout': 0.5, 'retries': 2, 'backoff': 0.01}
+        options.update(kwargs)
+        return AsyncUpstreamClient(self.stub.url, **options)
+
+    async def test_get_json_reuses_connections(self):
+        client = self.upstream()
+        for _ in range(3):
+            self.assertEqual(await client.get_json(), RATES)
+        self.assertEqual(self.stub.connections, 1)
+
+    async def test_server_errors_are_retried(self):
+        self.stub.fail_next = 2
+        self.assertEqual(await self.upstream().get_json(), RATES)
+        self.assertEqual(self.stub.requests, 3)
+
+    async def test_failures_open_the_shared_breaker(self):
+        self.stub.status = 503
+        breaker = CircuitBreaker(failure_threshold=1)
+        with self.assertRaises(UpstreamError), self.assertLogs('app.upstream', 'WARNING'):
+            await self.upstream(breaker=breaker).get_json()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    async def test_concurrent_misses_share_one_fetch(self):
+        self.stub.latency = 0.3
+        client = self.upstream()
+        cache = RateCache(fetch=None, afetch=client.get_json, ttl=60)
+        start = time.monotonic()
+        results = await asyncio.gather(*[cache.aget() for _ in range(20)])
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(results, [RATES] * 20)
+        self.assertEqual(self.stub.requests, 1)
+        self.assertEqual(cache.stats()['misses'], 20)
+
+
+class AsyncViewsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        History.objects.create(user=self.user, amount=10000, type='deposit', status='success')
+        self.async_client.force_login(self.user)
+        rate_cache.clear()
+        rate_history.clear()
+
+    async def test_balance_page(self):
+        response = await self.async_client.get(reverse('async_operations'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Your current balance: $100.00')
+
+    async def test_operation(self):
+        response = await self.async_client.post(reverse('async_operations'), {'operation': 'withdraw', 'amount': '40'})
+        self.assertContains(response, 'Your current balance: $60.00')
+        response = await self.async_client.post(reverse('async_operations'), {'operation': 'withdraw', 'amount': '70'})
+        self.assertContains(response, 'Insufficient balance')
+        self.assertEqual(await History.objects.acount(), 3)
+
+    async def test_amount_too_large(self):
+        response = await self.async_client.post(reverse('async_operations'), {'operation': 'deposit', 'amount': '99999999999'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Invalid amount')
+        self.assertEqual(await History.objects.acount(), 1)
+
+    async def test_history_page(self):
+        response = await self.async_client.get(reverse('async_history'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Balance After: 100.00')
+        response = await self.async_client.get(reverse('async_history'), {'cursor': 'forged'})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_currency_exchange(self):
+        async def afetch():
+            return RATES
+
+        with patch.object(rate_cache, 'afetch', afetch):
+            response = await self.async_client.get(reverse('async_currency_exchange'))
+            self.assertContains(response, 'USD (1.15)')
+            response = await self.async_client.post(reverse('async_currency_exchange'), {'amount': '10', 'currency': 'USD'})
+            self.assertEqual(response.context['exchanged_amount'], 11.5)
+
+    async def test_login_required(self):
+        await self.async_client.alogout()
+        response = await self.async_client.get(reverse('async_operations'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('login'), response['Location'])
@@ -0,0 +1,59 @@
+from io import StringIO
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from ..models import BalanceCheckpoint, History, buildCheckpoints, calculateBalance
+from ..views import *
+
+class BalanceCheckpointsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='testuser')
+        self.other = User.objects.create(username='otheruser')
+        for amount in (100, 200, 300):
+            History.objects.create(user=self.user, amount=amount, type='deposit', status='success')
+        History.objects.create(user=self.user, amount=50, type='withdraw', status='success')
+        History.objects.create(user=self.other, amount=40, type='deposit', status='success')
+
+    def test_build_checkpoints(self):
+        self.assertEqual(buildCheckpoints(), 2)
+        checkpoint = BalanceCheckpoint.objects.get(user=self.user)
+        self.assertEqual(checkpoint.balance, 550)
+        self.assertEqual(checkpoint.upto_id, History.objects.filter(user=self.user).latest('id').id)
+
+    def test_build_checkpoints_is_incremental(self):
+        buildCheckpoints()
+        self.assertEqual(buildCheckpoints(), 0)
+        History.objects.create(user=self.user, amount=25, type='deposit', status='success')
+        self.assertEqual(buildCheckpoints(), 1)
+        latest = BalanceCheckpoint.objects.filter(user=self.user).latest('upto_id')
+        self.assertEqual(latest.balance, 575)
+        self.assertEqual(BalanceCheckpoint.objects.filter(user=self.user).count(), 2)
+
+    def test_every_skips_users_with_few_new_rows(self):
+        self.assertEqual(buildCheckpoints(every=2), 1)
+        self.assertFalse(BalanceCheckpoint.objects.filter(user=self.other).exists())
+
+    def test_calculate_balance_sums_only_rows_after_checkpoint(self):
+        buildCheckpoints()
+        # The rows covered by the checkpoint are not read again
+        History.objects.filter(user=self.user).update(amount=0)
+        History.objects.create(user=self.user, amount=10, type='deposit', status='success')
+        self.assertEqual(calculateBalance(self.user), 560)
+
+    def test_command_writes_checkpoints(self):
+        out = StringIO()
+        call_command('balance_checkpoints', every=1, user=['testuser'], stdout=out)
+        self.assertIn('Wrote 1 checkpoint(s)', out.getvalue())
+        self.assertEqual(BalanceCheckpoint.objects.get().user, self.user)
+
+    def test_verify_reports_mismatches(self):
+        call_command('balance_checkpoints', every=1, stdout=StringIO())
+        out = StringIO()
+        call_command('balance_checkpoints', verify=True, stdout=out)
+        self.assertIn('All checkpoints and balances match', out.getvalue())
+
+        BalanceCheckpoint.objects.filter(user=self.user).update(balance=999)
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, '1 mismatch(es) found'):
+            call_command('balance_checkpoints', verify=True, stdout=out)
+        self.assertIn(f'user {self.user.pk}: checkpoint is 9.99, recalculated 5.50', out.getvalue())
@@ -0,0 +1,87 @@
+from io import StringIO
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from ..models import Balance, History, buildCheckpoints, calculateBalance, verifyCheckpoints
+from ..views import *
+
+class BalanceModelTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='testuser')
+
+    def test_balance_row_follows_history_inserts(self):
+        History.objects.create(user=self.user, amount=100, type='deposit', status='success')
+        History.objects.create(user=self.user, amount=30, type='withdraw', status='success')
+        History.objects.create(user=self.user, amount=500, type='withdraw', status='failure')
+        self.assertEqual(Balance.objects.get(pk=self.user.pk).amount, 70)
+
+    def test_get_balance_is_a_single_query(self):
+        History.objects.create(user=self.user, amount=100, type='deposit', status='success')
+        with self.assertNumQueries(1):
+            self.assertEqual(getBalance(self.user), 100)
+
+    def test_rebuild_balances_command_repairs_drift(self):
+        other = User.objects.create(username='otheruser')
+        History.objects.create(user=self.user, amount=100, type='deposit', status='success')
+        History.objects.create(user=other, amount=40, type='deposit', status='success')
+        Balance.objects.update(amount=999)
+
+        out = StringIO()
+        call_command('rebuild_balances', stdout=out)
+
+        self.assertIn('Rebuilt 2 balance(s)', out.getvalue())
+        self.assertEqual(getBalance(self.user), 100)
+        self.assertEqual(getBalance(other), 40)
+
+    def test_rebuild_balances_command_single_user(self):
+        other = User.objects.create(username='otheruser')
+        History.objects.create(user=self.user, amount=100, type='deposit', status='success')
+        History.objects.create(user=other, amount=40, type='deposit', status='success')
+        Balance.objects.update(amount=999)
+
+        call_command('rebuild_balances', user=['testuser'], stdout=StringIO())
+
+        self.assertEqual(getBalance(self.user), 100)
+        self.assertEqual(getBalance(other), 999)
+
+    def test_balance_follows_history_edits(self):
+        other = User.objects.create(username='otheruser')
+        History.objects.create(user=self.user, amount=100, type='deposit', status='success')
+        entry = History.objects.create(user=self.user, amount=30, type='withdraw', status='success')
+        buildCheckpoints()
+
+        entry.amount = 50
+        entry.save()
+        self.assertEqual(getBalance(self.user), 50)
+        entry.status = 'failure'
+        entry.save(update_fields=['status'])
+        self.assertEqual(getBalance(self.user), 100)
+        entry.status = 'success'
+        entry.type = 'deposit'
+        entry.user = other
+        entry.save()
+        self.assertEqual(getBalance(self.user), 100)
+        self.assertEqual(getBalance(other), 50)
+
+        for user in (self.user, other):
+            self.assertEqual(getBalance(user), calculateBalance(user))
+        self.assertEqual(list(verifyCheckpoints()), [])
+
+    def test_balance_follows_history_deletes(self):
+        History.objects.create(user=self.user, amount=100, type='deposit', status='success')
+        entry = History.objects.create(user=self.user, amount=30, type='withdraw', status='success')
+        History.objects.create(user=self.user, amount=5, type='withdraw', status='success')
+        buildCheckpoints()
+
+        entry.delete()
+        self.assertEqual(getBalance(self.user), 95)
+        History.objects.filter(type='deposit').delete()
+        self.assertEqual(getBalance(self.user), -5)
+        self.assertEqual(getBalance(self.user), calculateBalance(self.user))
+        self.assertEqual(list(verifyCheckpoints()), [])
+
+    def test_deleting_user_with_history(self):
+        History.objects.create(user=self.user, amount=100, type='deposit', status='success')
+        self.user.delete()
+        self.assertFalse(Balance.objects.exists())
+        self.assertFalse(History.objects.exists())
@@ -15,8 +15,8 @@ class BalanceOperationsTemplateTestCase(TestCase):
 
     def test_balance_operations_balance_nonzero(self):
         client = Client()
-        History.objects.create(status='success', amount=100, type='deposit', user=self.user)
-        History.objects.create(status='failure', amount=50, type='withdraw', user=self.user)
+        History.objects.create(status='success', amount=10000, type='deposit', user=self.user)
+        History.objects.create(status='failure', amount=5000, type='withdraw', user=self.user)
         client.force_login(self.user)
         balance_operations_url = reverse('operations')
         response = client.get(balance_operations_url)
@@ -2,6 +2,7 @@ from django.test import TestCase, Client
 from django.contrib.auth.models import User
 from django.urls import reverse
 from ..models import History  
+from ..money import MAX_AMOUNT, formatAmount
 from ..views import *
 
 class BalanceOperationsViewTestCase(TestCase):
@@ -32,7 +33,7 @@ class BalanceOperationsViewTestCase(TestCase):
 
     def test_balance_operations_view_post_withdraw_success(self):
         user = User.objects.create_user(username='testuser', password='testpassword')
-        History.objects.create(user=user, amount=100, type='deposit', status='success')
+        History.objects.create(user=user, amount=10000, type='deposit', status='success')
         self.client.force_login(user)
         data = {
             'amount': '50',
@@ -45,7 +46,7 @@ class BalanceOperationsViewTestCase(TestCase):
 
     def test_balance_operations_view_post_withdraw_failure(self):
         user = User.objects.create_user(username='testuser', password='testpassword')
-        History.objects.create(user=user, amount=100, type='deposit', status='success')
+        History.objects.create(user=user, amount=10000, type='deposit', status='success')
         self.client.force_login(user)
         data = {
             'amount': '150',
@@ -55,6 +56,15 @@ class BalanceOperationsViewTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(History.objects.filter(user=user, status='failure').count(), 1)
 
+    def test_balance_operations_view_post_amount_too_large(self):
+        user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(user)
+        for amount in ('99999999999', formatAmount(MAX_AMOUNT + 1)):
+            response = self.client.post(self.operations_url, {'amount': amount, 'operation': 'deposit'})
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, 'Invalid amount')
+        self.assertEqual(History.objects.filter(user=user).count(), 0)
+
     def test_balance_operations_view_login_required(self):
         response = self.client.get(self.operations_url)
         self.assertEqual(response.status_code, 302)  
@@ -0,0 +1,107 @@
+import json
+import random
+from decimal import ROUND_HALF_EVEN, ROUND_HALF_UP, Decimal
+from unittest.mock import patch
+from django.test import SimpleTestCase, TestCase, Client
+from django.contrib.auth.models import User
+from django.urls import reverse
+from ..conversion import CrossRates, getCrossRates
+from ..views import *
+
+RATES = {'AUD': 1.62, 'CAD': 1.48, 'CHF': 1.08, 'EUR': 1.0, 'GBP': 0.88, 'JPY': 129.5, 'USD': 1.15}
+
+def exact(cents, source, target, rates, rounding):
+    '''
+    The per-item reference: the exact decimal conversion rounded once.
+    '''
+    source = Decimal(str(rates[source])) if source else Decimal(1)
+    value = Decimal(cents) * Decimal(str(rates[target])) / source
+    return int(value.quantize(Decimal(1), rounding=rounding))
+
+
+class CrossRatesTestCase(SimpleTestCase):
+    def test_matches_exact_decimal_conversion(self):
+        generator = random.Random(0)
+        currencies = [None, *RATES]
+        cross_rates = getCrossRates(RATES)
+        items = [
+            (generator.randint(0, 9999999999), generator.choice(currencies), generator.choice(list(RATES)))
+            for _ in range(2000)
+        ]
+        amounts, sources, targets = zip(*items)
+        for rounding, mode in (('half_up', ROUND_HALF_UP), ('half_even', ROUND_HALF_EVEN)):
+            converted = cross_rates.convert(amounts, cross_rates.indices(sources), cross_rates.indices(targets), rounding)
+            self.assertEqual(converted.tolist(), [exact(*item, RATES, mode) for item in items])
+
+    def test_ties(self):
+        cross_rates = CrossRates({'USD': 1.5})
+        sources = cross_rates.indices([None] * 4)
+        targets = cross_rates.indices(['USD'] * 4)
+        # 1.5, 4.5, 7.5 and 10.5 cents
+        self.assertEqual(cross_rates.convert([1, 3, 5, 7], sources, targets, 'half_up').tolist(), [2, 5, 8, 11])
+        self.assertEqual(cross_rates.convert([1, 3, 5, 7], sources, targets, 'half_even').tolist(), [2, 4, 8, 10])
+
+    def test_cross_rates_are_reduced_fractions(self):
+        cross_rates = CrossRates({'EUR': 1.0, 'USD': 1.15})
+        usd, eur = cross_rates.index['USD'], cross_rates.index['EUR']
+        self.assertEqual((cross_rates.numerators[eur, usd], cross_rates.denominators[eur, usd]), (23, 20))
+        self.assertEqual((cross_rates.numerators[usd, eur], cross_rates.denominators[usd, eur]), (20, 23))
+
+    def test_long_rates_stay_exact(self):
+        rates = {'USD': 1.0842375, 'JPY': 162.1234567891}
+        cross_rates = CrossRates(rates)
+        self.assertEqual(cross_rates.numerators.dtype, object)
+        converted = cross_rates.convert([9999999999], cross_rates.indices(['USD']), cross_rates.indices(['JPY']))
+        self.assertEqual(converted.tolist(), [exact(9999999999, 'USD', 'JPY', rates, ROUND_HALF_UP)])
+
+    def test_invalid_rates_are_ignored(self):
+        self.assertEqual(CrossRates({'USD': 1.15, 'XXX': 0, 'YYY': 'n/a'}).currencies, [None, 'USD'])
+
+
+class BatchExchangeAPITestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
+        rate_cache.clear()
+        rate_history.clear()
+
+    def post(self, payload):
+        return self.client.post(reverse('api_batch_exchange'), json.dumps(payload), content_type='application/json')
+
+    @patch.object(rate_cache, 'fetch', lambda: RATES)
+    def test_batch_conversion(self):
+        response = self.post({'conversions': [
+            {'amount': '10', 'to': 'USD'},
+            {'amount': 100, 'from': 'GBP', 'to': 'JPY'},
+            {'amount': '0.01', 'from': 'USD', 'to': 'EUR'},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'rates_at': None, 'rounding': 'half_up', 'results': ['11.50', '14715.91', '0.01']})
+
+    @patch.object(rate_cache, 'fetch', lambda: RATES)
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.post(reverse('api_batch_exchange'), 'x', content_type='application/json').status_code, 400)
+        self.assertEqual(self.post({'conversions': []}).status_code, 400)
+        self.assertEqual(self.post({'conversions': [{'amount': 1, 'to': 'USD'}], 'rounding': 'up'}).status_code, 400)
+        self.assertEqual(self.post({'conversions': [{'amount': 1, 'to': 'USD'}], 'at': 'soon'}).status_code, 400)
+        for at in (123, True, False, 0, ['2024-03-01'], {'date': '2024-03-01'}):
+            response = self.post({'conversions': [{'amount': 1, 'to': 'USD'}], 'at': at})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'error': 'Invalid "at" timestamp'})
+        response = self.post({'conversions': [{'amount': 1, 'to': 'USD'}, {'amount': 1, 'to': 'XXX'}]})
+        self.assertEqual(response.json(), {'error': 'conversions[1]: unknown currency'})
+        response = self.post({'conversions': [{'amount': '-1', 'to': 'USD'}]})
+        self.assertEqual(response.json(), {'error': 'conversions[0]: invalid amount'})
+        response = self.post({'conversions': [{'amount': 1, 'from': ['USD'], 'to': 'EUR'}]})
+        self.assertEqual(response.status_code, 400)
+        with self.settings(API_BATCH_MAX_CONVERSIONS=1):
+            self.assertEqual(self.post({'conversions': [{'amount': 1, 'to': 'USD'}] * 2}).status_code, 400)
+
+    @patch.object(rate_cache, 'fetch', lambda: None)
+    def test_rates_unavailable(self):
+        self.assertEqual(self.post({'conversions': [{'amount': 1, 'to': 'USD'}]}).status_code, 503)
+
+    def test_login_required(self):
+        self.client.logout()
+        self.assertEqual(self.post({'conversions': [{'amount': 1, 'to': 'USD'}]}).status_code, 401)
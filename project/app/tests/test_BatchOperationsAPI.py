@@ -0,0 +1,95 @@
+import json
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.urls import reverse
+from ..models import Balance, History, applyOperations, calculateBalance
+from ..views import *
+
+class BatchOperationsAPITestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.other = User.objects.create_user(username='otheruser', password='testpassword')
+        self.client.force_login(self.user)
+        self.url = reverse('api_batch_operations')
+
+    def post(self, payload):
+        return self.client.post(self.url, json.dumps(payload), content_type='application/json')
+
+    def test_operations_are_checked_in_order_against_a_running_balance(self):
+        response = self.post({'operations': [
+            {'type': 'deposit', 'amount': '10.00'},
+            {'type': 'withdraw', 'amount': '4'},
+            {'type': 'withdraw', 'amount': 7},
+            {'type': 'withdraw', 'amount': '6.00'},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([r['status'] for r in data['results']], ['success', 'success', 'failure', 'success'])
+        self.assertEqual([r['balance'] for r in data['results']], ['10.00', '6.00', '6.00', '0.00'])
+        self.assertEqual(data['results'][2]['error'], 'Insufficient balance')
+        self.assertEqual(data['balances'], {'testuser': '0.00'})
+        self.assertEqual(History.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(getBalance(self.user), 0)
+        self.assertEqual(getBalance(self.user), calculateBalance(self.user))
+
+    def test_invalid_operations_are_rejected_individually(self):
+        response = self.post({'operations': [
+            {'type': 'deposit', 'amount': '5'},
+            {'type': 'transfer', 'amount': '5'},
+            {'type': 'deposit', 'amount': '-1'},
+            {'type': 'deposit', 'amount': True},
+            'deposit',
+            {'type': 'deposit', 'amount': '1', 'user': 'otheruser'},
+        ]})
+        results = response.json()['results']
+        self.assertEqual(results[0]['status'], 'success')
+        self.assertEqual(
+            [(r['status'], r['error']) for r in results[1:]],
+            [('rejected', 'Unknown operation'), ('rejected', 'Invalid amount'), ('rejected', 'Invalid amount'),
+             ('rejected', 'Invalid operation'), ('rejected', 'Permission denied')],
+        )
+        self.assertEqual(History.objects.count(), 1)
+
+    def test_unhashable_user_is_rejected(self):
+        for is_staff, error in ((False, 'Permission denied'), (True, 'Unknown user')):
+            self.user.is_staff = is_staff
+            self.user.save()
+            response = self.post({'operations': [
+                {'type': 'deposit', 'amount': '1', 'user': ['otheruser']},
+                {'type': 'deposit', 'amount': '1', 'user': {'name': 'otheruser'}},
+                {'type': 'deposit', 'amount': '1'},
+            ]})
+            self.assertEqual(response.status_code, 200)
+            results = response.json()['results']
+            self.assertEqual(results[:2], [{'status': 'rejected', 'error': error}] * 2)
+            self.assertEqual(results[2]['status'], 'success')
+
+    def test_staff_can_operate_on_many_users(self):
+        self.user.is_staff = True
+        self.user.save()
+        response = self.post({'operations': [
+            {'type': 'deposit', 'amount': '3', 'user': 'otheruser'},
+            {'type': 'deposit', 'amount': '2'},
+            {'type': 'deposit', 'amount': '1', 'user': 'nobody'},
+        ]})
+        data = response.json()
+        self.assertEqual(data['balances'], {'otheruser': '3.00', 'testuser': '2.00'})
+        self.assertEqual(data['results'][2], {'status': 'rejected', 'error': 'Unknown user'})
+        self.assertEqual(Balance.objects.get(pk=self.other.pk).amount, 300)
+
+    def test_batch_is_a_constant_number_of_queries(self):
+        History.objects.create(user=self.user, amount=100, type='deposit', status='success')
+        # Savepoint, lock, read, one insert, one balance update, release
+        with self.assertNumQueries(6):
+            entries, balances = applyOperations([(self.user.pk, 'deposit', 1)] * 100)
+        self.assertEqual(len(entries), 100)
+        self.assertEqual(balances, {self.user.pk: 200})
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.post(self.url, 'nope', content_type='application/json').status_code, 400)
+        self.assertEqual(self.post({'operations': []}).status_code, 400)
+        with self.settings(API_BATCH_MAX_OPERATIONS=2):
+            self.assertEqual(self.post({'operations': [{'type': 'deposit', 'amount': 1}] * 3}).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.post({'operations': [{'type': 'deposit', 'amount': 1}]}).status_code, 401)
@@ -0,0 +1,109 @@
+from django.test import TestCase, Client, override_settings
+from django.contrib import messages
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.base import Message
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import caches
+from django.http import HttpRequest
+from django.urls import reverse
+from ..models import Balance, History, rebuildBalances
+from ..views import *
+
+class ConditionalPagesTestCase(TestCase):
+    def setUp(self):
+        caches['views'].clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
+        History.objects.create(user=self.user, amount=10000, type='deposit', status='success')
+
+    def test_headers(self):
+        for name in ('operations', 'history'):
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response['ETag'].startswith('"'))
+            self.assertNotIn('Last-Modified', response)
+            self.assertIn('private', response['Cache-Control'])
+            self.assertIn('no-cache', response['Cache-Control'])
+            self.assertIn('Cookie', response['Vary'])
+
+    def test_not_modified(self):
+        for name in ('operations', 'history'):
+            etag = self.client.get(reverse(name))['ETag']
+            with self.assertNumQueries(2):
+                # Session and user, the ETag comes from the view cache version
+                response = self.client.get(reverse(name), headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+            self.assertEqual(response['ETag'], etag)
+            self.assertIn('Cookie', response['Vary'])
+
+    def test_edits_and_deletes_change_etag(self):
+        older = History.objects.create(user=self.user, amount=100, type='deposit', status='success')
+        History.objects.create(user=self.user, amount=50, type='deposit', status='success')
+
+        def changes(change):
+            etag = self.client.get(reverse('operations'))['ETag']
+            change()
+            response = self.client.get(reverse('operations'), headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+            return response
+
+        older.amount = 300
+        self.assertContains(changes(older.save), 'Your current balance: $103.50')
+        self.assertContains(changes(older.delete), 'Your current balance: $100.50')
+        self.assertContains(changes(lambda: rebuildBalances([self.user.pk])), 'Your current balance: $100.50')
+
+    @override_settings(VIEW_CACHE_ALIAS=None)
+    def test_etag_without_view_cache(self):
+        older = History.objects.create(user=self.user, amount=100, type='deposit', status='success')
+        etag = self.client.get(reverse('operations'))['ETag']
+        self.assertEqual(self.client.get(reverse('operations'), headers={'If-None-Match': etag}).status_code, 304)
+        older.delete()
+        response = self.client.get(reverse('operations'), headers={'If-None-Match': etag})
+        self.assertContains(response, 'Your current balance: $100.00')
+        etag = response['ETag']
+        Balance.objects.filter(pk=self.user.pk).update(amount=0)
+        self.assertEqual(self.client.get(reverse('operations'), headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_operation_changes_etag(self):
+        etag = self.client.get(reverse('operations'))['ETag']
+        response = self.client.post(reverse('operations'), {'operation': 'withdraw', 'amount': '40'})
+        self.assertNotIn('ETag', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+        response = self.client.get(reverse('operations'), headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Your current balance: $60.00')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_pages_have_own_etags(self):
+        History.objects.create(user=self.user, amount=2500, type='withdraw', status='success')
+        first = self.client.get(reverse('history'), {'page_size': 1})
+        second = self.client.get(reverse('history'), {'page_size': 1, 'cursor': first.context['page_obj'].next_cursor})
+        self.assertNotEqual(first['ETag'], second['ETag'])
+
+    def test_other_user_or_session(self):
+        etag = self.client.get(reverse('operations'))['ETag']
+        other = User.objects.create_user(username='other', password='testpassword')
+        client = Client()
+        client.force_login(other)
+        self.assertEqual(client.get(reverse('operations'), headers={'If-None-Match': etag}).status_code, 200)
+        # A new CSRF secret (e.g. after a login) invalidates the form token of the cached page
+        self.client.cookies['csrftoken'] = 'a' * 32
+        self.assertEqual(self.client.get(reverse('operations'), headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_pending_messages(self):
+        etag = self.client.get(reverse('operations'))['ETag']
+        storage = CookieStorage(HttpRequest())
+        self.client.cookies[storage.cookie_name] = storage._encode([Message(messages.INFO, 'Welcome back')])
+        response = self.client.get(reverse('operations'), headers={'If-None-Match': etag})
+        self.assertContains(response, 'Welcome back')
+        self.assertNotIn('ETag', response)
+        self.assertEqual(self.client.get(reverse('operations'), headers={'If-None-Match': etag}).status_code, 304)
+
+    def test_anonymous(self):
+        self.client.logout()
+        response = self.client.get(reverse('history'))
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn('ETag', response)
@@ -3,7 +3,11 @@ from unittest.mock import patch
 from ..views import *
 
 class CurrencyParamsTestCase(TestCase):
-    @patch('requests.get')
+    def setUp(self):
+        rate_cache.clear()
+        rate_history.clear()
+
+    @patch('requests.Session.get')
     def test_get_currency_params_success(self, mock_get):
         mock_get.return_value.status_code = 200
         mock_get.return_value.json.return_value = {
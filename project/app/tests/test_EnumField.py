@@ -0,0 +1,54 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import connection
+from ..fields import EnumField
+from ..models import History
+from ..views import *
+
+
+class EnumFieldTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='testuser', password='testpassword')
+
+    def raw(self, entry):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT type, status FROM app_history WHERE id = %s', [entry.id])
+            return cursor.fetchone()
+
+    def test_stored_as_small_integers(self):
+        deposit = History.objects.create(user=self.user, amount=100, type='deposit', status='success')
+        withdraw = History.objects.create(user=self.user, amount=100, type='withdraw', status='failure')
+        self.assertEqual(self.raw(deposit), (History.Type.DEPOSIT, History.Status.SUCCESS))
+        self.assertEqual(self.raw(withdraw), (History.Type.WITHDRAW, History.Status.FAILURE))
+
+    def test_string_facing_api(self):
+        History.objects.create(user=self.user, amount=1250, type='withdraw', status='success')
+        entry = History.objects.get(type='withdraw', status__in=['success'])
+        self.assertEqual((entry.type, entry.status), ('withdraw', 'success'))
+        self.assertEqual(entry.get_type_display(), 'Withdraw')
+        self.assertEqual(str(entry), 'testuser - withdraw - 12.50 - success')
+        self.assertEqual(list(History.objects.values_list('type', 'status')), [('withdraw', 'success')])
+
+    def test_enum_members_and_values_are_accepted(self):
+        entry = History.objects.create(user=self.user, amount=100, type=History.Type.DEPOSIT, status=2)
+        self.assertEqual((entry.type, entry.status), ('deposit', 'failure'))
+        self.assertEqual(History.objects.filter(type=History.Type.DEPOSIT).count(), 1)
+
+    def test_unknown_value_is_rejected(self):
+        entry = History(user=self.user, amount=100, type='debit', status='success')
+        with self.assertRaises(ValidationError):
+            entry.full_clean()
+        with self.assertRaises(ValueError):
+            entry.save()
+        self.assertFalse(History.objects.exists())
+
+    def test_deconstructs_to_literal_members(self):
+        field = History._meta.get_field('type')
+        _, path, args, kwargs = field.deconstruct()
+        self.assertEqual(kwargs['enum'], [('deposit', 1, 'Deposit'), ('withdraw', 2, 'Withdraw')])
+        copy = EnumField(*args, **kwargs)
+        self.assertEqual(copy.choices, field.choices)
+        self.assertEqual(copy.get_prep_value('withdraw'), 2)
+        self.assertEqual(copy.from_db_value(1, None, connection), 'deposit')
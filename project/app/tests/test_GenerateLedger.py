@@ -0,0 +1,63 @@
+from io import StringIO
+from datetime import timedelta
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from ..models import Balance, BalanceCheckpoint, History, calculateBalance, verifyCheckpoints
+from ..views import *
+
+def generate(**options):
+    out = StringIO()
+    call_command('generate_ledger', stdout=out, **{'users': 5, 'transactions': 300, 'seed': 1, **options})
+    return out.getvalue()
+
+
+class GenerateLedgerTestCase(TestCase):
+    def test_creates_users_and_transactions(self):
+        out = generate(batch_size=70)
+        self.assertIn('Created 5 user(s) and 300 transaction(s)', out)
+        self.assertEqual(User.objects.filter(username__startswith='user').count(), 5)
+        self.assertEqual(History.objects.count(), 300)
+        self.assertTrue(self.client.login(username='user1', password='password'))
+
+    @override_settings(BALANCE_CHECKPOINT_EVERY=10)
+    def test_balances_match_history(self):
+        generate(distribution='zipf', checkpoints=True)
+        self.assertEqual(list(verifyCheckpoints()), [])
+        self.assertTrue(BalanceCheckpoint.objects.exists())
+        for balance in Balance.objects.select_related('user'):
+            self.assertEqual(balance.amount, calculateBalance(balance.user))
+            self.assertGreaterEqual(balance.amount, 0)
+
+    def test_failed_withdrawals_exceed_the_balance(self):
+        generate(withdraw_ratio=0.9)
+        self.assertTrue(History.objects.filter(type='withdraw', status='failure').exists())
+        self.assertFalse(History.objects.filter(type='deposit').exclude(status='success').exists())
+
+    def test_datetimes_grow_with_ids(self):
+        generate()
+        datetimes = list(History.objects.order_by('id').values_list('datetime', flat=True))
+        self.assertEqual(datetimes, sorted(datetimes))
+        self.assertLess(datetimes[-1] - datetimes[0], timedelta(days=366))
+
+    def test_same_seed_same_ledger(self):
+        def ledger():
+            return list(History.objects.order_by('id').values_list('user__username', 'amount', 'type', 'status'))
+        generate(prefix='a')
+        first = ledger()
+        History.objects.all().delete()
+        User.objects.all().delete()
+        generate(prefix='a')
+        self.assertEqual(ledger(), first)
+
+    def test_numbers_users_after_existing_ones(self):
+        generate(users=2, transactions=10)
+        generate(users=2, transactions=10)
+        self.assertEqual(
+            list(User.objects.order_by('pk').values_list('username', flat=True)),
+            ['user1', 'user2', 'user3', 'user4'],
+        )
+
+    def test_invalid_options(self):
+        with self.assertRaises(CommandError):
+            generate(users=0)
@@ -0,0 +1,63 @@
+import csv
+import gzip
+import io
+import json
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from ..models import History
+from ..views import *
+
+class HistoryExportTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.export_url = reverse('history_export')
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        other = User.objects.create_user(username='otheruser', password='testpassword')
+        History.objects.create(user=self.user, amount=10000, type='deposit', status='success')
+        History.objects.create(user=self.user, amount=3000, type='withdraw', status='success')
+        History.objects.create(user=other, amount=500, type='deposit', status='success')
+        self.client.force_login(self.user)
+
+    def content(self, response):
+        self.assertIsInstance(response, StreamingHttpResponse)
+        return b''.join(response.streaming_content)
+
+    def test_csv_export(self):
+        response = self.client.get(self.export_url)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('history.csv', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(self.content(response).decode())))
+        self.assertEqual([(r['type'], r['amount']) for r in rows], [('deposit', '100.00'), ('withdraw', '30.00')])
+
+    def test_ndjson_export(self):
+        response = self.client.get(self.export_url, {'format': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in self.content(response).decode().splitlines()]
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['type'], 'deposit')
+        self.assertEqual(rows[1]['status'], 'success')
+
+    def test_gzip_export(self):
+        response = self.client.get(self.export_url, {'format': 'csv', 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('history.csv.gz', response['Content-Disposition'])
+        text = gzip.decompress(self.content(response)).decode()
+        self.assertEqual(len(text.splitlines()), 3)
+
+    def test_blocks_are_yielded_while_streaming(self):
+        for _ in range(50):
+            History.objects.create(user=self.user, amount=1, type='deposit', status='success')
+        chunks = list(exportHistory(self.user, 'ndjson', chunk_size=10, buffer_size=500))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(sum(chunk.count(b'\n') for chunk in chunks), 52)
+
+    def test_unknown_format(self):
+        response = self.client.get(self.export_url, {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_login_required(self):
+        self.client.logout()
+        response = self.client.get(self.export_url)
+        self.assertEqual(response.status_code, 302)
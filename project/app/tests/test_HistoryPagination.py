@@ -0,0 +1,97 @@
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.urls import reverse
+from ..models import History
+from ..views import *
+
+class HistoryPaginationTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.history_url = reverse('history')
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
+        self.entries = [
+            History.objects.create(user=self.user, amount=i + 1, type='deposit', status='success')
+            for i in range(7)
+        ]
+        self.newest_first = [entry.pk for entry in reversed(self.entries)]
+
+    def page(self, **params):
+        response = self.client.get(self.history_url, {'page_size': 3, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.context['page_obj']
+
+    def test_walk_forward_and_back(self):
+        first = self.page()
+        self.assertEqual([t.pk for t in first], self.newest_first[:3])
+        self.assertFalse(first.has_previous())
+
+        second = self.page(cursor=first.next_cursor)
+        self.assertEqual([t.pk for t in second], self.newest_first[3:6])
+
+        last = self.page(cursor=second.next_cursor)
+        self.assertEqual([t.pk for t in last], self.newest_first[6:])
+        self.assertFalse(last.has_next())
+
+        back = self.page(cursor=last.previous_cursor)
+        self.assertEqual([t.pk for t in back], self.newest_first[3:6])
+        self.assertEqual([t.pk for t in self.page(cursor=back.previous_cursor)], self.newest_first[:3])
+
+    def test_rows_with_equal_datetime_are_not_skipped(self):
+        History.objects.filter(user=self.user).update(datetime=self.entries[0].datetime)
+        seen = []
+        cursor = None
+        while True:
+            page = self.page(cursor=cursor) if cursor else self.page()
+            seen.extend(t.pk for t in page)
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, self.newest_first)
+
+    def test_page_costs_the_same_deep_in_the_history(self):
+        first = self.page()
+        with self.assertNumQueries(3):
+            # Session, user and the page, the ETag comes from the view cache
+            self.client.get(self.history_url, {'page_size': 3, 'cursor': first.next_cursor})
+
+    def test_page_size_is_capped(self):
+        with self.settings(HISTORY_MAX_PAGE_SIZE=2):
+            page = self.page()
+        self.assertEqual(len(page), 2)
+
+    def test_invalid_cursor_returns_404(self):
+        response = self.client.get(self.history_url, {'cursor': 'forged'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_links_are_rendered(self):
+        response = self.client.get(self.history_url, {'page_size': 3})
+        self.assertContains(response, 'Older')
+        self.assertNotContains(response, 'Newer')
+
+    def test_balance_after_on_every_page(self):
+        History.objects.create(user=self.user, amount=5, type='withdraw', status='success')
+        History.objects.create(user=self.user, amount=500, type='withdraw', status='failure')
+        History.objects.create(user=self.user, amount=3, type='withdraw', status='success')
+        expected = []
+        balance = 0
+        for entry in History.objects.filter(user=self.user).order_by('datetime', 'id'):
+            balance += entry.signed_amount()
+            expected.append(balance)
+        expected.reverse()
+
+        first = self.page()
+        second = self.page(cursor=first.next_cursor)
+        third = self.page(cursor=second.next_cursor)
+        back = self.page(cursor=third.previous_cursor)
+        self.assertEqual([t.balance_after for t in first], expected[:3])
+        self.assertEqual([t.balance_after for t in second], expected[3:6])
+        self.assertEqual([t.balance_after for t in third], expected[6:9])
+        self.assertEqual([t.balance_after for t in back], expected[3:6])
+        self.assertEqual(first[0].balance_after, getBalance(self.user))
+
+    def test_balance_after_is_rendered(self):
+        History.objects.create(user=self.user, amount=8, type='withdraw', status='success')
+        response = self.client.get(self.history_url, {'page_size': 2})
+        self.assertContains(response, 'Balance After: 0.20')
+        self.assertContains(response, 'Balance After: 0.28')
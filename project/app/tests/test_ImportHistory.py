@@ -0,0 +1,144 @@
+import datetime
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from ..models import Balance, History, HistoryImport, calculateBalance, verifyCheckpoints
+from ..views import *
+
+CSV = '''user,datetime,type,status,amount
+Tom,2021-03-01T09:30:00Z,deposit,success,100.00
+Anna,2021-03-02,deposit,,25.5
+Tom,2021-03-03T10:00:00Z,withdraw,success,40
+Tom,2021-03-04T10:00:00Z,withdraw,failure,1000
+Anna,2021-03-05T10:00:00Z,withdraw,success,5.25
+'''
+
+
+class ImportHistoryTestCase(TestCase):
+    def setUp(self):
+        self.tom = User.objects.create_user(username='Tom', password='password')
+        self.anna = User.objects.create_user(username='Anna', password='password')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            file.write(content)
+        return path
+
+    def run_import(self, *args, **options):
+        out = StringIO()
+        call_command('import_history', *args, stdout=out, stderr=StringIO(), **options)
+        return out.getvalue()
+
+    def test_csv_import_rebuilds_balances(self):
+        Balance.objects.create(user=self.tom, amount=0)
+        out = self.run_import(self.write('history.csv', CSV))
+        self.assertIn('imported 5 row(s), skipped 0, rebuilt 2 balance(s)', out)
+        self.assertEqual(History.objects.count(), 5)
+        self.assertEqual(Balance.objects.get(user=self.tom).amount, 6000)
+        self.assertEqual(Balance.objects.get(user=self.anna).amount, 2025)
+        self.assertEqual(calculateBalance(self.tom), 6000)
+        self.assertEqual(list(verifyCheckpoints()), [])
+        entry = History.objects.get(user=self.anna, type='deposit')
+        self.assertEqual((entry.status, entry.amount), ('success', 2550))
+        self.assertEqual(entry.datetime.date(), datetime.date(2021, 3, 2))
+        self.assertIsNotNone(HistoryImport.objects.get().finished)
+
+    def test_csv_with_byte_order_mark(self):
+        self.run_import(self.write('history.csv', '\ufeff' + CSV))
+        self.assertEqual(History.objects.count(), 5)
+
+    def test_export_round_trip_with_user(self):
+        for day, amount in ((1, 1000), (2, 250)):
+            when = datetime.datetime(2021, 3, day, 12, tzinfo=datetime.timezone.utc)
+            History.objects.create(user=self.tom, type='deposit', status='success', amount=amount, datetime=when)
+        path = os.path.join(self.directory, 'tom.ndjson')
+        with open(path, 'wb') as file:
+            file.writelines(exportHistory(self.tom, format='ndjson'))
+        self.run_import(path, user='Anna')
+        self.assertEqual(
+            list(History.objects.filter(user=self.anna).order_by('id').values_list('datetime', 'type', 'status', 'amount')),
+            list(History.objects.filter(user=self.tom).order_by('id').values_list('datetime', 'type', 'status', 'amount')),
+        )
+        self.assertEqual(Balance.objects.get(user=self.anna).amount, 1250)
+
+    def test_invalid_row_stops_and_resumes_after_fix(self):
+        path = self.write('history.csv', CSV.replace('withdraw,success,40', 'withdraw,success,4O'))
+        with self.assertRaisesMessage(CommandError, '2 row(s) before it are imported'):
+            self.run_import(path, chunk_size=2)
+        self.assertEqual(History.objects.count(), 2)
+        self.write('history.csv', CSV)
+        out = self.run_import(path, chunk_size=2)
+        self.assertIn('resuming at byte', out)
+        self.assertEqual(History.objects.count(), 5)
+        self.assertEqual(Balance.objects.get(user=self.tom).amount, 6000)
+
+    def test_skip_invalid(self):
+        lines = [
+            json.dumps({'user': 'Tom', 'datetime': '2021-03-01', 'type': 'deposit', 'amount': '10'}),
+            json.dumps({'user': 'Nobody', 'datetime': '2021-03-01', 'type': 'deposit', 'amount': '10'}),
+            json.dumps({'user': 'Tom', 'datetime': 'yesterday', 'type': 'deposit', 'amount': '10'}),
+            json.dumps({'user': 'Tom', 'datetime': '2021-03-01', 'type': 'refund', 'amount': '10'}),
+            json.dumps({'user': ['Tom'], 'datetime': '2021-03-01', 'type': 'deposit', 'amount': '10'}),
+            '[1, 2]',
+            '',
+            json.dumps({'user': 'Tom', 'datetime': '2021-03-02', 'type': 'deposit', 'amount': 2.5}),
+        ]
+        out = self.run_import(self.write('history.jsonl', '\n'.join(lines)), skip_invalid=True)
+        self.assertIn('imported 2 row(s), skipped 5', out)
+        self.assertEqual(Balance.objects.get(user=self.tom).amount, 1250)
+
+    def test_interrupted_import_resumes_without_duplicates(self):
+        path = self.write('history.csv', CSV)
+        bulk_create = History.objects.bulk_create
+        calls = []
+
+        def interrupted(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return bulk_create(*args, **kwargs)
+
+        with patch.object(History.objects, 'bulk_create', side_effect=interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                self.run_import(path, chunk_size=2)
+        state = HistoryImport.objects.get()
+        self.assertEqual((state.rows, state.finished), (2, None))
+        self.assertFalse(Balance.objects.exists())
+
+        self.run_import(path, chunk_size=2)
+        self.assertEqual(History.objects.count(), 5)
+        self.assertEqual(Balance.objects.get(user=self.tom).amount, 6000)
+
+    def test_finished_file_is_not_imported_again(self):
+        path = self.write('history.csv', CSV)
+        self.run_import(path)
+        self.assertIn('use --restart', self.run_import(path))
+        self.assertEqual(History.objects.count(), 5)
+        self.run_import(path, restart=True)
+        self.assertEqual(History.objects.count(), 10)
+        self.assertEqual(Balance.objects.get(user=self.tom).amount, 12000)
+
+    def test_changed_file_is_not_resumed(self):
+        path = self.write('history.csv', CSV.replace(',40\n', ',4O\n'))
+        with self.assertRaises(CommandError):
+            self.run_import(path, chunk_size=2)
+        self.write('history.csv', CSV.replace('Tom,2021-03-01', 'Ann,2021-03-01'))
+        with self.assertRaisesMessage(CommandError, 'the file changed'):
+            self.run_import(path, chunk_size=2)
+
+    def test_unknown_user_and_format(self):
+        with self.assertRaisesMessage(CommandError, 'Unknown user'):
+            self.run_import(self.write('history.csv', CSV), user='Nobody')
+        with self.assertRaisesMessage(CommandError, 'unknown format'):
+            self.run_import(self.write('history.txt', CSV))
+        with self.assertRaises(CommandError):
+            self.run_import(os.path.join(self.directory, 'missing.csv'))
@@ -0,0 +1,94 @@
+from unittest.mock import patch
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.urls import reverse
+from ..metrics import registry
+from ..models import History
+from ..upstream import UpstreamClient
+from ..views import *
+from .currency_stub import CurrencyStub
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
+        registry.clear()
+        rate_cache.clear()
+        rate_history.clear()
+
+    def metrics(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def sample(self, text, line):
+        '''
+        Returns the value of the sample line that starts with line.
+        '''
+        for sample in text.splitlines():
+            if sample.startswith(line + ' '):
+                return float(sample.rsplit(' ', 1)[1])
+        self.fail(f'{line} not found in the metrics')
+
+    def test_request_metrics(self):
+        self.client.get(reverse('operations'))
+        self.client.get(reverse('operations'))
+        text = self.metrics()
+        self.assertEqual(self.sample(text, 'app_requests_total{view="operations",status="200"}'), 2)
+        self.assertEqual(self.sample(text, 'app_request_duration_seconds_count{view="operations"}'), 2)
+        self.assertEqual(self.sample(text, 'app_request_duration_seconds_bucket{view="operations",le="+Inf"}'), 2)
+        # Session, user and balance, then session and user with the balance from the view cache;
+        # the ETag comes from the view cache version
+        self.assertEqual(self.sample(text, 'app_request_queries_sum{view="operations"}'), 5)
+        self.assertEqual(self.sample(text, 'app_request_queries_bucket{view="operations",le="1"}'), 0)
+        self.assertEqual(self.sample(text, 'app_request_queries_bucket{view="operations",le="2"}'), 1)
+        self.assertEqual(self.sample(text, 'app_request_queries_bucket{view="operations",le="5"}'), 2)
+        self.assertGreater(self.sample(text, 'app_response_size_bytes_sum{view="operations"}'), 1000)
+        self.assertGreater(self.sample(text, 'app_db_query_seconds_total{view="operations"}'), 0)
+        self.assertGreater(self.sample(text, 'app_template_render_seconds_total{view="operations"}'), 0)
+        self.assertIn('# TYPE app_request_duration_seconds histogram', text)
+
+    def test_unmatched_and_streaming_requests(self):
+        self.client.get('/no-such-page/')
+        self.client.get(reverse('history_export'))
+        text = self.metrics()
+        self.assertEqual(self.sample(text, 'app_requests_total{view="unmatched",status="404"}'), 1)
+        self.assertEqual(self.sample(text, 'app_request_duration_seconds_count{view="history_export"}'), 1)
+        self.assertNotIn('app_response_size_bytes_count{view="history_export"}', text)
+
+    def test_upstream_time(self):
+        stub = CurrencyStub(latency=0.05).start()
+        self.addCleanup(stub.stop)
+        client = UpstreamClient(stub.url, retries=0)
+        with patch.object(rate_cache, 'fetch', client.get_json):
+            self.client.get(reverse('currency_exchange'))
+        text = self.metrics()
+        self.assertGreaterEqual(self.sample(text, 'app_upstream_seconds_total{view="currency_exchange"}'), 0.05)
+        self.assertEqual(self.sample(text, 'app_upstream_request_duration_seconds_count'), 1)
+
+    def test_n_plus_one_warning(self):
+        for amount in range(1, 13):
+            History.objects.create(user=self.user, amount=amount, type='deposit', status='success')
+        with self.assertLogs('app.metrics', 'WARNING') as logs:
+            # Every row of the admin list without list_select_related queries its user
+            self.user.is_staff = self.user.is_superuser = True
+            self.user.save()
+            self.client.get(reverse('admin:app_history_changelist'))
+        self.assertIn('Possible N+1 queries in GET /admin/app/history/', logs.output[0])
+        self.assertEqual(self.sample(self.metrics(), 'app_n_plus_one_total{view="admin:app_history_changelist"}'), 1)
+
+    def test_no_warning_below_threshold(self):
+        with self.assertNoLogs('app.metrics', 'WARNING'):
+            self.client.get(reverse('history'))
+
+    def test_only_local_clients(self):
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1').status_code, 404)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_X_FORWARDED_FOR='10.0.0.1').status_code, 404)
+
+    def test_label_values_are_escaped(self):
+        from ..metrics import CounterMetric
+        counter = CounterMetric('test_total', 'Test.', ['view'])
+        counter.inc(('a"b\\c',))
+        self.assertEqual(counter.render()[-1], 'test_total{view="a\\"b\\\\c"} 1')
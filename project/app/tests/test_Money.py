@@ -0,0 +1,51 @@
+from django.test import SimpleTestCase, TestCase, Client
+from django.contrib.auth.models import User
+from django.template import Context, Template
+from django.urls import reverse
+from ..models import History
+from ..money import formatAmount, parseAmount
+from ..views import *
+
+class MoneyTestCase(SimpleTestCase):
+    def test_parse_amount(self):
+        self.assertEqual(parseAmount('100'), 10000)
+        self.assertEqual(parseAmount('12.5'), 1250)
+        self.assertEqual(parseAmount('0.07'), 7)
+        self.assertEqual(parseAmount(' 3,10 '), 310)
+        self.assertEqual(parseAmount(42), 4200)
+
+    def test_parse_amount_rejects_invalid_input(self):
+        for value in ['', 'abc', '1.234', '-5', '1e3', None]:
+            with self.assertRaises(ValueError):
+                parseAmount(value)
+
+    def test_format_amount(self):
+        self.assertEqual(formatAmount(0), '0.00')
+        self.assertEqual(formatAmount(7), '0.07')
+        self.assertEqual(formatAmount(21500), '215.00')
+        self.assertEqual(formatAmount(-1250), '-12.50')
+
+    def test_cents_filter(self):
+        rendered = Template('{% load money %}{{ balance|cents }}').render(Context({'balance': 1999}))
+        self.assertEqual(rendered, '19.99')
+
+
+class MoneyOperationsTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
+
+    def test_amounts_are_stored_in_cents(self):
+        self.client.post(reverse('operations'), {'operation': 'deposit', 'amount': '0.10'})
+        self.client.post(reverse('operations'), {'operation': 'deposit', 'amount': '0.20'})
+        self.assertEqual(list(History.objects.values_list('amount', flat=True)), [10, 20])
+        self.assertEqual(getBalance(self.user), 30)
+        response = self.client.get(reverse('operations'))
+        self.assertContains(response, 'Your current balance: $0.30')
+
+    def test_invalid_amount_is_rejected(self):
+        response = self.client.post(reverse('operations'), {'operation': 'deposit', 'amount': '-5'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Invalid amount')
+        self.assertFalse(History.objects.exists())
@@ -0,0 +1,93 @@
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.urls import reverse
+from ..profiling import parseProfileFileName, profileFileName
+from ..views import *
+
+class ProfilingTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(PROFILE_DIR=self.directory, PROFILE_TOKEN='secret', PROFILE_SAMPLE_RATE=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
+
+    def profiles(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_requested_with_header(self):
+        response = self.client.get(reverse('history'), HTTP_X_PROFILE='secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.profiles(), [response['X-Profile-File']])
+        view, queries = parseProfileFileName(response['X-Profile-File'])
+        self.assertEqual(view, 'history')
+        self.assertGreater(queries, 0)
+
+    def test_not_profiled_without_token(self):
+        self.client.get(reverse('history'))
+        response = self.client.get(reverse('history'), HTTP_X_PROFILE='wrong')
+        self.assertNotIn('X-Profile-File', response)
+        with self.settings(PROFILE_TOKEN=None):
+            self.client.get(reverse('history'), HTTP_X_PROFILE='secret')
+        self.assertEqual(self.profiles(), [])
+
+    def test_sampled(self):
+        with self.settings(PROFILE_SAMPLE_RATE=1):
+            response = self.client.get(reverse('operations'))
+        self.assertNotIn('X-Profile-File', response)
+        self.assertEqual(len(self.profiles()), 1)
+        self.assertEqual(parseProfileFileName(self.profiles()[0])[0], 'operations')
+
+    def test_other_profiler_active(self):
+        with patch('app.profiling.cProfile.Profile') as profile:
+            profile.return_value.enable.side_effect = ValueError('Another profiling tool is already active')
+            response = self.client.get(reverse('history'), HTTP_X_PROFILE='secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-File', response)
+        self.assertEqual(self.profiles(), [])
+
+    def test_max_files(self):
+        with self.settings(PROFILE_MAX_FILES=1), self.assertLogs('app.profiling', 'WARNING'):
+            self.client.get(reverse('history'), HTTP_X_PROFILE='secret')
+            response = self.client.get(reverse('history'), HTTP_X_PROFILE='secret')
+        self.assertNotIn('X-Profile-File', response)
+        self.assertEqual(len(self.profiles()), 1)
+
+    def test_file_names(self):
+        name = profileFileName('admin:app_history_changelist', None, 0.1834)
+        self.assertTrue(name.endswith(f'-admin_app_history_changelist-q?-183ms-{os.getpid()}.prof'))
+        self.assertEqual(parseProfileFileName(name), ('admin_app_history_changelist', None))
+        self.assertIsNone(parseProfileFileName('notes.txt'))
+
+    def test_report(self):
+        for url in ('history', 'history', 'operations'):
+            self.client.get(reverse(url), HTTP_X_PROFILE='secret')
+        out = StringIO()
+        call_command('profile_report', top=5, stdout=out)
+        report = out.getvalue()
+        self.assertIn('3 profile(s)', report)
+        # The second request gets the page from the view cache
+        self.assertIn('  history: 2 request(s), 2-3 queries', report)
+        self.assertEqual(len(report.split('function\n', 1)[1].splitlines()), 5)
+
+        out = StringIO()
+        call_command('profile_report', top=50, stdout=out)
+        self.assertIn('app/views.py', out.getvalue())
+
+        out = StringIO()
+        call_command('profile_report', view=['operations'], sort='tottime', stdout=out)
+        self.assertIn('1 profile(s)', out.getvalue())
+        self.assertNotIn('history', out.getvalue())
+
+    def test_report_without_profiles(self):
+        with self.assertRaisesMessage(CommandError, 'No profiles found'):
+            call_command('profile_report', stdout=StringIO())
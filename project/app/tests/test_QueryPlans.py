@@ -0,0 +1,96 @@
+import re
+from unittest import skipUnless
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from django.db import connection
+from django.urls import reverse
+from ..models import History, applyOperation, buildCheckpoints, calculateBalance, rebuildBalances
+from ..views import *
+
+FULL_SCAN = re.compile(r'\bSCAN (app_history|app_balance)\b')
+TEMP_SORT = re.compile(r'USE TEMP B-TREE FOR (ORDER BY|RIGHT PART OF ORDER BY)')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+class QueryPlanTestCase(TestCase):
+    '''
+    Seeds a synthetic ledger, captures every query of the hot code paths and
+    fails if SQLite plans any of them as a full scan of History or Balance,
+    or sorts History rows in a temporary B-tree instead of reading them in index order.
+    '''
+    users = 3
+    rows_per_user = 3000
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(cls.users):
+            user = User.objects.create_user(username=f'ledger{i}', password='testpassword')
+            History.objects.bulk_create(
+                History(
+                    user=user,
+                    amount=(n % 50) + 1,
+                    type='deposit' if n % 3 else 'withdraw',
+                    status='failure' if n % 7 == 0 else 'success',
+                )
+                for n in range(cls.rows_per_user)
+            )
+        rebuildBalances()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.user = User.objects.get(username='ledger1')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def plans(self, function):
+        with CaptureQueriesContext(connection) as queries:
+            function()
+        plans = []
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plans.append((sql, [row[-1] for row in cursor.fetchall()]))
+        self.assertTrue(plans)
+        return plans
+
+    def assertIndexedPlans(self, function):
+        for sql, plan in self.plans(function):
+            for step in plan:
+                self.assertIsNone(FULL_SCAN.search(step), f'Full table scan in\n{sql}\n{plan}')
+                if 'app_history' in sql:
+                    self.assertIsNone(TEMP_SORT.search(step), f'Unindexed sort in\n{sql}\n{plan}')
+
+    def test_get_balance(self):
+        self.assertIndexedPlans(lambda: getBalance(self.user))
+
+    def test_calculate_balance(self):
+        self.assertIndexedPlans(lambda: calculateBalance(self.user))
+        plan = ' '.join(self.plans(lambda: calculateBalance(self.user))[-1][1])
+        self.assertIn('COVERING INDEX history_user_id_amount_idx', plan)
+
+    def test_calculate_balance_after_checkpoint(self):
+        buildCheckpoints()
+        History.objects.create(user=self.user, amount=1, type='deposit', status='success')
+        self.assertIndexedPlans(lambda: calculateBalance(self.user))
+        plan = ' '.join(self.plans(lambda: calculateBalance(self.user))[-1][1])
+        self.assertIn('COVERING INDEX history_user_id_amount_idx (user_id=? AND id>?)', plan)
+
+    def test_history_pages(self):
+        history_url = reverse('history')
+        first = self.client.get(history_url).context['page_obj']
+        second = self.client.get(history_url, {'cursor': first.next_cursor}).context['page_obj']
+
+        self.assertIndexedPlans(lambda: self.client.get(history_url))
+        self.assertIndexedPlans(lambda: self.client.get(history_url, {'cursor': first.next_cursor}))
+        self.assertIndexedPlans(lambda: self.client.get(history_url, {'cursor': second.previous_cursor}))
+
+    def test_export(self):
+        self.assertIndexedPlans(lambda: list(exportHistory(self.user)))
+
+    def test_apply_operation(self):
+        self.assertIndexedPlans(lambda: applyOperation(self.user, 'withdraw', '1'))
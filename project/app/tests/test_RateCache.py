@@ -0,0 +1,106 @@
+import threading
+from django.test import SimpleTestCase
+from ..rates import RateCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class RateCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.calls = 0
+        self.response = {'USD': 1.15}
+
+    def fetch(self):
+        self.calls += 1
+        return self.response
+
+    def test_fresh_snapshot_is_served_from_cache(self):
+        cache = RateCache(self.fetch, ttl=60, stale_ttl=300, clock=self.clock)
+        self.assertEqual(cache.get(), {'USD': 1.15})
+        self.clock.now = 59
+        self.assertEqual(cache.get(), {'USD': 1.15})
+        self.assertEqual(self.calls, 1)
+        stats = cache.stats()
+        self.assertEqual((stats['misses'], stats['hits']), (1, 1))
+
+    def test_stale_snapshot_is_served_while_refreshing(self):
+        release = threading.Event()
+        cache = RateCache(self.fetch, ttl=60, stale_ttl=300, clock=self.clock)
+        cache.get()
+
+        def slow_fetch():
+            release.wait(5)
+            return {'USD': 1.20}
+
+        cache.fetch = slow_fetch
+        self.clock.now = 100
+        self.assertEqual(cache.get(), {'USD': 1.15})
+        self.assertEqual(cache.get(), {'USD': 1.15})
+        release.set()
+        for _ in range(100):
+            if cache.stats()['refreshes']:
+                break
+            threading.Event().wait(0.01)
+
+        self.assertEqual(cache.stats()['refreshes'], 1)
+        self.assertEqual(cache.stats()['stale_hits'], 2)
+        self.assertEqual(cache.get(), {'USD': 1.20})
+
+    def test_expired_snapshot_is_fetched_synchronously(self):
+        cache = RateCache(self.fetch, ttl=60, stale_ttl=300, clock=self.clock)
+        cache.get()
+        self.response = {'USD': 1.30}
+        self.clock.now = 361
+        self.assertEqual(cache.get(), {'USD': 1.30})
+        self.assertEqual(cache.stats()['misses'], 2)
+
+    def test_failed_fetch_serves_last_good_snapshot(self):
+        cache = RateCache(self.fetch, ttl=60, stale_ttl=0, clock=self.clock)
+        cache.get()
+        self.response = None
+        self.clock.now = 1000
+        self.assertEqual(cache.get(), {'USD': 1.15})
+        self.assertEqual(cache.stats()['errors'], 1)
+
+    def test_no_snapshot_and_failed_fetch_returns_none(self):
+        def failing():
+            raise ConnectionError('upstream down')
+
+        cache = RateCache(failing, clock=self.clock)
+        self.assertIsNone(cache.get())
+        self.assertEqual(cache.stats()['errors'], 1)
+
+    def test_concurrent_misses_share_one_fetch(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_fetch():
+            self.calls += 1
+            started.set()
+            release.wait(5)
+            return {'USD': 1.15}
+
+        cache = RateCache(slow_fetch, clock=self.clock)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get())) for _ in range(5)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        for _ in range(100):
+            if cache.stats()['misses'] == 5:
+                break
+            threading.Event().wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [{'USD': 1.15}] * 5)
+        self.assertEqual(cache.stats()['misses'], 5)
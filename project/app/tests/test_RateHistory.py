@@ -0,0 +1,139 @@
+import datetime
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.urls import reverse
+from ..models import RateSnapshot
+from ..rates import RateHistory, currency_client, fetchCurrencyRates, parseTimestamp
+from ..views import *
+from .test_RateCache import FakeClock
+
+def utc(*args):
+    return datetime.datetime(*args, tzinfo=datetime.timezone.utc)
+
+
+class RateHistoryTestCase(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.history = RateHistory(refresh_interval=60, clock=self.clock)
+        self.history.record({'USD': 1.10}, fetched_at=utc(2024, 3, 1))
+        self.history.record({'USD': 1.20}, fetched_at=utc(2024, 3, 3))
+
+    def test_point_in_time_lookup(self):
+        self.assertIsNone(self.history.at(utc(2024, 2, 29)))
+        self.assertEqual(self.history.at(utc(2024, 3, 1)), (utc(2024, 3, 1), {'USD': 1.10}))
+        self.assertEqual(self.history.at(utc(2024, 3, 2, 23, 59))[1], {'USD': 1.10})
+        self.assertEqual(self.history.at(utc(2024, 3, 5))[1], {'USD': 1.20})
+        self.assertEqual(self.history.latest(), (utc(2024, 3, 3), {'USD': 1.20}))
+
+    def test_unchanged_rates_are_not_stored(self):
+        self.history.record({'USD': 1.20}, fetched_at=utc(2024, 3, 4))
+        self.assertEqual(RateSnapshot.objects.count(), 2)
+
+    def test_snapshots_from_other_processes_after_refresh_interval(self):
+        RateSnapshot.objects.create(fetched_at=utc(2024, 3, 2), rates={'USD': 1.15})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.history.at(utc(2024, 3, 2, 12))[1], {'USD': 1.10})
+        self.clock.now = 60
+        self.assertEqual(self.history.at(utc(2024, 3, 2, 12))[1], {'USD': 1.15})
+
+    def test_stored_compactly(self):
+        self.assertEqual(RateSnapshot.objects.values_list('rates', flat=True).first(), {'USD': 1.10})
+        from django.db import connection
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT rates FROM app_ratesnapshot ORDER BY id LIMIT 1')
+            self.assertEqual(cursor.fetchone()[0], '{"USD":1.1}')
+
+    def test_parse_timestamp(self):
+        self.assertEqual(parseTimestamp('2024-03-01'), utc(2024, 3, 1))
+        self.assertEqual(parseTimestamp('2024-03-01T12:30'), utc(2024, 3, 1, 12, 30))
+        self.assertEqual(parseTimestamp('2024-03-01T12:30+01:00'), utc(2024, 3, 1, 11, 30))
+        with self.assertRaises(ValueError):
+            parseTimestamp('yesterday')
+
+
+class RateHistoryViewsTestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
+        rate_cache.clear()
+        rate_history.clear()
+        RateSnapshot.objects.create(fetched_at=utc(2024, 3, 1), rates={'USD': 1.10})
+        RateSnapshot.objects.create(fetched_at=utc(2024, 3, 3), rates={'USD': 1.20})
+
+    def test_fetched_rates_are_recorded(self):
+        with patch.object(currency_client, 'get_json', lambda: {'USD': 1.15}):
+            self.assertEqual(fetchCurrencyRates(), {'USD': 1.15})
+            self.assertEqual(fetchCurrencyRates(), {'USD': 1.15})
+        self.assertEqual(RateSnapshot.objects.count(), 3)
+        self.assertEqual(rate_history.latest()[1], {'USD': 1.15})
+
+    @patch.object(rate_cache, 'fetch', lambda: None)
+    def test_falls_back_to_newest_snapshot(self):
+        data, currency_choices = getCurrencyParams()
+        self.assertEqual(data, {'USD': 1.20})
+        self.assertEqual(currency_choices, [('USD', 'USD (1.2)')])
+        response = self.client.post(reverse('currency_exchange'), {'amount': '10', 'currency': 'USD'})
+        self.assertEqual(response.context['exchanged_amount'], 12.0)
+        self.assertEqual(response.context['rates_at'], utc(2024, 3, 3))
+
+    @patch.object(rate_cache, 'fetch', lambda: {'USD': 1.15})
+    def test_exchange_at_past_time(self):
+        response = self.client.post(reverse('currency_exchange'), {'amount': '10', 'currency': 'USD'})
+        self.assertEqual(response.context['exchanged_amount'], 11.5)
+        self.assertIsNone(response.context['rates_at'])
+
+        response = self.client.post(reverse('currency_exchange'), {'amount': '10', 'currency': 'USD', 'at': '2024-03-02T10:00'})
+        self.assertEqual(response.context['exchanged_amount'], 11.0)
+        self.assertContains(response, 'Rates as of:</strong> 2024-03-01 00:00')
+
+        for at in ('2024-02-01', 'invalid'):
+            response = self.client.post(reverse('currency_exchange'), {'amount': '10', 'currency': 'USD', 'at': at})
+            self.assertIsNone(response.context['exchanged_amount'])
+
+
+class LoadRatesTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as file:
+            file.write(content)
+        return path
+
+    def test_load_csv(self):
+        path = self.write('rates.csv', 'Date,USD,GBP,\n2024-03-01,1.0842,0.8557,\n2024-03-04,1.0855,N/A,\n')
+        out = StringIO()
+        call_command('load_rates', path, stdout=out)
+        self.assertIn('Loaded 2 snapshot(s), 0 already stored', out.getvalue())
+        self.assertEqual(RateSnapshot.objects.get(fetched_at=utc(2024, 3, 4)).rates, {'USD': 1.0855})
+
+        out = StringIO()
+        call_command('load_rates', path, stdout=out)
+        self.assertIn('Loaded 0 snapshot(s), 2 already stored', out.getvalue())
+
+    def test_load_ndjson_and_json(self):
+        ndjson = self.write('rates.ndjson', '{"fetched_at": "2024-03-01T16:00:00Z", "rates": {"USD": 1.08}}\n\n'
+                                            '{"fetched_at": "2024-03-02T16:00:00Z", "rates": {"USD": 1.09}}\n')
+        array = self.write('rates.json', '[{"fetched_at": "2024-03-03", "rates": {"USD": 1.1}}]')
+        call_command('load_rates', ndjson, array, batch_size=1, stdout=StringIO())
+        self.assertEqual(
+            list(RateSnapshot.objects.order_by('fetched_at').values_list('fetched_at', flat=True)),
+            [utc(2024, 3, 1, 16), utc(2024, 3, 2, 16), utc(2024, 3, 3)],
+        )
+
+    def test_invalid_files(self):
+        with self.assertRaisesMessage(CommandError, ':2: Invalid timestamp'):
+            call_command('load_rates', self.write('rates.csv', 'date,USD\nsoon,1.0\n'), stdout=StringIO())
+        with self.assertRaisesMessage(CommandError, 'unknown format'):
+            call_command('load_rates', self.write('rates.txt', ''), stdout=StringIO())
+        with self.assertRaisesMessage(CommandError, 'invalid snapshot'):
+            call_command('load_rates', self.write('rates.jsonl', '{"rates": {}}\n'), stdout=StringIO())
@@ -0,0 +1,117 @@
+import json
+from unittest.mock import patch
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.urls import reverse
+from ..models import History
+from ..views import *
+
+RATES = {'EUR': 1.0, 'USD': 1.15}
+
+class ReadAPITestCase(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
+        History.objects.create(user=self.user, amount=10000, type='deposit', status='success')
+        History.objects.create(user=self.user, amount=2500, type='withdraw', status='success')
+        rate_cache.clear()
+        rate_history.clear()
+
+    def test_balance(self):
+        response = self.client.get(reverse('api_balance'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'{"username":"testuser","balance":"75.00"}')
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_balance_conditional_get(self):
+        etag = self.client.get(reverse('api_balance'))['ETag']
+        response = self.client.get(reverse('api_balance'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        History.objects.create(user=self.user, amount=100, type='deposit', status='success')
+        response = self.client.get(reverse('api_balance'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etags_of_other_users_differ(self):
+        other = User.objects.create_user(username='other', password='testpassword')
+        History.objects.create(user=other, amount=7500, type='deposit', status='success')
+        client = Client()
+        client.force_login(other)
+        for name in ('api_balance', 'api_history', 'api_history_all'):
+            response = self.client.get(reverse(name))
+            self.assertIn('Cookie', response['Vary'])
+            response = client.get(reverse(name), HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 200)
+
+    def test_history_pages(self):
+        first = self.client.get(reverse('api_history'), {'page_size': 1}).json()
+        self.assertEqual(len(first['results']), 1)
+        self.assertEqual(first['results'][0]['type'], 'withdraw')
+        self.assertEqual(first['results'][0]['amount'], '25.00')
+        self.assertEqual(first['results'][0]['balance_after'], '75.00')
+        self.assertIsNone(first['previous'])
+
+        second = self.client.get(reverse('api_history'), {'page_size': 1, 'cursor': first['next']}).json()
+        self.assertEqual(second['results'][0]['balance_after'], '100.00')
+        self.assertIsNone(second['next'])
+
+        response = self.client.get(reverse('api_history'), {'cursor': 'forged'})
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('ETag', response)
+
+    def test_history_conditional_get_skips_the_page_query(self):
+        etag = self.client.get(reverse('api_history'))['ETag']
+        with self.assertNumQueries(2):
+            # Session and user, the ETag comes from the view cache version
+            response = self.client.get(reverse('api_history'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_history_edits_and_deletes_change_etag(self):
+        entry = History.objects.get(type='deposit')
+        for name in ('api_history', 'api_history_all'):
+            etag = self.client.get(reverse(name))['ETag']
+            entry.amount += 700
+            entry.save()
+            response = self.client.get(reverse(name), HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+        etag = self.client.get(reverse('api_history'))['ETag']
+        entry.delete()
+        response = self.client.get(reverse('api_history'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual([row['amount'] for row in response.json()['results']], ['25.00'])
+
+    def test_history_stream(self):
+        response = self.client.get(reverse('api_history_all'))
+        self.assertTrue(response.streaming)
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([(row['type'], row['amount']) for row in rows], [('deposit', '100.00'), ('withdraw', '25.00')])
+
+    def test_empty_history_stream(self):
+        History.objects.all().delete()
+        response = self.client.get(reverse('api_history_all'))
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), [])
+
+    @patch.object(rate_cache, 'fetch', lambda: None)
+    def test_exchange_unavailable(self):
+        self.assertEqual(self.client.get(reverse('api_exchange')).status_code, 503)
+
+    @patch.object(rate_cache, 'fetch', lambda: RATES)
+    def test_exchange(self):
+        self.assertEqual(self.client.get(reverse('api_exchange')).json(), {'rates': RATES})
+        data = self.client.get(reverse('api_exchange'), {'currency': 'USD', 'amount': '10'}).json()
+        self.assertEqual((data['amount'], data['exchanged_amount']), ('10.00', '11.50'))
+        self.assertEqual(self.client.get(reverse('api_exchange'), {'currency': 'XXX', 'amount': '1'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_exchange'), {'currency': 'USD', 'amount': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_exchange'), {'currency': 'USD', 'amount': '100000000'}).status_code, 400)
+        # 10 * 1.15 is 11.499999999999998 as a float, exactly 11.5 cents
+        data = self.client.get(reverse('api_exchange'), {'currency': 'USD', 'amount': '0.10'}).json()
+        self.assertEqual(data['exchanged_amount'], '0.12')
+
+    def test_login_required(self):
+        self.client.logout()
+        for name in ('api_balance', 'api_history', 'api_history_all', 'api_exchange'):
+            self.assertEqual(self.client.get(reverse(name)).status_code, 401)
@@ -0,0 +1,105 @@
+import os
+import tempfile
+import threading
+from unittest.mock import patch
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.urls import reverse
+from ..models import Balance, History, applyOperation, calculateBalance
+from ..sqlite import WriteQueue, runWrite, write_queue
+from ..views import *
+
+class SqliteConnectionTestCase(TestCase):
+    def open(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        wrapper = DatabaseWrapper({**connection.settings_dict, 'NAME': os.path.join(directory.name, 'db.sqlite3')})
+        wrapper.ensure_connection()
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        return wrapper.connection.execute(f'PRAGMA {name}').fetchone()[0]
+
+    @override_settings(SQLITE_PRODUCTION=True)
+    def test_production_pragmas(self):
+        wrapper = self.open()
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 5000)
+        self.assertEqual(self.pragma(wrapper, 'cache_size'), -65536)
+
+    def test_defaults_unchanged(self):
+        wrapper = self.open()
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'delete')
+
+    @override_settings(SQLITE_PRODUCTION=True, SQLITE_PRAGMAS={'journal_mode': 'wal; DROP TABLE app_history'})
+    def test_invalid_pragma(self):
+        with self.assertRaises(ValueError):
+            self.open()
+
+    @override_settings(SQLITE_WRITE_QUEUE=True)
+    def test_runs_directly_inside_transaction(self):
+        user = User.objects.create_user(username='Tom', password='password')
+        with patch.object(write_queue, 'submit', side_effect=AssertionError):
+            entry, balance = runWrite(applyOperation, user, 'deposit', 500)
+        self.assertEqual(balance, 500)
+
+
+class WriteQueueTestCase(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Tom', password='password')
+        self.queue = WriteQueue(max_batch=100)
+        self.batches = []
+        write = self.queue.write
+        self.queue.write = lambda batch: (self.batches.append(len(batch)), write(batch))
+
+    def test_group_commit(self):
+        started, release = threading.Event(), threading.Event()
+
+        def blocker():
+            started.set()
+            release.wait(5)
+            return applyOperation(self.user, 'deposit', 100)
+
+        first = self.queue.submit(blocker)
+        started.wait(5)
+        futures = [self.queue.submit(applyOperation, self.user, 'withdraw', 30) for _ in range(5)]
+        release.set()
+        self.assertEqual(first.result(5)[1], 100)
+        results = [future.result(5) for future in futures]
+        self.assertEqual([entry.status for entry, _ in results], ['success'] * 3 + ['failure'] * 2)
+        self.assertEqual([balance for _, balance in results], [70, 40, 10, 10, 10])
+        self.assertEqual(self.batches, [1, 5])
+        self.assertEqual(Balance.objects.get(pk=self.user.pk).amount, 10)
+        self.assertEqual(calculateBalance(self.user), 10)
+
+    def test_failing_write_is_rolled_back_alone(self):
+        def failing():
+            History.objects.create(user=self.user, type='deposit', status='success', amount=999)
+            raise RuntimeError('boom')
+
+        started, release = threading.Event(), threading.Event()
+        first = self.queue.submit(lambda: (started.set(), release.wait(5)))
+        started.wait(5)
+        failed = self.queue.submit(failing)
+        ok = self.queue.submit(applyOperation, self.user, 'deposit', 100)
+        release.set()
+        first.result(5)
+        with self.assertRaisesMessage(RuntimeError, 'boom'):
+            failed.result(5)
+        self.assertEqual(ok.result(5)[1], 100)
+        self.assertEqual(self.batches, [1, 2])
+        self.assertEqual(calculateBalance(self.user), 100)
+        self.assertEqual(History.objects.count(), 1)
+
+    @override_settings(SQLITE_WRITE_QUEUE=True)
+    def test_operations_view_through_queue(self):
+        client = Client()
+        client.login(username='Tom', password='password')
+        response = client.post(reverse('operations'), {'operation': 'deposit', 'amount': '12.50'})
+        self.assertEqual(response.context['balance'], 1250)
+        self.assertTrue(write_queue.thread.is_alive())
+        self.assertEqual(Balance.objects.get(pk=self.user.pk).amount, 1250)
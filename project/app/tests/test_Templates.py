@@ -0,0 +1,54 @@
+from django.test import TestCase, Client
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+import datetime
+from django.template import Template, Context, engines
+from django.template.loaders.cached import Loader as CachedLoader
+from django.urls import reverse
+from django.utils import timezone
+from ..views import *
+
+class TemplatesTestCase(TestCase):
+    def setUp(self):
+        caches['template_fragments'].clear()
+        caches['views'].clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
+
+    def test_cached_loader(self):
+        loaders = engines.all()[0].engine.template_loaders
+        self.assertEqual(len(loaders), 1)
+        self.assertIsInstance(loaders[0], CachedLoader)
+        engines.all()[0].get_template('app/history.html')
+        self.assertIn('app/history.html', loaders[0].get_template_cache)
+
+    def test_pages_extend_base(self):
+        for name in ('main_menu', 'operations', 'history', 'create_account', 'login'):
+            response = self.client.get(reverse(name))
+            self.assertTemplateUsed(response, 'app/base.html')
+            self.assertContains(response, 'bootstrap.min.css', count=1)
+            self.assertContains(response, 'bootstrap.bundle.min.js', count=1)
+            self.assertContains(response, '<title>', count=1)
+
+    def test_navbar_fragment(self):
+        self.client.get(reverse('operations'))
+        cache = caches['template_fragments']
+        self.assertIsNotNone(cache.get(make_template_fragment_key('navbar', ['testuser'])))
+        self.assertIsNotNone(cache.get(make_template_fragment_key('stylesheets')))
+        self.assertIsNotNone(cache.get(make_template_fragment_key('scripts')))
+
+        other = User.objects.create_user(username='other', password='testpassword')
+        client = Client()
+        client.force_login(other)
+        response = client.get(reverse('history'))
+        self.assertContains(response, 'Hello other')
+        self.assertNotContains(response, 'Hello testuser')
+        self.assertContains(self.client.get(reverse('history')), 'Hello testuser')
+
+    def test_strftime_matches_date_filter(self):
+        value = datetime.datetime(2024, 3, 8, 21, 5, 9, tzinfo=datetime.timezone.utc)
+        template = Template('{% load dates %}{{ value|date:"d/m/Y H:i:s" }}|{{ value|strftime:"%d/%m/%Y %H:%M:%S" }}|{{ none|strftime:"%Y" }}')
+        with timezone.override('Europe/Berlin'):
+            self.assertEqual(template.render(Context({'value': value, 'none': None})), '08/03/2024 22:05:09|08/03/2024 22:05:09|')
@@ -2,6 +2,7 @@ from django.test import TestCase
 from django.contrib.auth.models import User
 from django.template.loader import render_to_string
 from ..models import History  
+from ..money import formatAmount
 from ..views import *
 
 
@@ -11,20 +12,23 @@ class TransactionHistoryTemplateTestCase(TestCase):
 
     def setUp(self):
         self.user = User.objects.create_user(username='testuser', password='testpassword')
-        History.objects.create(user=self.user, status='success', amount=100)
-        History.objects.create(user=self.user, status='failure', amount=50)
-        History.objects.create(user=self.user, status='success', amount=75)
+        History.objects.create(user=self.user, status='success', amount=10000, type='deposit')
+        History.objects.create(user=self.user, status='failure', amount=5000, type='withdraw')
+        History.objects.create(user=self.user, status='success', amount=7500, type='deposit')
 
 
     def test_transaction_history_rendering(self):
-        transactions = History.objects.all()
+        transactions = KeysetPaginator(
+            History.objects.filter(user=self.user), 10, running_sum=signedAmount(), total=getBalance(self.user)
+        ).page().object_list
         context = {'transactions': transactions}
         rendered = render_to_string('app/history.html', context)
 
         for transaction in transactions:
             self.assertInHTML(f'Date: {transaction.datetime.strftime("%d/%m/%Y %H:%M:%S")}', rendered)
             self.assertInHTML(f'Status: {transaction.status}', rendered)
-            self.assertInHTML(f'Balance After: {transaction.amount}', rendered)
+            self.assertInHTML(f'Balance After: {formatAmount(transaction.balance_after)}', rendered)
+        self.assertEqual([t.balance_after for t in transactions], [17500, 10000, 10000])
 
     def test_empty_transaction_history_rendering(self):
         context = {'transactions': []}
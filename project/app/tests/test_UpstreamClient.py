@@ -0,0 +1,89 @@
+from django.test import SimpleTestCase
+from ..upstream import CircuitBreaker, CircuitOpenError, UpstreamClient, UpstreamError
+from .currency_stub import RATES, CurrencyStub
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class UpstreamClientTestCase(SimpleTestCase):
+    def setUp(self):
+        self.stub = CurrencyStub().start()
+        self.addCleanup(self.stub.stop)
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=self.clock)
+
+    def upstream(self, **kwargs):
+        options = {'connect_timeout': 1, 'read_timeout': 0.5, 'retries': 2, 'backoff': 0.01, 'breaker': self.breaker}
+        options.update(kwargs)
+        return UpstreamClient(self.stub.url, **options)
+
+    def test_connections_are_reused(self):
+        client = self.upstream()
+        for _ in range(5):
+            self.assertEqual(client.get_json(), RATES)
+        self.assertEqual(self.stub.requests, 5)
+        self.assertEqual(self.stub.connections, 1)
+
+    def test_server_errors_are_retried(self):
+        self.stub.fail_next = 2
+        self.assertEqual(self.upstream().get_json(), RATES)
+        self.assertEqual(self.stub.requests, 3)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_client_errors_are_not_retried(self):
+        self.stub.status = 404
+        with self.assertRaises(UpstreamError):
+            self.upstream().get_json()
+        self.assertEqual(self.stub.requests, 1)
+        self.assertEqual(self.breaker.failures, 0)
+
+    def test_slow_upstream_times_out(self):
+        self.stub.latency = 1
+        with self.assertRaises(UpstreamError):
+            self.upstream(read_timeout=0.1, retries=1).get_json()
+        self.assertEqual(self.stub.requests, 2)
+
+    def test_breaker_opens_and_fails_fast(self):
+        self.stub.status = 503
+        client = self.upstream(retries=0)
+        for _ in range(2):
+            with self.assertRaises(UpstreamError):
+                client.get_json()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+        with self.assertRaises(CircuitOpenError):
+            client.get_json()
+        self.assertEqual(self.stub.requests, 2)
+
+    def test_breaker_closes_after_successful_trial(self):
+        self.stub.down = True
+        client = self.upstream(retries=0)
+        for _ in range(2):
+            with self.assertRaises(UpstreamError):
+                client.get_json()
+        self.stub.down = False
+
+        self.clock.now = 29
+        with self.assertRaises(CircuitOpenError):
+            client.get_json()
+        self.clock.now = 30
+        self.assertEqual(client.get_json(), RATES)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_trial_opens_the_breaker_again(self):
+        self.stub.status = 503
+        client = self.upstream(retries=0)
+        for _ in range(2):
+            with self.assertRaises(UpstreamError):
+                client.get_json()
+        self.clock.now = 30
+        with self.assertRaises(UpstreamError):
+            client.get_json()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            client.get_json()
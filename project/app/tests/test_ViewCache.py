@@ -0,0 +1,127 @@
+import json
+from django.test import TestCase, Client, override_settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.urls import reverse
+from ..metrics import registry, view_cache_lookups
+from ..models import Balance, History, rebuildBalances
+from ..viewcache import userVersionKey
+from ..views import *
+
+class ViewCacheTestCase(TestCase):
+    def setUp(self):
+        caches['views'].clear()
+        registry.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.client.force_login(self.user)
+        History.objects.create(user=self.user, amount=10000, type='deposit', status='success')
+
+    def lookups(self, name):
+        return {result: view_cache_lookups.series.get((name, result), 0) for result in ('hit', 'miss')}
+
+    def test_balance_fragment(self):
+        self.client.get(reverse('operations'))
+        with self.assertNumQueries(2):
+            # Session and user, the ETag and the balance come from the cache
+            response = self.client.get(reverse('operations'))
+        self.assertContains(response, 'Your current balance: $100.00')
+        self.assertEqual(response.context['balance'], 10000)
+        self.assertEqual(self.lookups('balance'), {'hit': 1, 'miss': 1})
+
+        self.client.post(reverse('operations'), {'operation': 'withdraw', 'amount': '40'})
+        self.assertContains(self.client.get(reverse('operations')), 'Your current balance: $60.00')
+        self.assertContains(self.client.get(reverse('api_balance')), '"balance":"60.00"')
+
+    def test_history_page(self):
+        self.client.get(reverse('history'))
+        response = self.client.get(reverse('history'))
+        self.assertEqual(len(response.context['transactions']), 1)
+        self.assertEqual(self.lookups('history'), {'hit': 1, 'miss': 1})
+
+        entry = History.objects.create(user=self.user, amount=2500, type='withdraw', status='success')
+        response = self.client.get(reverse('history'))
+        self.assertEqual(len(response.context['transactions']), 2)
+        self.assertContains(response, 'Balance After: 75.00')
+
+        entry.delete()
+        response = self.client.get(reverse('history'))
+        self.assertEqual(len(response.context['transactions']), 1)
+
+    def test_pages_are_cached_separately(self):
+        History.objects.create(user=self.user, amount=2500, type='withdraw', status='success')
+        first = self.client.get(reverse('history'), {'page_size': 1}).context['page_obj']
+        second = self.client.get(reverse('history'), {'page_size': 1, 'cursor': first.next_cursor}).context['page_obj']
+        self.assertNotEqual(first[0].pk, second[0].pk)
+        self.assertEqual(self.lookups('history'), {'hit': 0, 'miss': 2})
+        self.assertEqual(self.client.get(reverse('history'), {'cursor': 'forged'}).status_code, 404)
+
+    def test_other_users_are_not_invalidated(self):
+        other = User.objects.create_user(username='other', password='testpassword')
+        self.client.get(reverse('operations'))
+        History.objects.create(user=other, amount=100, type='deposit', status='success')
+        self.client.get(reverse('operations'))
+        self.assertEqual(self.lookups('balance'), {'hit': 1, 'miss': 1})
+
+    def test_batch_operations_invalidate(self):
+        self.client.get(reverse('operations'))
+        self.client.post(
+            reverse('api_batch_operations'), json.dumps({'operations': [{'type': 'deposit', 'amount': '5'}]}),
+            content_type='application/json',
+        )
+        self.assertContains(self.client.get(reverse('operations')), 'Your current balance: $105.00')
+
+    def test_rebuild_invalidates(self):
+        self.client.get(reverse('operations'))
+        Balance.objects.filter(pk=self.user.pk).update(amount=1)
+        rebuildBalances([self.user.pk])
+        self.client.get(reverse('operations'))
+        Balance.objects.filter(pk=self.user.pk).update(amount=1)
+        rebuildBalances()
+        self.client.get(reverse('operations'))
+        self.assertEqual(self.lookups('balance'), {'hit': 0, 'miss': 3})
+
+    def test_invalidated_again_on_commit(self):
+        self.client.get(reverse('operations'))
+        version = caches['views'].get(userVersionKey(self.user.pk))
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            History.objects.create(user=self.user, amount=100, type='deposit', status='success')
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(caches['views'].get(userVersionKey(self.user.pk)), version + 2)
+
+    def test_evicted_version_starts_higher(self):
+        self.client.get(reverse('operations'))
+        version = caches['views'].get(userVersionKey(self.user.pk))
+        caches['views'].delete(userVersionKey(self.user.pk))
+        self.client.get(reverse('operations'))
+        self.assertGreater(caches['views'].get(userVersionKey(self.user.pk)), version)
+        self.assertEqual(self.lookups('balance'), {'hit': 0, 'miss': 2})
+
+    def test_main_menu(self):
+        self.client.get(reverse('main_menu'))
+        response = self.client.get(reverse('main_menu'))
+        self.assertContains(response, 'Hello testuser')
+        self.assertEqual(self.lookups('main_menu'), {'hit': 1, 'miss': 1})
+
+    def test_api_history(self):
+        first = self.client.get(reverse('api_history'))
+        with self.assertNumQueries(2):
+            # Session and user, the ETag comes from the view cache version
+            second = self.client.get(reverse('api_history'))
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(second['Content-Type'], 'application/json')
+        self.assertEqual(self.client.get(reverse('api_history'), {'cursor': 'forged'}).status_code, 400)
+
+    def test_hit_ratio_metric(self):
+        self.client.get(reverse('operations'))
+        self.client.get(reverse('operations'))
+        text = registry.render()
+        self.assertIn('app_view_cache_lookups_total{name="balance",result="hit"} 1', text)
+        self.assertIn('app_view_cache_lookups_total{name="balance",result="miss"} 1', text)
+
+    @override_settings(VIEW_CACHE_ALIAS=None)
+    def test_disabled(self):
+        self.client.get(reverse('operations'))
+        response = self.client.get(reverse('operations'))
+        self.assertContains(response, 'Your current balance: $100.00')
+        self.assertEqual(self.lookups('balance'), {'hit': 0, 'miss': 0})
@@ -0,0 +1,227 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+from django.conf import settings
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from .metrics import upstreamTimer
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamError(Exception):
+    '''
+    Raised when the upstream could not be reached or did not return a usable response.
+    '''
+
+
+class CircuitOpenError(UpstreamError):
+    '''
+    Raised without contacting the upstream while the circuit breaker is open.
+    '''
+
+
+class CircuitBreaker:
+    '''
+    A circuit breaker with the classic closed / open / half-open states.
+
+    failure_threshold - number of consecutive failed calls that open the circuit.
+    reset_timeout - number of seconds the circuit stays open before a single trial call is let through.
+
+    While the circuit is open, allow() returns False so callers can fail fast.
+    A successful trial call closes the circuit, a failed one opens it again.
+    '''
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def allow(self):
+        '''
+        Returns True if a call may be made now.
+        '''
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning('Circuit opened after %s consecutive failure(s)', self.failures)
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+
+class UpstreamClient:
+    '''
+    A shared HTTP client for one upstream JSON API.
+
+    The underlying requests.Session keeps connections alive in a pool of pool_size connections
+    per host, so repeated calls do not pay for a new TCP/TLS handshake.
+    Every request is bounded by connect_timeout and read_timeout.
+    Connection errors, timeouts and 5xx responses are retried up to retries times,
+    sleeping a random time between 0 and backoff * 2 ** attempt seconds (capped at max_backoff)
+    between attempts. A call that still fails counts as one failure for the circuit breaker.
+    '''
+    def __init__(self, url, connect_timeout=3.05, read_timeout=5, retries=2, backoff=0.2,
+                 max_backoff=2, pool_size=10, breaker=None):
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get_json(self):
+        '''
+        Makes a GET request to the url and returns the decoded JSON body.
+        Raises CircuitOpenError while the circuit is open and UpstreamError when every attempt failed.
+        '''
+        if not self.breaker.allow():
+            raise CircuitOpenError(f'Circuit open for {self.url}')
+
+        for attempt in range(self.retries + 1):
+            try:
+                with upstreamTimer():
+                    response = self.session.get(self.url, timeout=self.timeout)
+            except requests.RequestException as e:
+                error = e
+            else:
+                ok, result = self.decode(response)
+                if ok:
+                    return result
+                error = result
+            if attempt < self.retries:
+                time.sleep(self.delay(attempt))
+
+        self.fail(error)
+
+    def decode(self, response):
+        '''
+        Checks a response and returns (True, decoded JSON body) or (False, the error to retry).
+        Raises UpstreamError for a client error, which is not retried.
+        '''
+        if response.status_code == 200:
+            try:
+                data = response.json()
+            except ValueError as e:
+                return False, e
+            self.breaker.record_success()
+            return True, data
+        if response.status_code < 500:
+            # The upstream is up, retrying a client error would not help
+            self.breaker.record_success()
+            raise UpstreamError(f'{self.url} returned {response.status_code}')
+        return False, UpstreamError(f'{self.url} returned {response.status_code}')
+
+    def delay(self, attempt):
+        '''
+        Returns the jittered number of seconds to wait before the retry after the attempt.
+        '''
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def fail(self, error):
+        self.breaker.record_failure()
+        raise UpstreamError(f'{self.url} failed after {self.retries + 1} attempt(s): {error}') from error
+
+
+class AsyncUpstreamClient(UpstreamClient):
+    '''
+    UpstreamClient for asyncio code: get_json() is a coroutine and requests are made with
+    an httpx.AsyncClient, so waiting for the upstream does not occupy a thread.
+    Timeouts, retries and the circuit breaker behave as in UpstreamClient; a breaker
+    can be shared with the synchronous client of the same upstream.
+
+    An httpx.AsyncClient and its connection pool belong to one event loop,
+    so one is created lazily for every loop the client is used from.
+    '''
+    def __init__(self, url, connect_timeout=3.05, read_timeout=5, retries=2, backoff=0.2,
+                 max_backoff=2, pool_size=10, breaker=None):
+        self.url = url
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self._clients = weakref.WeakKeyDictionary()
+
+    @property
+    def session(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+        return client
+
+    async def get_json(self):
+        '''
+        Makes a GET request to the url and returns the decoded JSON body.
+        Raises CircuitOpenError while the circuit is open and UpstreamError when every attempt failed.
+        '''
+        if not self.breaker.allow():
+            raise CircuitOpenError(f'Circuit open for {self.url}')
+
+        for attempt in range(self.retries + 1):
+            try:
+                with upstreamTimer():
+                    response = await self.session.get(self.url)
+            except httpx.HTTPError as e:
+                error = e
+            else:
+                ok, result = self.decode(response)
+                if ok:
+                    return result
+                error = result
+            if attempt < self.retries:
+                await asyncio.sleep(self.delay(attempt))
+
+        self.fail(error)
+
+
+currency_breaker = CircuitBreaker(
+    failure_threshold=settings.CURRENCY_API_BREAKER_THRESHOLD,
+    reset_timeout=settings.CURRENCY_API_BREAKER_RESET,
+)
+currency_options = {
+    'connect_timeout': settings.CURRENCY_API_CONNECT_TIMEOUT,
+    'read_timeout': settings.CURRENCY_API_READ_TIMEOUT,
+    'retries': settings.CURRENCY_API_RETRIES,
+    'backoff': settings.CURRENCY_API_BACKOFF,
+    'pool_size': settings.CURRENCY_API_POOL_SIZE,
+    'breaker': currency_breaker,
+}
+currency_client = UpstreamClient(settings.CURRENCY_API_URL, **currency_options)
+async_currency_client = AsyncUpstreamClient(settings.CURRENCY_API_URL, **currency_options)
@@ -1,12 +1,25 @@
 from django.urls import path
 from .views import *
+from .async_views import AsyncBalanceOperationsView, AsyncCurrencyExchangeView, AsyncTransactionHistoryView
+from .api import BalanceAPIView, BatchExchangeAPIView, BatchOperationsView, ExchangeAPIView, HistoryAPIView, HistoryStreamAPIView
 
 urlpatterns = [
     path('', MainMenuView.as_view(), name='main_menu'),
     path('auth/', CustomLoginView.as_view(), name='login'),
     path('create_account/', CreateUserView.as_view(), name='create_account'),
     path('logout/', logout_view, name='logout'),
+    path('metrics/', metrics_view, name='metrics'),
     path('operations/', BalanceOperationsView.as_view(), name='operations'),
     path('currency_exchange/', CurrencyExchangeView.as_view(), name='currency_exchange'),
     path('history/', ViewTransactionHistoryView.as_view(), name='history'),
+    path('history/export/', TransactionExportView.as_view(), name='history_export'),
+    path('async/operations/', AsyncBalanceOperationsView.as_view(), name='async_operations'),
+    path('async/currency_exchange/', AsyncCurrencyExchangeView.as_view(), name='async_currency_exchange'),
+    path('async/history/', AsyncTransactionHistoryView.as_view(), name='async_history'),
+    path('api/balance/', BalanceAPIView.as_view(), name='api_balance'),
+    path('api/history/', HistoryAPIView.as_view(), name='api_history'),
+    path('api/history/all/', HistoryStreamAPIView.as_view(), name='api_history_all'),
+    path('api/exchange/', ExchangeAPIView.as_view(), name='api_exchange'),
+    path('api/exchange/batch/', BatchExchangeAPIView.as_view(), name='api_batch_exchange'),
+    path('api/operations/batch/', BatchOperationsView.as_view(), name='api_batch_operations'),
 ]
@@ -0,0 +1,130 @@
+'''
+Per-user cache of rendered page fragments and API payloads.
+
+A user's balance and history change only when a History row of the user is written, so the views cache
+what they compute from them (the balance fragment, history pages, the main menu and the JSON payloads
+of the balance and history API) in the cache settings.VIEW_CACHE_ALIAS, for settings.VIEW_CACHE_TIMEOUT seconds.
+
+Entries are never deleted. Their keys contain a version counter of the user, which invalidateUsers() increments
+whenever the user's data changes: post_save and post_delete of History call it, and so do the writes that
+bypass the signals (applyOperations and rebuildBalances). A global counter, bumped by invalidateAll(), is part of
+every key too. Old entries are simply not read anymore and expire. The counters are bumped right away,
+so the writer itself never reads a stale entry, and once more when the transaction commits, so an entry that a
+concurrent request computed from the data before the commit is not found afterwards.
+A counter that is missing (never used or evicted) starts at the current time in nanoseconds,
+which is larger than any value it had before, so it never returns to a version that entries were stored under.
+
+Every lookup is counted in the app_view_cache_lookups_total metric by entry name and result (hit or miss),
+the hit ratio of an entry is hit / (hit + miss).
+'''
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from .metrics import view_cache_lookups
+
+GLOBAL_VERSION_KEY = 'version'
+
+_missing = object()
+
+
+def userVersionKey(user_id):
+    return f'version:{user_id}'
+
+
+def getViewCache():
+    '''
+    Returns the cache of settings.VIEW_CACHE_ALIAS, or None if the view cache is disabled.
+    '''
+    if settings.VIEW_CACHE_ALIAS is None:
+        return None
+    return caches[settings.VIEW_CACHE_ALIAS]
+
+
+def _versions(cache, user_id):
+    '''
+    Returns the global and the user's version counter, starting missing counters.
+    '''
+    keys = [GLOBAL_VERSION_KEY, userVersionKey(user_id)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key, time.time_ns())
+    return versions[keys[0]], versions[keys[1]]
+
+
+def cachedForUser(user, name, compute, *variant):
+    '''
+    Returns the value of the entry name of the user for the variant (e.g. a cursor and a page size),
+    calling compute() to produce and store it on a miss. Exceptions of compute() are not cached.
+
+    The key also contains the time the user joined, so a user that gets the id of a deleted one
+    (ids of rolled back inserts are reused, as in tests) never sees the entries of the old user.
+    '''
+    cache = getViewCache()
+    if cache is None:
+        return compute()
+    versions = _versions(cache, user.pk)
+    digest = hashlib.md5(repr((user.date_joined.timestamp(), versions, variant)).encode(), usedforsecurity=False).hexdigest()
+    key = f'view:{name}:{user.pk}:{digest}'
+    value = cache.get(key, _missing)
+    if value is not _missing:
+        view_cache_lookups.inc((name, 'hit'))
+        return value
+    view_cache_lookups.inc((name, 'miss'))
+    value = compute()
+    cache.set(key, value, settings.VIEW_CACHE_TIMEOUT)
+    return value
+
+
+def userVersion(user):
+    '''
+    Returns the versions the user's entries are currently stored under, or None if the view cache is disabled.
+    It changes whenever the user's entries are invalidated, i.e. on every change of the user's balance or history,
+    so it also serves as the validator (ETag) of responses computed from them.
+    '''
+    cache = getViewCache()
+    if cache is None:
+        return None
+    return (user.date_joined.timestamp(), *_versions(cache, user.pk))
+
+
+def _bump(cache, keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            # A missing counter starts from a new value on its next use
+            pass
+
+
+def invalidateUsers(user_ids):
+    '''
+    Invalidates the cached entries of the users, now and when the current transaction commits.
+    '''
+    cache = getViewCache()
+    if cache is None:
+        return
+    keys = [userVersionKey(user_id) for user_id in set(user_ids)]
+    _bump(cache, keys)
+    transaction.on_commit(lambda: _bump(cache, keys))
+
+
+def invalidateAll():
+    '''
+    Invalidates the cached entries of every user, now and when the current transaction commits.
+    '''
+    cache = getViewCache()
+    if cache is None:
+        return
+    _bump(cache, [GLOBAL_VERSION_KEY])
+    transaction.on_commit(lambda: _bump(cache, [GLOBAL_VERSION_KEY]))
+
+
+def historyChanged(sender, instance, **kwargs):
+    '''
+    A post_save and post_delete receiver of History that invalidates the entries of the row's user.
+    '''
+    invalidateUsers([instance.user_id])
@@ -3,63 +3,188 @@ from django.contrib.auth.models import User
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import LoginView
 from django.contrib.auth import logout
-from django.db.models import Sum
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import BigIntegerField, Count, Max, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.middleware.csrf import get_token
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.views.generic import CreateView, TemplateView, View, ListView
 from django.urls import reverse_lazy
 from django.shortcuts import render, redirect
-from .models import History
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from .models import Balance, History, applyOperation, signedAmount
 from .forms import CreateUserForm
-import requests
+from .metrics import registry
+from .money import MAX_AMOUNT, formatAmount, parseAmount
+from .pagination import InvalidCursor, KeysetPaginator
+from .rates import parseTimestamp, rate_cache, rate_history
+from .sqlite import runWrite
+from .viewcache import cachedForUser, userVersion
+import csv
+import hashlib
+import json
+import zlib
 
 def logout_view(request):
     logout(request)
     return redirect('login') 
 
+def metrics_view(request):
+    '''
+    Returns the request metrics of this process in the Prometheus text format, see app/metrics.py.
+    Only clients with an address in settings.METRICS_ALLOWED_IPS get them, other requests
+    and requests forwarded by a proxy get 404.
+    '''
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS or 'HTTP_X_FORWARDED_FOR' in request.META:
+        raise Http404
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 def getBalance(user):
     '''
-    A function finds the user's balance and returns it with the float data type. 
-    To calculate the balance, it calculates the sum of all user's deposits and the sum of all withdrawals.
-    Then subtract the withdrawal amount from the deposit amount and return the result.
+    A function finds the user's balance and returns it as an integer number of cents.
+    The balance is read from the user's Balance row with a single primary key lookup.
+    The row is kept up to date by History.save(), a user without a row has a zero balance.
+    '''
+    balance_result = Balance.objects.filter(pk=user.pk).values_list('amount', flat=True).first()
+
+    if balance_result is None:
+        balance_result = 0
+
+    return balance_result
+
+def renderBalance(user):
+    '''
+    A function that returns the user's balance in cents and the rendered balance fragment of the operations page.
+    '''
+    balance = getBalance(user)
+    return balance, render_to_string('app/fragments/balance.html', {'balance': balance})
+
+def makeEtag(*parts):
+    '''
+    A function that returns a short ETag value derived from the parts.
+    '''
+    return hashlib.md5(':'.join(map(str, parts)).encode(), usedforsecurity=False).hexdigest()
+
+def conditionalResponse(request, etag, build, last_modified=None):
+    '''
+    A function that returns 304 Not Modified if the request's If-None-Match header matches the etag
+    (or, without If-None-Match, if If-Modified-Since is not older than last_modified, a datetime),
+    otherwise the response returned by build(). build is only called when the response is needed,
+    so an unchanged resource costs only the work of computing its etag.
+
+    Responses are private, must be revalidated and vary on the session cookie, so clients always send
+    If-None-Match and get the body again only when it changed. Etags of user data include the user's id,
+    as equal data of two users must not match.
+    '''
+    etag = quote_etag(etag)
+    timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = build()
+    if response.status_code in (200, 304):
+        response.headers['ETag'] = etag
+        if timestamp is not None:
+            response.headers['Last-Modified'] = http_date(timestamp)
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Cookie'])
+    return response
+
+def historyVersion(user):
+    '''
+    A function that returns a value that changes whenever the user's balance or history changes,
+    including edits and deletes of old entries and balance repairs, for the ETags of the pages and the API.
+    It is the user's view cache version (see userVersion), which costs no query. Without the view cache
+    it is a fingerprint of the Balance row and the History rows (count, latest id and sums of the amounts),
+    which misses only edits that keep all of them, e.g. of the datetime of an entry.
     '''
-    deposits_sum = History.objects.filter(user=user,type='deposit',status='success').aggregate(Sum('amount'))['amount__sum']
-    withdrawals_sum = History.objects.filter(user=user,type='withdraw',status='success').aggregate(Sum('amount'))['amount__sum']
+    version = userVersion(user)
+    if version is not None:
+        return version
+    history = History.objects.filter(user=user).aggregate(
+        count=Count('id'), last=Max('id'), amounts=Sum('amount'), signed=Sum(signedAmount()),
+    )
+    balance = Balance.objects.filter(pk=user.pk).values_list('amount', flat=True).first()
+    return (balance, *history.values())
 
-    if deposits_sum is None:
-        deposits_sum = 0
-    if withdrawals_sum is None:
-        withdrawals_sum = 0
+class ConditionalPageMixin:
+    '''
+    A mixin for the pages rendered from the user's balance and history that answers GET requests
+    with 304 Not Modified when the page did not change, before any of the page's queries run or the template renders.
 
-    balance_result = deposits_sum - withdrawals_sum
+    The ETag is derived from historyVersion (which changes with every write to the user's balance or history),
+    the URL with its query string, the username and the CSRF secret, which the page's form token comes from and
+    which changes on login. There is no Last-Modified: no single timestamp changes when an old entry is edited
+    or deleted. Responses are private, must be revalidated and vary on Cookie, so shared caches
+    never serve one user's page to another.
 
-    return float(balance_result)
+    A request with pending messages is answered in full and without validators, as the messages
+    are shown once and the page must not be reused after that.
+    '''
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+            response = super().dispatch(request, *args, **kwargs)
+        else:
+            # Creates the CSRF secret if the client has none yet, so it is the one the page's form uses
+            get_token(request)
+            etag = makeEtag(
+                'page', request.get_full_path(), request.user.pk, request.user.username,
+                request.META['CSRF_COOKIE'], historyVersion(request.user),
+            )
+            response = conditionalResponse(
+                request, etag, lambda: super(ConditionalPageMixin, self).dispatch(request, *args, **kwargs),
+            )
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Cookie'])
+        return response
 
 def getCurrencyParams():
     '''
-    A function that makes a GET request to the following address 
+    A function that returns the currency rates from the exchange API
     https://fake-api.apps.berlintech.ai/api/currency_exchange
 
-    if the response code is 200 it returns a list of two values:
+    The rates are served from rate_cache, which only makes a GET request to the API
+    when its snapshot is older than settings.CURRENCY_RATES_TTL.
+    If the API is unavailable, the newest stored snapshot is used, see getRateSnapshot.
+
+    if the rates are available it returns a list of two values:
     - a dictionary of data that came from the server
     - a list of strings based on the received data 
     mask to form the string f'{currency} ({rate})'.
     example string: 'USD (1.15)'
 
-    if the server response code is not 200 it 
+    if the rates could not be obtained it
     returns the list [None, None]
     '''
-    currency_url = 'https://fake-api.apps.berlintech.ai/api/currency_exchange'
-
-    try:
-        response = requests.get(currency_url)
-        if response.status_code == 200:
-            data = response.json()
-            string_list = [(currency,f'{currency} ({rate})') for currency,rate in data.items()]
-            return [data, string_list]
-        else:
-            return [None, None]
-    except Exception as e:
-        print(e)
+    snapshot = getRateSnapshot()
+    if snapshot is None:
         return [None, None]
+    data = snapshot[1]
+    return [data, getCurrencyChoices(data)]
+
+def getCurrencyChoices(data):
+    '''
+    Returns the (currency, label) pairs of the currency select, e.g. ('USD', 'USD (1.15)').
+    '''
+    return [(currency,f'{currency} ({rate})') for currency,rate in data.items()]
+
+def getRateSnapshot(at=None):
+    '''
+    Returns the currency rates as a (fetched_at, rates) pair, or None if no rates are available.
+
+    Without at these are the current rates from rate_cache and fetched_at is None.
+    If the API is unavailable, the newest snapshot in rate_history is returned instead.
+    With an aware datetime at, the snapshot from rate_history that was current at that time is returned,
+    the API is not contacted.
+    '''
+    if at is not None:
+        return rate_history.at(at)
+    data = rate_cache.get()
+    if data is None:
+        return rate_history.latest()
+    return None, data
 
 
 class CreateUserView(CreateView):
@@ -116,6 +241,17 @@ class CustomLoginView(LoginView):
 class MainMenuView(LoginRequiredMixin, TemplateView):
     template_name = 'app/main_menu.html'
 
+    def get(self, request, *args, **kwargs):
+        '''
+        Returns the main menu. It only depends on the username, so the rendered page is kept in the view cache.
+        '''
+        content = cachedForUser(
+            request.user, 'main_menu',
+            lambda: super(MainMenuView, self).get(request, *args, **kwargs).render().content,
+            request.user.username,
+        )
+        return HttpResponse(content)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         '''
@@ -125,19 +261,20 @@ class MainMenuView(LoginRequiredMixin, TemplateView):
             context['username'] = self.request.user.username
         return context
 
-class BalanceOperationsView(LoginRequiredMixin, View):
+class BalanceOperationsView(LoginRequiredMixin, ConditionalPageMixin, View):
     template_name = 'app/operations.html'
     
     def get(self, request):
         '''
         This method returns the page given in template_name with a context.
 
-        Context is a dictionary with balance and username keys.
-        The balance key contains the result of the getBalance function
+        Context is a dictionary with balance, balance_html and username keys.
+        The balance key contains the result of the getBalance function,
+        balance_html the rendered balance fragment, both from the view cache (see renderBalance)
         username contains the username of the user.
         '''
         context = {}  
-        context['balance'] = getBalance(request.user)
+        context['balance'], context['balance_html'] = cachedForUser(request.user, 'balance', lambda: renderBalance(request.user))
         context['username'] = request.user.username
         return render(request, self.template_name, context) 
 
@@ -147,7 +284,9 @@ class BalanceOperationsView(LoginRequiredMixin, View):
         It adds an entry to the History model. 
         
         status - if the amount on the account is not enough when attempting to withdraw funds, the status is failure, otherwise withdraw
-        amount - amount of operation, obtained from the form
+        The check and the insert are done by applyOperation in a single transaction,
+        through the SQLite write queue if it is enabled (see app/sqlite.py).
+        amount - amount of operation, obtained from the form and converted to cents by parseAmount
         type - type of operation (withdraw/deposit), the value is obtained from the form.
         user - object of the current user
 
@@ -158,31 +297,25 @@ class BalanceOperationsView(LoginRequiredMixin, View):
         username contains the username of the user.
         '''            
         type = request.POST.get('operation')
-        amount = float(request.POST.get('amount'))        
-        balance = getBalance(request.user)
-        if type == 'withdraw':
-            if balance >= amount:
-                status = 'success'
-                balance -= amount
-                amount = str(amount)
-                messages.success(request, f"Amount: {amount} was withdrawn")
-            else:
+        try:
+            amount = parseAmount(request.POST.get('amount'))
+        except ValueError:
+            amount = 0
+        if type not in ('deposit', 'withdraw'):
+            messages.error(request, "Unknown operation")
+            balance = getBalance(request.user)
+        elif amount <= 0 or amount > MAX_AMOUNT:
+            messages.error(request, "Invalid amount")
+            balance = getBalance(request.user)
+        else:
+            # The check and the insert run atomically with the user's balance row locked
+            entry, balance = runWrite(applyOperation, request.user, type, amount)
+            if entry.status == 'failure':
                 messages.error(request, "Insufficient balance")
-                status = 'failure'
-        elif type == 'deposit':
-            status = 'success'
-            balance += amount
-            amount = str(amount)
-            messages.success(request, f"Amount: {amount} was deposited")
-
-        History.objects.create(
-            status=status,
-            amount=amount,
-            type=type,
-            user=request.user
-        )
-        
-        getBalance(request.user)  # Call the function to update the balance
+            elif type == 'withdraw':
+                messages.success(request, f"Amount: {formatAmount(amount)} was withdrawn")
+            else:
+                messages.success(request, f"Amount: {formatAmount(amount)} was deposited")
 
         context = {
             'balance': balance,
@@ -190,11 +323,34 @@ class BalanceOperationsView(LoginRequiredMixin, View):
         }
         return render(request, self.template_name, context)
 
-class ViewTransactionHistoryView(LoginRequiredMixin, ListView):
+def getHistoryPageSize(request):
+    '''
+    A function that returns the page size of the history: the page_size query parameter if it is a valid number,
+    otherwise settings.HISTORY_PAGE_SIZE. It is never larger than settings.HISTORY_MAX_PAGE_SIZE.
+    '''
+    try:
+        page_size = int(request.GET.get('page_size', settings.HISTORY_PAGE_SIZE))
+    except ValueError:
+        page_size = settings.HISTORY_PAGE_SIZE
+    return max(1, min(page_size, settings.HISTORY_MAX_PAGE_SIZE))
+
+def getHistoryPaginator(user, queryset, page_size):
+    '''
+    A function that returns a KeysetPaginator over the user's history queryset
+    that annotates every transaction with balance_after.
+    '''
+    total = Subquery(Balance.objects.filter(pk=user.pk).values('amount')[:1])
+    return KeysetPaginator(
+        queryset, page_size,
+        running_sum=signedAmount(),
+        total=Coalesce(total, Value(0), output_field=BigIntegerField()),
+    )
+
+class ViewTransactionHistoryView(LoginRequiredMixin, ConditionalPageMixin, ListView):
     model = History
     template_name = 'app/history.html'
     context_object_name = 'transactions'
-    ordering = ['-datetime']
+    ordering = ['-datetime', '-id']
 
     def get_queryset(self):
         '''
@@ -202,17 +358,131 @@ class ViewTransactionHistoryView(LoginRequiredMixin, ListView):
         '''
         return History.objects.filter(user=self.request.user)
 
+    def get_paginate_by(self, queryset):
+        '''
+        This method returns the page size given by the page_size query parameter, see getHistoryPageSize.
+        '''
+        return getHistoryPageSize(self.request)
+
+    def paginate_queryset(self, queryset, page_size):
+        '''
+        This method returns one page of the history, newest first, using keyset pagination.
+        The page is selected by the opaque cursor query parameter, without it the first page is returned.
+        Every transaction is annotated with balance_after, the balance after the operation,
+        which is calculated with a window function in the same query as the page.
+        The page and its rendered fragment are kept in the view cache.
+        '''
+        paginator = getHistoryPaginator(self.request.user, queryset, page_size)
+        cursor = self.request.GET.get('cursor')
+
+        def render():
+            try:
+                page = paginator.page(cursor)
+            except InvalidCursor:
+                raise Http404('Invalid cursor')
+            html = render_to_string('app/fragments/history_page.html', {'transactions': page.object_list, 'page_obj': page})
+            return page, html
+
+        page, self.history_html = cachedForUser(self.request.user, 'history', render, cursor, page_size)
+        return (paginator, page, page.object_list, page.has_other_pages())
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         '''
-        Addd the 'username' key with the value of username to the context.
+        Addd the 'username' key with the value of username to the context
+        and the 'history_html' key with the rendered page of transactions.
         '''
         context['username'] = self.request.user.username
+        context['history_html'] = self.history_html
         return context
 
+class Echo:
+    '''
+    A file-like object for csv.writer that returns the written line instead of storing it.
+    '''
+    def write(self, value):
+        return value
+
+def exportHistory(user, format='csv', chunk_size=2000, buffer_size=65536):
+    '''
+    A generator that yields the user's transaction history, oldest first, as CSV, NDJSON or a JSON array.
+
+    Rows are read with QuerySet.iterator(chunk_size=...), so only one chunk of rows is in memory at a time.
+    Lines are joined into blocks of about buffer_size characters before they are yielded.
+    Amounts are written with two decimal places.
+    '''
+    fields = ['id', 'datetime', 'type', 'status', 'amount']
+    rows = History.objects.filter(user=user).order_by('datetime', 'id').values_list(*fields).iterator(chunk_size=chunk_size)
+    rows = ((*row[:-1], formatAmount(row[-1])) for row in rows)
+
+    footer = ''
+    if format == 'csv':
+        writer = csv.writer(Echo())
+        lines = (writer.writerow(row) for row in rows)
+        header = writer.writerow(fields)
+    elif format == 'json':
+        lines = (
+            (',' if i else '') + json.dumps(dict(zip(fields, row)), separators=(',', ':'), cls=DjangoJSONEncoder)
+            for i, row in enumerate(rows)
+        )
+        header, footer = '[', ']'
+    else:
+        lines = (json.dumps(dict(zip(fields, row)), separators=(',', ':'), cls=DjangoJSONEncoder) + '\n' for row in rows)
+        header = ''
+
+    block = [header]
+    size = len(header)
+    for line in lines:
+        block.append(line)
+        size += len(line)
+        if size >= buffer_size:
+            yield ''.join(block).encode()
+            block = []
+            size = 0
+    block.append(footer)
+    tail = ''.join(block)
+    if tail:
+        yield tail.encode()
+
+def gzipStream(chunks):
+    '''
+    A generator that compresses the chunks into a gzip stream on the fly.
+    '''
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+class TransactionExportView(LoginRequiredMixin, View):
+    content_types = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson', 'json': 'application/json'}
+
+    def get(self, request):
+        '''
+        This method streams the entire transaction history of the current user as a file download.
+
+        The format query parameter selects csv (the default), ndjson or json (a single array).
+        With gzip=1 the file is compressed on the fly and gets the .gz extension.
+        The memory used does not depend on the number of transactions.
+        '''
+        format = request.GET.get('format', 'csv')
+        if format not in self.content_types:
+            return HttpResponseBadRequest('Unknown format')
+        chunks = exportHistory(request.user, format, chunk_size=settings.HISTORY_EXPORT_CHUNK_SIZE)
+        filename = f'history.{format}'
+        content_type = self.content_types[format]
+        if request.GET.get('gzip') == '1':
+            chunks = gzipStream(chunks)
+            filename += '.gz'
+            content_type = 'application/gzip'
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
 class CurrencyExchangeView(LoginRequiredMixin, View):
     template_name = 'app/currency_exchange.html'
-    empty_context = {'currency_choices': [], 'amount': None, 'currency': None, 'exchanged_amount': None}
+    empty_context = {'currency_choices': [], 'amount': None, 'currency': None, 'exchanged_amount': None, 'rates_at': None}
 
     def get(self, request):
         _, currency_choices = getCurrencyParams()
@@ -229,16 +499,18 @@ class CurrencyExchangeView(LoginRequiredMixin, View):
         return render(request, self.template_name, context)
 
     def post(self, request):
-        data, currency_choices = getCurrencyParams()
         '''
             This method:
             1) contains the process of forming the variable amount.
             If the amount value from the form is converted to float type, then assign it to the amount variable. Otherwise, it is None.
             2) contains a currency variable that contains the currency value from the form.
-            3) if the variables data or amount contains None, it returns page with empty context (empty_context). Otherwise, performs the following steps
-            4) generates the exchange_rate variable by calculating the corresponding value from the data variable
-            5) generates the exchanged_amount variable, which contains the converted currency to two decimal places.
-            6) forms a context from the previously created variables and returns a template with it.
+            3) reads the optional at value from the form, a date or date and time. Without it the current rates are used,
+            with it the rates that were current at that time (see getRateSnapshot). An invalid value is treated like unavailable rates.
+            4) if the rates or amount contains None, it returns page with empty context (empty_context). Otherwise, performs the following steps
+            5) generates the exchange_rate variable by calculating the corresponding value from the rates
+            6) generates the exchanged_amount variable, which contains the converted currency to two decimal places.
+            7) forms a context from the previously created variables and returns a template with it.
+            rates_at is the time of the stored snapshot that was used, None for the current rates.
         '''
         amount = request.POST.get('amount')
         try:
@@ -246,19 +518,26 @@ class CurrencyExchangeView(LoginRequiredMixin, View):
         except ValueError:
             amount = None  # Set to None if conversion fails
         currency = request.POST.get('currency')
-        if data is None or amount is None:
+        at = request.POST.get('at')
+        try:
+            snapshot = getRateSnapshot(parseTimestamp(at) if at else None)
+        except ValueError:
+            snapshot = None  # An invalid time is handled like unavailable rates
+        if snapshot is None or amount is None:
             context = self.empty_context
             return render(request, self.template_name, context)
+        rates_at, data = snapshot
         exchange_rate = data.get(currency) 
         if exchange_rate is not None:
             exchanged_amount = round(amount * exchange_rate, 2)
         else:
             exchanged_amount = None  # Handle case where exchange rate is not found            
         context = {
-            'currency_choices': currency_choices,
+            'currency_choices': getCurrencyChoices(data),
             'amount': amount,
             'currency': currency,
             'exchanged_amount': exchanged_amount,
+            'rates_at': rates_at,
             'username': request.user.username
         }    
         return render(request, self.template_name, context)
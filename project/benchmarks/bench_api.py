@@ -0,0 +1,78 @@
+'''
+Latency and response size of the JSON API compared with the HTML pages it replaces.
+
+Seeds one user with --rows History rows and requests every pair of endpoints --repeat times
+through the test client: the operations page against /api/balance/, the history page against
+/api/history/ (same page size) and the currency exchange page against /api/exchange/.
+The rates come from a local stub, so the network is not measured.
+For the JSON endpoints the cost of a conditional request that is answered with 304 is shown as well.
+
+Example:
+python -m benchmarks.bench_api --rows 100000 --repeat 200
+'''
+import argparse
+import statistics
+import sys
+import time
+
+from benchmarks.common import setupDjango
+
+RATES = {'AUD': 1.62, 'CAD': 1.48, 'CHF': 1.08, 'EUR': 1.0, 'GBP': 0.88, 'JPY': 129.5, 'USD': 1.15}
+
+
+def measure(client, url, repeat, **headers):
+    '''
+    Requests the url repeat times and returns the median latency in milliseconds,
+    the size of the last response body in bytes and its status code.
+    '''
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), len(body), response
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--page-size', type=int, default=50)
+    args = parser.parse_args(argv)
+
+    setupDjango()
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from app.models import History, rebuildBalances
+    from app.rates import rate_cache
+
+    rate_cache.fetch = lambda: RATES
+    user = User.objects.create_user(username='bench', password='bench')
+    History.objects.bulk_create(
+        (History(user=user, amount=(n % 500) + 1, type='deposit' if n % 3 else 'withdraw', status='success')
+         for n in range(args.rows)),
+        batch_size=5000,
+    )
+    rebuildBalances()
+    client = Client()
+    client.force_login(user)
+
+    page = f'?page_size={args.page_size}'
+    pairs = [
+        ('balance', '/operations/', '/api/balance/'),
+        ('history', f'/history/{page}', f'/api/history/{page}'),
+        ('exchange', '/currency_exchange/', '/api/exchange/'),
+    ]
+    print(f'{"endpoint":<10}{"html ms":>10}{"html bytes":>12}{"json ms":>10}{"json bytes":>12}{"304 ms":>9}')
+    for name, html_url, json_url in pairs:
+        html_ms, html_bytes, _ = measure(client, html_url, args.repeat)
+        json_ms, json_bytes, response = measure(client, json_url, args.repeat)
+        not_modified_ms, _, not_modified = measure(client, json_url, args.repeat, if_none_match=response['ETag'])
+        assert not_modified.status_code == 304
+        print(f'{name:<10}{html_ms:>10.2f}{html_bytes:>12,}{json_ms:>10.2f}{json_bytes:>12,}{not_modified_ms:>9.2f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+'''
+Load test of the synchronous and the async views against a slow local stand-in of the exchange API.
+
+Starts a CurrencyStub that answers after --latency seconds and disables the rate cache TTL,
+so every request waits for an upstream round trip (concurrent requests still share one fetch).
+Then sends --requests requests to the currency exchange page with --concurrency requests in flight in three setups:
+
+wsgi  - the synchronous view through the WSGI handler on a fixed pool of --threads threads,
+        the model of a threaded WSGI server: a request that waits for the API holds a pool thread.
+asgi  - the synchronous view through project.asgi.application.
+async - the async view (/async/...) through project.asgi.application.
+
+The ASGI application is driven in-process through httpx.ASGITransport, so no server is needed.
+Prints the throughput, the median and 95th percentile latency and the peak number of threads.
+Under ASGI Django runs the built-in middleware and every synchronous call in a thread of its own
+per request, so the peak thread count follows the concurrency in both ASGI setups;
+what differs is whether those threads are blocked on the API.
+
+Example:
+python -m benchmarks.bench_async --latency 0.5 --concurrency 200 --requests 2000
+'''
+import argparse
+import asyncio
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import setupDjango
+
+
+class PeakThreads:
+    '''
+    Samples threading.active_count() in a background thread and keeps the maximum.
+    '''
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, threading.active_count())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        # Do not count the sampler itself
+        self.peak -= 1
+
+
+def runWsgi(url, cookie, requests, threads):
+    from django.test import Client
+
+    local = threading.local()
+
+    def one(_):
+        if not hasattr(local, 'client'):
+            local.client = Client()
+            local.client.cookies['sessionid'] = cookie
+        start = time.perf_counter()
+        response = local.client.get(url)
+        assert response.status_code == 200, response.status_code
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(one, range(requests)))
+
+
+async def runAsgi(url, cookie, requests, concurrency):
+    import httpx
+    from project.asgi import application
+
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=application)
+    async with httpx.AsyncClient(transport=transport, base_url='http://testserver', cookies={'sessionid': cookie}) as client:
+        async def one():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(url)
+                assert response.status_code == 200, response.status_code
+                return time.perf_counter() - start
+
+        return await asyncio.gather(*[one() for _ in range(requests)])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.5, help='Seconds the stand-in API takes to answer')
+    parser.add_argument('--concurrency', type=int, default=200, help='Requests in flight in the ASGI setups')
+    parser.add_argument('--threads', type=int, default=16, help='Threads of the WSGI setup')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--setup', action='append', choices=['wsgi', 'asgi', 'async'], help='Setups to run (repeatable), all by default')
+    args = parser.parse_args(argv)
+
+    from app.tests.currency_stub import CurrencyStub
+
+    stub = CurrencyStub(latency=args.latency).start()
+    setupDjango(CURRENCY_API_URL=stub.url, CURRENCY_RATES_TTL=0, CURRENCY_RATES_STALE_TTL=0)
+    from django.contrib.auth.models import User
+    from django.test import Client
+
+    user = User.objects.create_user(username='bench', password='bench')
+    client = Client()
+    client.force_login(user)
+    cookie = client.cookies['sessionid'].value
+
+    print(f'latency={args.latency}s requests={args.requests} concurrency={args.concurrency} wsgi threads={args.threads}')
+    print(f'{"setup":<7}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"threads":>9}{"upstream":>10}')
+    for setup in args.setup or ['wsgi', 'asgi', 'async']:
+        upstream_before = stub.requests
+        with PeakThreads() as threads:
+            start = time.perf_counter()
+            if setup == 'wsgi':
+                timings = runWsgi('/currency_exchange/', cookie, args.requests, args.threads)
+            else:
+                url = '/currency_exchange/' if setup == 'asgi' else '/async/currency_exchange/'
+                timings = asyncio.run(runAsgi(url, cookie, args.requests, args.concurrency))
+            elapsed = time.perf_counter() - start
+        p50 = statistics.median(timings) * 1000
+        p95 = statistics.quantiles(timings, n=20)[-1] * 1000
+        print(f'{setup:<7}{len(timings) / elapsed:>9.0f}{p50:>9.0f}{p95:>9.0f}{threads.peak:>9}{stub.requests - upstream_before:>10}')
+    stub.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
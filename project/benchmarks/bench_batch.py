@@ -0,0 +1,71 @@
+'''
+Throughput of the batch operations API compared with the HTML form.
+
+Performs --operations deposits and withdrawals for one user twice through the test client:
+once as one form POST to /operations/ per operation (each one renders the page),
+and once as POSTs of --batch-size operations to /api/operations/batch/.
+Prints the operations per second of both paths and checks that the materialized
+balance still equals the balance recalculated from History.
+
+Example:
+python -m benchmarks.bench_batch --operations 5000 --batch-size 500
+'''
+import argparse
+import json
+import sys
+
+from benchmarks.common import Timer, setupDjango
+
+
+def operations(count):
+    '''
+    Returns count operations alternating two deposits of 2.00 and one withdrawal of 3.00.
+    '''
+    return [
+        {'type': 'withdraw', 'amount': '3.00'} if i % 3 == 2 else {'type': 'deposit', 'amount': '2.00'}
+        for i in range(count)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--operations', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args(argv)
+
+    setupDjango()
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from app.models import calculateBalance
+    from app.views import getBalance
+
+    ops = operations(args.operations)
+    rates = {}
+    for path in ('form', 'batch'):
+        user = User.objects.create_user(username=f'bench-{path}', password='bench')
+        client = Client()
+        client.force_login(user)
+        with Timer() as timer:
+            if path == 'form':
+                for op in ops:
+                    client.post('/operations/', {'operation': op['type'], 'amount': op['amount']})
+            else:
+                for start in range(0, len(ops), args.batch_size):
+                    response = client.post(
+                        '/api/operations/batch/',
+                        json.dumps({'operations': ops[start:start + args.batch_size]}),
+                        content_type='application/json',
+                    )
+                    assert response.status_code == 200, response.content
+        rates[path] = len(ops) / timer.elapsed
+        balance = getBalance(user)
+        print(f'{path:>5}: {len(ops)} operations in {timer.elapsed:.2f}s ({rates[path]:,.0f} ops/s), balance {balance}')
+        if balance != calculateBalance(user):
+            print(f'MISMATCH for {user.username}')
+            return 1
+    print(f'speedup: {rates["batch"] / rates["form"]:.1f}x')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
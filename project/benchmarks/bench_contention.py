@@ -0,0 +1,114 @@
+'''
+Contention benchmark for the withdraw/deposit path.
+
+N worker threads hammer the same account with withdrawals through applyOperation.
+The benchmark reports the throughput and checks the invariants that matter:
+the balance never goes below zero and the materialized balance equals the one
+recalculated from History. With --spread every worker uses its own account,
+which shows that different users do not serialize behind each other.
+
+--strategy naive runs the pre-locking read-decide-insert sequence for comparison.
+
+Example:
+python -m benchmarks.bench_contention --workers 8 --operations 200
+'''
+import argparse
+import sys
+import threading
+
+from benchmarks.common import Timer, setupDjango
+
+
+def naiveOperation(user, type, amount):
+    '''
+    The original unlocked sequence: read the balance, decide in Python, then insert.
+    '''
+    from app.models import History
+    from app.views import getBalance
+
+    status = 'success' if type == 'deposit' or getBalance(user) >= amount else 'failure'
+    return History.objects.create(status=status, amount=amount, type=type, user=user), None
+
+
+def worker(user, operation, operations, amount, barrier, results):
+    from django.db import connection
+
+    successes = failures = errors = 0
+    barrier.wait()
+    for _ in range(operations):
+        try:
+            entry, _ = operation(user, 'withdraw', amount)
+        except Exception:
+            errors += 1
+            continue
+        if entry.status == 'success':
+            successes += 1
+        else:
+            failures += 1
+    connection.close()
+    results.append((successes, failures, errors))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--operations', type=int, default=100, help='Withdrawals per worker')
+    parser.add_argument('--amount', default='1.00', help='Amount of every withdrawal, e.g. 1.00')
+    parser.add_argument('--initial', default=None, help='Initial deposit, defaults to half of what the workers try to withdraw')
+    parser.add_argument('--strategy', choices=['locked', 'naive'], default='locked')
+    parser.add_argument('--spread', action='store_true', help='Give every worker its own account')
+    args = parser.parse_args(argv)
+
+    setupDjango()
+    from django.contrib.auth.models import User
+    from app.models import Balance, History, applyOperation, calculateBalance
+    from app.money import formatAmount, parseAmount
+
+    amount = parseAmount(args.amount)
+    initial = parseAmount(args.initial) if args.initial else amount * args.workers * args.operations // 2
+    accounts = args.workers if args.spread else 1
+    users = [User.objects.create(username=f'bench{i}') for i in range(accounts)]
+    for user in users:
+        History.objects.create(status='success', amount=initial, type='deposit', user=user)
+
+    operation = applyOperation if args.strategy == 'locked' else naiveOperation
+    barrier = threading.Barrier(args.workers)
+    results = []
+    threads = [
+        threading.Thread(target=worker, args=(users[i % accounts], operation, args.operations, amount, barrier, results))
+        for i in range(args.workers)
+    ]
+    with Timer() as timer:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    successes = sum(r[0] for r in results)
+    failures = sum(r[1] for r in results)
+    errors = sum(r[2] for r in results)
+    total = successes + failures
+    print(f'strategy={args.strategy} workers={args.workers} accounts={accounts}')
+    print(f'operations: {total} in {timer.elapsed:.2f}s ({total / timer.elapsed:.0f} ops/s), errors: {errors}')
+    print(f'successful withdrawals: {successes}, rejected: {failures}')
+
+    ok = True
+    for user in users:
+        materialized = Balance.objects.get(pk=user.pk).amount
+        recalculated = calculateBalance(user)
+        print(f'{user.username}: balance {formatAmount(materialized)}, recalculated {formatAmount(recalculated)}')
+        if recalculated < 0:
+            print(f'OVERDRAFT on {user.username}')
+            ok = False
+        if materialized != recalculated:
+            print(f'MISMATCH on {user.username}')
+            ok = False
+    expected = initial * accounts - amount * successes
+    if sum(calculateBalance(user) for user in users) != expected:
+        print('Balances do not add up to the initial deposits minus the successful withdrawals')
+        ok = False
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
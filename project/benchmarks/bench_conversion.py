@@ -0,0 +1,96 @@
+'''
+Batch currency conversion with the cross-rate matrices against per-item loops.
+
+Generates --items random (amount in cents, from, to) conversions over the rates of the exchange API
+(from is the base currency for a quarter of them) and converts the batch three ways:
+
+float   - a loop doing what the currency exchange page does, round(amount * rate, 2) on floats,
+          with rate = rates[to] / rates[from].
+decimal - a loop with exact Decimal arithmetic and a single half-up rounding, the reference.
+matrix  - CrossRates.indices and CrossRates.convert on the whole batch, half up. They get the amounts,
+          sources and targets as separate lists, as the batch exchange API collects them while validating.
+          The time to build the matrices for a new snapshot is shown separately; they are built once per snapshot.
+
+Prints the best time of --repeat runs for each and the number of results that differ from the reference.
+
+Example:
+python -m benchmarks.bench_conversion --items 100000
+'''
+import argparse
+import random
+import sys
+from decimal import ROUND_HALF_UP, Decimal
+
+from benchmarks.common import Timer
+from app.conversion import CrossRates
+
+RATES = {'AUD': 1.62, 'CAD': 1.48, 'CHF': 1.08, 'EUR': 1.0, 'GBP': 0.88, 'JPY': 129.5, 'USD': 1.15}
+
+
+def convertFloat(items, rates):
+    results = []
+    for cents, source, target in items:
+        rate = rates[target] / (rates[source] if source else 1)
+        results.append(round(round(cents / 100 * rate, 2) * 100))
+    return results
+
+
+def convertDecimal(items, rates):
+    decimals = {currency: Decimal(str(rate)) for currency, rate in rates.items()}
+    decimals[None] = Decimal(1)
+    one = Decimal(1)
+    return [
+        int((cents * decimals[target] / decimals[source]).quantize(one, rounding=ROUND_HALF_UP))
+        for cents, source, target in items
+    ]
+
+
+def convertMatrix(amounts, sources, targets, cross_rates):
+    return cross_rates.convert(amounts, cross_rates.indices(sources), cross_rates.indices(targets)).tolist()
+
+
+def best(repeat, function, *args):
+    '''
+    Runs function(*args) repeat times and returns the best time in seconds and the last result.
+    '''
+    elapsed = None
+    for _ in range(repeat):
+        with Timer() as timer:
+            result = function(*args)
+        elapsed = timer.elapsed if elapsed is None else min(elapsed, timer.elapsed)
+    return elapsed, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    generator = random.Random(args.seed)
+    currencies = list(RATES)
+    items = [
+        (generator.randint(1, 10000000), None if generator.random() < 0.25 else generator.choice(currencies),
+         generator.choice(currencies))
+        for _ in range(args.items)
+    ]
+
+    build, cross_rates = best(args.repeat, CrossRates, RATES)
+    reference_time, reference = best(args.repeat, convertDecimal, items, RATES)
+    float_time, floats = best(args.repeat, convertFloat, items, RATES)
+    amounts, sources, targets = map(list, zip(*items))
+    matrix_time, matrix = best(args.repeat, convertMatrix, amounts, sources, targets, cross_rates)
+
+    print(f'items={args.items} currencies={len(RATES)} matrix build {build * 1000:.2f} ms')
+    print(f'{"method":<9}{"ms":>10}{"items/s":>14}{"speedup":>9}{"wrong":>8}')
+    for name, elapsed, results in (
+        ('float', float_time, floats), ('decimal', reference_time, reference), ('matrix', matrix_time, matrix),
+    ):
+        wrong = sum(a != b for a, b in zip(results, reference))
+        print(f'{name:<9}{elapsed * 1000:>10.1f}{args.items / elapsed:>14,.0f}{float_time / elapsed:>8.1f}x{wrong:>8}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+'''
+Peak memory of the streaming history export.
+
+Seeds one user with --rows History rows, then downloads /history/export/ through the test client
+while a sampler thread records the resident set size. The peak RSS growth during the export
+should stay flat no matter how many rows are exported. --materialize also measures loading
+the same rows into a list, which is what rendering them in one response would cost.
+
+Example:
+python -m benchmarks.bench_export --rows 1000000 --format csv --gzip
+'''
+import argparse
+import os
+import sys
+import threading
+import time
+
+from benchmarks.common import Timer, setupDjango
+
+
+def rss():
+    '''
+    Returns the current resident set size of the process in bytes (Linux).
+    '''
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class PeakSampler:
+    '''
+    Samples the RSS every interval seconds in a background thread and keeps the maximum.
+    '''
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, rss())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss())
+
+
+def seed(user, rows, batch_size=20000):
+    from django.utils import timezone
+    from app.models import History
+
+    now = timezone.now()
+    for start in range(0, rows, batch_size):
+        History.objects.bulk_create(
+            History(user=user, amount=(i % 500) + 1, type='deposit' if i % 3 else 'withdraw', status='success', datetime=now)
+            for i in range(start, min(start + batch_size, rows))
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+    parser.add_argument('--gzip', action='store_true')
+    parser.add_argument('--materialize', action='store_true', help='Also measure loading all rows into a list')
+    args = parser.parse_args(argv)
+
+    setupDjango()
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from app.models import History
+
+    user = User.objects.create_user(username='bench', password='bench')
+    with Timer() as timer:
+        seed(user, args.rows)
+    print(f'seeded {args.rows} rows in {timer.elapsed:.1f}s')
+
+    client = Client()
+    client.force_login(user)
+    params = {'format': args.format}
+    if args.gzip:
+        params['gzip'] = '1'
+
+    before = rss()
+    size = 0
+    with PeakSampler() as sampler, Timer() as timer:
+        response = client.get('/history/export/', params)
+        for chunk in response.streaming_content:
+            size += len(chunk)
+    print(f'export: {size / 1e6:.1f} MB in {timer.elapsed:.1f}s ({args.rows / timer.elapsed:.0f} rows/s)')
+    print(f'export: RSS before {before / 1e6:.1f} MB, peak {sampler.peak / 1e6:.1f} MB, growth {(sampler.peak - before) / 1e6:.1f} MB')
+
+    if args.materialize:
+        before = rss()
+        with PeakSampler() as sampler, Timer() as timer:
+            rows = list(History.objects.filter(user=user).values_list('id', 'datetime', 'type', 'status', 'amount'))
+        print(f'list(): {len(rows)} rows in {timer.elapsed:.1f}s, RSS growth {(sampler.peak - before) / 1e6:.1f} MB')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
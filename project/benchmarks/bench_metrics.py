@@ -0,0 +1,75 @@
+'''
+Overhead of the request metrics.
+
+Requests a few pages --repeat times through the test client, alternating rounds with MetricsMiddleware
+and the InstrumentedTemplates backend and rounds with the plain Django settings, and prints the
+median latency of both and the difference per request. The currency rates come from a local stub.
+
+Example:
+python -m benchmarks.bench_metrics --repeat 2000
+'''
+import argparse
+import statistics
+import sys
+import time
+
+from benchmarks.common import setupDjango
+
+RATES = {'AUD': 1.62, 'CAD': 1.48, 'CHF': 1.08, 'EUR': 1.0, 'GBP': 0.88, 'JPY': 129.5, 'USD': 1.15}
+
+
+def measure(user, url, repeat):
+    '''
+    Returns the latencies in microseconds of repeat requests to url with a new test client.
+    '''
+    from django.test import Client
+
+    client = Client()
+    client.force_login(user)
+    client.get(url)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - start) * 1e6)
+        assert response.status_code == 200, response.status_code
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    setupDjango()
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.test import override_settings
+    from app.models import History
+    from app.rates import rate_cache
+
+    rate_cache.fetch = lambda: RATES
+    user = User.objects.create_user(username='bench', password='bench')
+    History.objects.bulk_create(
+        History(user=user, amount=100, type='deposit', status='success') for _ in range(100)
+    )
+    plain = override_settings(
+        MIDDLEWARE=[name for name in settings.MIDDLEWARE if name != 'app.metrics.MetricsMiddleware'],
+        TEMPLATES=[{**settings.TEMPLATES[0], 'BACKEND': 'django.template.backends.django.DjangoTemplates'}],
+    )
+
+    print(f'{"url":<22}{"plain us":>10}{"metrics us":>12}{"overhead us":>13}')
+    for url in ('/operations/', '/history/', '/currency_exchange/', '/api/balance/'):
+        with_metrics, without = [], []
+        for _ in range(args.rounds):
+            with_metrics += measure(user, url, args.repeat // args.rounds)
+            with plain:
+                without += measure(user, url, args.repeat // args.rounds)
+        a, b = statistics.median(without), statistics.median(with_metrics)
+        print(f'{url:<22}{a:>10.0f}{b:>12.0f}{b - a:>13.0f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
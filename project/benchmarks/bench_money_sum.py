@@ -0,0 +1,75 @@
+'''
+SUM throughput on integer cents versus decimal amounts in SQLite.
+
+Creates two tables with --rows random amounts: one stores integer cents, the other stores
+the same amounts the way Django stores a DecimalField on SQLite (a column declared as decimal,
+which SQLite keeps as REAL). Both are summed --repeat times with the same query, and the
+results are converted the way the ORM would: int() for the integer column, Decimal for the decimal one.
+The benchmark also reports how far the decimal SUM drifted from the exact total.
+
+Example:
+python -m benchmarks.bench_money_sum --rows 1000000
+'''
+import argparse
+import random
+import sqlite3
+import sys
+from decimal import Decimal
+
+from benchmarks.common import Timer
+
+
+def createTables(connection, rows, seed):
+    '''
+    Fills amount_int and amount_decimal with the same random amounts and returns their exact total in cents.
+    '''
+    connection.execute('CREATE TABLE amount_int (id INTEGER PRIMARY KEY, amount bigint NOT NULL)')
+    connection.execute('CREATE TABLE amount_decimal (id INTEGER PRIMARY KEY, amount decimal NOT NULL)')
+    generator = random.Random(seed)
+    cents = [generator.randint(1, 10000000) for _ in range(rows)]
+    connection.executemany('INSERT INTO amount_int (amount) VALUES (?)', ((c,) for c in cents))
+    # Django binds DecimalField values as strings, SQLite converts them to REAL on insert
+    connection.executemany(
+        'INSERT INTO amount_decimal (amount) VALUES (?)', ((f'{c // 100}.{c % 100:02d}',) for c in cents)
+    )
+    connection.commit()
+    return sum(cents)
+
+
+def timeSum(connection, table, convert, repeat):
+    '''
+    Runs SELECT SUM(amount) repeat times and returns the best time in seconds and the converted result.
+    '''
+    best = None
+    for _ in range(repeat):
+        with Timer() as timer:
+            value = convert(connection.execute(f'SELECT SUM(amount) FROM {table}').fetchone()[0])
+        best = timer.elapsed if best is None else min(best, timer.elapsed)
+    return best, value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    connection = sqlite3.connect(':memory:')
+    exact = createTables(connection, args.rows, args.seed)
+
+    # The ORM turns the REAL result of a decimal column into a Decimal through its string representation
+    int_time, int_sum = timeSum(connection, 'amount_int', int, args.repeat)
+    decimal_time, decimal_sum = timeSum(connection, 'amount_decimal', lambda v: Decimal(repr(v)), args.repeat)
+
+    print(f'rows={args.rows} repeat={args.repeat}')
+    print(f'integer cents: {int_time * 1000:.1f} ms ({args.rows / int_time / 1e6:.1f}M rows/s), sum {int_sum}')
+    print(f'decimal:       {decimal_time * 1000:.1f} ms ({args.rows / decimal_time / 1e6:.1f}M rows/s), sum {decimal_sum}')
+    print(f'speedup: {decimal_time / int_time:.2f}x')
+    drift = decimal_sum - Decimal(exact) / 100
+    print(f'exact total: {Decimal(exact) / 100}, decimal drift: {drift}')
+    return 0 if int_sum == exact else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
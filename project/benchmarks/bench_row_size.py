@@ -0,0 +1,94 @@
+'''
+Database and index size of History before and after the small integer enum migration.
+
+Migrates a scratch database to the schema with string type/status columns (0006),
+fills it with a synthetic ledger of --rows History rows spread over --users users,
+vacuums it and measures the file size and the size of the table and of each index
+(through the dbstat virtual table). Then applies 0007, which converts type and status
+to small integers, vacuums again and prints the same numbers side by side.
+
+Example:
+python -m benchmarks.bench_row_size --rows 10000000
+'''
+import argparse
+import os
+import sys
+
+from benchmarks.common import Timer, setupDjango
+
+BEFORE = '0006_amount_in_cents'
+AFTER = '0007_history_small_int_enums'
+
+
+def seed(cursor, rows, users):
+    '''
+    Inserts users and rows with a single INSERT ... SELECT over a recursive CTE, using the string encoding.
+    '''
+    cursor.execute(
+        'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < %s) '
+        "INSERT INTO auth_user (id, password, is_superuser, username, first_name, last_name, email, is_staff, is_active, date_joined) "
+        "SELECT i, '', 0, 'ledger' || i, '', '', '', 0, 1, '2024-01-01 00:00:00' FROM n",
+        [users],
+    )
+    cursor.execute(
+        'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < %s) '
+        'INSERT INTO app_history (user_id, datetime, amount, type, status) '
+        "SELECT i %% %s + 1, datetime(1704067200 + i, 'unixepoch'), (i * 7919) %% 1000000 + 1, "
+        "CASE WHEN i %% 3 THEN 'deposit' ELSE 'withdraw' END, "
+        "CASE WHEN i %% 7 THEN 'success' ELSE 'failure' END FROM n",
+        [rows, users],
+    )
+
+
+def measure(cursor, db_path):
+    '''
+    Vacuums the database and returns its file size and the bytes used by app_history and each of its indexes.
+    '''
+    cursor.execute('VACUUM')
+    cursor.execute("SELECT name FROM sqlite_master WHERE tbl_name = 'app_history'")
+    names = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        f"SELECT name, SUM(pgsize) FROM dbstat WHERE name IN ({', '.join(['%s'] * len(names))}) GROUP BY name",
+        names,
+    )
+    return os.path.getsize(db_path), dict(cursor.fetchall())
+
+
+def mb(size):
+    return f'{size / 2 ** 20:,.1f} MB'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000000)
+    parser.add_argument('--users', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    db_path = setupDjango()
+    from django.core.management import call_command
+    from django.db import connection, transaction
+
+    call_command('migrate', 'app', BEFORE, verbosity=0)
+    with Timer() as timer, transaction.atomic(), connection.cursor() as cursor:
+        seed(cursor, args.rows, args.users)
+    print(f'seeded {args.rows:,} rows in {timer.elapsed:.1f}s')
+    with connection.cursor() as cursor:
+        before_file, before = measure(cursor, db_path)
+
+    with Timer() as timer:
+        call_command('migrate', 'app', AFTER, verbosity=0)
+    print(f'migrated in {timer.elapsed:.1f}s')
+    with connection.cursor() as cursor:
+        after_file, after = measure(cursor, db_path)
+
+    print(f'{"object":<40}{"strings":>14}{"integers":>14}{"saved":>9}')
+    for name in sorted(set(before) | set(after)):
+        old, new = before.get(name, 0), after.get(name, 0)
+        saved = f'{1 - new / old:.0%}' if old else '-'
+        print(f'{name:<40}{mb(old):>14}{mb(new):>14}{saved:>9}')
+    print(f'{"database file":<40}{mb(before_file):>14}{mb(after_file):>14}{1 - after_file / before_file:>9.0%}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+'''
+Mixed read/write throughput of SQLite with the default settings and with the production profile (app/sqlite.py).
+
+--workers threads run operations for --seconds: a --write-ratio fraction are deposits and withdrawals
+through applyOperation (via runWrite, as in BalanceOperationsView), the rest read the balance
+and the first history page of a random one of --users accounts. Every mode uses a new database:
+default - Django's defaults, the connection is closed after every operation like after every request
+production - SQLITE_PRODUCTION pragmas with persistent connections, writes without the queue
+queue - the production profile with the write queue (group commit)
+
+The modes run in separate processes, one after another. For each the read and write throughput,
+the median and p99 write latency and the number of failed operations ("database is locked") are printed.
+
+Example:
+python -m benchmarks.bench_sqlite --workers 16 --write-ratio 0.3
+'''
+import argparse
+import json
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.common import setupDjango
+
+MODES = {
+    'default': {'SQLITE_PRODUCTION': False, 'SQLITE_WRITE_QUEUE': False},
+    'production': {'SQLITE_PRODUCTION': True, 'SQLITE_WRITE_QUEUE': False},
+    'queue': {'SQLITE_PRODUCTION': True, 'SQLITE_WRITE_QUEUE': True},
+}
+
+
+def worker(users, args, persistent, barrier, results):
+    from django.db import connection
+    from app.models import History, applyOperation
+    from app.sqlite import runWrite
+    from app.views import getBalance
+
+    generator = random.Random()
+    reads = errors = 0
+    latencies = []
+    barrier.wait()
+    deadline = time.perf_counter() + args.seconds
+    while time.perf_counter() < deadline:
+        user = generator.choice(users)
+        try:
+            if generator.random() < args.write_ratio:
+                type = 'deposit' if generator.random() < 0.6 else 'withdraw'
+                start = time.perf_counter()
+                runWrite(applyOperation, user, type, generator.randint(100, 10000))
+                latencies.append(time.perf_counter() - start)
+            else:
+                getBalance(user)
+                list(History.objects.filter(user=user).order_by('-datetime', '-id').values_list('id', 'amount')[:50])
+                reads += 1
+        except Exception:
+            errors += 1
+        if not persistent:
+            connection.close()
+    connection.close()
+    results.append((reads, latencies, errors))
+
+
+def run(args):
+    '''
+    Runs one mode in this process and returns its statistics.
+    '''
+    setupDjango(**MODES[args.mode])
+    from django.contrib.auth.models import User
+    from app.models import History, rebuildBalances
+
+    users = [User.objects.create(username=f'bench{n}') for n in range(args.users)]
+    History.objects.bulk_create(
+        History(user=user, amount=100000, type='deposit', status='success') for user in users for _ in range(20)
+    )
+    rebuildBalances()
+
+    barrier = threading.Barrier(args.workers + 1)
+    results = []
+    threads = [
+        threading.Thread(target=worker, args=(users, args, args.mode != 'default', barrier, results))
+        for _ in range(args.workers)
+    ]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency * 1000 for _, thread_latencies, _ in results for latency in thread_latencies)
+    return {
+        'mode': args.mode,
+        'reads_per_s': sum(reads for reads, _, _ in results) / elapsed,
+        'writes_per_s': len(latencies) / elapsed,
+        'write_p50_ms': statistics.median(latencies) if latencies else 0,
+        'write_p99_ms': statistics.quantiles(latencies, n=100)[98] if len(latencies) > 1 else 0,
+        'errors': sum(errors for _, _, errors in results),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['all', *MODES], default='all')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='Fraction of operations that write')
+    parser.add_argument('--seconds', type=float, default=5, help='Duration of every mode')
+    args = parser.parse_args(argv)
+
+    if args.mode != 'all':
+        print(json.dumps(run(args)))
+        return 0
+
+    print(f'workers={args.workers} users={args.users} write ratio={args.write_ratio}')
+    print(f'{"mode":<12}{"reads/s":>10}{"writes/s":>10}{"write p50 ms":>14}{"write p99 ms":>14}{"errors":>8}')
+    options = [f'--workers={args.workers}', f'--users={args.users}', f'--write-ratio={args.write_ratio}', f'--seconds={args.seconds}']
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_sqlite', f'--mode={mode}', *options],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        stats = json.loads(output.strip().splitlines()[-1])
+        print(f'{mode:<12}{stats["reads_per_s"]:>10.0f}{stats["writes_per_s"]:>10.0f}'
+              f'{stats["write_p50_ms"]:>14.1f}{stats["write_p99_ms"]:>14.1f}{stats["errors"]:>8}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
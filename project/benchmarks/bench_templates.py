@@ -0,0 +1,113 @@
+'''
+Render time of the HTML pages with and without the template caches (app/templates/app/base.html, settings.TEMPLATES).
+
+One user is seeded with --rows History rows, then every page is requested --requests times through the test client
+after one warm-up request. The view cache is off and the history page shows all rows on one page,
+so every request renders the full page. Two modes run in separate processes:
+uncached - the filesystem and app directories loaders without the cached loader and without the fragment cache,
+           every request reads and compiles the templates again
+cached - the project's configuration: templates compiled once per process and {% cache %} fragments
+
+For each page the mean request time and the mean template render time (app_template_render_seconds_total)
+are printed in milliseconds.
+
+Example:
+python -m benchmarks.bench_templates --rows 5000
+'''
+import argparse
+import copy
+import json
+import subprocess
+import sys
+
+from benchmarks.common import Timer, setupDjango
+
+PAGES = ['login', 'main_menu', 'operations', 'history']
+
+
+def overrides(mode, rows):
+    from project import settings
+
+    options = {'VIEW_CACHE_ALIAS': None, 'HISTORY_MAX_PAGE_SIZE': rows}
+    if mode == 'uncached':
+        templates = copy.deepcopy(settings.TEMPLATES)
+        templates[0]['OPTIONS']['loaders'] = [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]
+        caches = copy.deepcopy(settings.CACHES)
+        caches['template_fragments'] = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+        options.update(TEMPLATES=templates, CACHES=caches)
+    return options
+
+
+def run(args):
+    '''
+    Runs one mode in this process and returns the mean request and render time of every page.
+    '''
+    setupDjango(**overrides(args.mode, args.rows))
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from django.urls import reverse
+    from django.utils import timezone
+    from app.metrics import registry, template_seconds
+    from app.models import History, rebuildBalances
+
+    user = User.objects.create_user(username='bench', password='bench')
+    now = timezone.now()
+    History.objects.bulk_create(
+        History(user=user, amount=100 + n, type='deposit', status='success', datetime=now - timezone.timedelta(seconds=n))
+        for n in range(args.rows)
+    )
+    rebuildBalances()
+
+    client = Client()
+    client.force_login(user)
+    stats = {}
+    for page in PAGES:
+        url = reverse(page)
+        params = {'page_size': args.rows} if page == 'history' else {}
+        client.get(url, params)
+        registry.clear()
+        with Timer() as timer:
+            for _ in range(args.requests):
+                response = client.get(url, params)
+                assert response.status_code == 200, response.status_code
+        stats[page] = {
+            'request_ms': timer.elapsed / args.requests * 1000,
+            'render_ms': template_seconds.series.get((page,), 0) / args.requests * 1000,
+        }
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['all', 'uncached', 'cached'], default='all')
+    parser.add_argument('--rows', type=int, default=5000, help='History rows, all shown on the history page')
+    parser.add_argument('--requests', type=int, default=50, help='Requests per page')
+    args = parser.parse_args(argv)
+
+    if args.mode != 'all':
+        print(json.dumps(run(args)))
+        return 0
+
+    results = {}
+    for mode in ('uncached', 'cached'):
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_templates', f'--mode={mode}', f'--rows={args.rows}', f'--requests={args.requests}'],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    print(f'rows={args.rows} requests per page={args.requests}, times in ms')
+    print(f'{"page":<12}{"uncached req":>14}{"cached req":>12}{"uncached render":>17}{"cached render":>15}{"saved":>8}')
+    for page in PAGES:
+        uncached, cached = results['uncached'][page], results['cached'][page]
+        saved = 1 - cached['render_ms'] / uncached['render_ms'] if uncached['render_ms'] else 0
+        print(f'{page:<12}{uncached["request_ms"]:>14.2f}{cached["request_ms"]:>12.2f}'
+              f'{uncached["render_ms"]:>17.2f}{cached["render_ms"]:>15.2f}{saved:>8.0%}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,53 @@
+'''
+Shared helpers for the benchmark scripts in this directory.
+
+Every benchmark runs against its own scratch SQLite database so it never touches db.sqlite3.
+Run the scripts from the project directory, for example:
+python -m benchmarks.bench_contention --workers 8
+'''
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+def setupDjango(db_path=None, **overrides):
+    '''
+    Configures Django against a fresh SQLite database and applies the migrations.
+    db_path defaults to a file in a new temporary directory.
+    Keyword arguments override settings before Django is set up.
+    Returns the path of the database file.
+    '''
+    if str(PROJECT_DIR) not in sys.path:
+        sys.path.insert(0, str(PROJECT_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+
+    import django
+    from django.conf import settings
+
+    if db_path is None:
+        db_path = Path(tempfile.mkdtemp(prefix='bench-')) / 'bench.sqlite3'
+    settings.DATABASES['default']['NAME'] = str(db_path)
+    settings.ALLOWED_HOSTS = ['*']
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    return db_path
+
+
+class Timer:
+    '''
+    A context manager that measures the wall time of its block in seconds.
+    '''
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
@@ -0,0 +1,280 @@
+'''
+End-to-end load benchmark of every URL in app/urls.py, with a regression check against a baseline.
+
+Generates a ledger with the generate_ledger command (--users, --transactions, Zipf distributed) in a scratch
+database, or reuses the database given with --db if it already has transactions. The currency rates come
+from a local CurrencyStub. Then every URL is requested --requests times by --concurrency threads,
+each with its own test client logged in as a different generated user, through the WSGI handler in-process.
+Mutating URLs are driven with small POSTs (deposits), the rest with GET.
+
+Every URL is driven in --rounds rounds; for each statistic the median of the rounds is kept, which
+makes the numbers far less sensitive to a single noisy round. For every URL the p50, p95 and p99
+latency in milliseconds, the throughput and the number of error responses are written to --output as JSON.
+With --baseline the results are compared with a stored run: a URL regresses if its throughput dropped
+by more than --tolerance (a fraction), and any error response is a failure too. Throughput is the gated
+number because every client sends its next request as soon as the last one returned, so it is the
+concurrency divided by the mean latency; the latency percentiles are reported but not gated, with
+concurrent threads in one process (and one GIL) they swing between runs with the thread scheduling.
+Shared machines also get faster or slower as a whole from run to run, so before and after the URLs
+a fixed CPU-bound calibration workload is timed; the baseline throughput is scaled by the ratio
+of the calibration times before it is compared.
+The script exits with status 1 on a failure, so it can gate a CI job.
+--update-baseline writes the results to the --baseline file instead of comparing.
+
+Latencies depend on the machine: record the baseline on the machine that runs the comparison.
+
+Example:
+python -m benchmarks.run_suite --baseline benchmarks/baseline.json
+python -m benchmarks.run_suite --transactions 1000000 --db /tmp/ledger.sqlite3 --output /tmp/suite.json
+python -m benchmarks.run_suite --baseline benchmarks/baseline.json --update-baseline
+'''
+import argparse
+import json
+import platform
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from benchmarks.common import setupDjango
+
+CONVERSIONS = [{'amount': f'{n}.25', 'from': 'GBP', 'to': 'USD'} for n in range(1, 101)]
+OPERATIONS = [{'type': 'deposit', 'amount': '1.00'} for _ in range(10)]
+
+# URL name -> (label, method, query string or form data, JSON body)
+PLANS = {
+    'main_menu': [('main_menu', 'GET', None, None)],
+    'login': [('login', 'GET', None, None)],
+    'create_account': [('create_account', 'GET', None, None)],
+    'metrics': [('metrics', 'GET', None, None)],
+    'operations': [
+        ('operations', 'GET', None, None),
+        ('operations:deposit', 'POST', {'operation': 'deposit', 'amount': '1.00'}, None),
+    ],
+    'currency_exchange': [
+        ('currency_exchange', 'GET', None, None),
+        ('currency_exchange:convert', 'POST', {'amount': '10', 'currency': 'USD'}, None),
+    ],
+    'history': [('history', 'GET', {'page_size': 50}, None)],
+    'history_export': [('history_export', 'GET', {'format': 'csv'}, None)],
+    'async_operations': [('async_operations', 'GET', None, None)],
+    'async_currency_exchange': [('async_currency_exchange', 'GET', None, None)],
+    'async_history': [('async_history', 'GET', {'page_size': 50}, None)],
+    'api_balance': [('api_balance', 'GET', None, None)],
+    'api_history': [('api_history', 'GET', {'page_size': 50}, None)],
+    'api_history_all': [('api_history_all', 'GET', None, None)],
+    'api_exchange': [('api_exchange', 'GET', {'currency': 'USD', 'amount': '10'}, None)],
+    'api_batch_exchange': [('api_batch_exchange', 'POST', None, {'conversions': CONVERSIONS})],
+    'api_batch_operations': [('api_batch_operations', 'POST', None, {'operations': OPERATIONS})],
+}
+SKIPPED = {
+    'logout': 'ends the session of the client',
+}
+
+
+def plans():
+    '''
+    Returns the (label, url, method, data, body) tuples for every URL of app/urls.py.
+    Raises SystemExit if a URL has neither a plan nor a reason to be skipped.
+    '''
+    from django.urls import reverse
+    from app.urls import urlpatterns
+
+    names = [pattern.name for pattern in urlpatterns]
+    missing = [name for name in names if name not in PLANS and name not in SKIPPED]
+    if missing:
+        raise SystemExit(f'No benchmark plan for the URL(s) {", ".join(missing)}, add them to PLANS or SKIPPED')
+    return [
+        (label, reverse(name), method, data, body)
+        for name in names if name in PLANS
+        for label, method, data, body in PLANS[name]
+    ]
+
+
+def request(client, url, method, data, body):
+    '''
+    Makes one request, reads the whole body and returns the status code.
+    '''
+    if body is not None:
+        response = client.post(url, json.dumps(body), content_type='application/json')
+    elif method == 'POST':
+        response = client.post(url, data)
+    else:
+        response = client.get(url, data)
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response.status_code
+
+
+def drive(clients, plan, requests, concurrency):
+    '''
+    Sends requests requests of plan with concurrency threads and returns the statistics of one round.
+    '''
+    label, url, method, data, body = plan
+    local = threading.local()
+    counter = iter(range(len(clients) * requests))
+    lock = threading.Lock()
+
+    def one(_):
+        if not hasattr(local, 'client'):
+            with lock:
+                local.client = clients[next(counter) % len(clients)]
+        start = time.perf_counter()
+        status = request(local.client, url, method, data, body)
+        return time.perf_counter() - start, status
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(min(requests, 2 * concurrency))))
+        start = time.perf_counter()
+        samples = list(executor.map(one, range(requests)))
+        elapsed = time.perf_counter() - start
+
+    timings = sorted(timing * 1000 for timing, _ in samples)
+    percentiles = statistics.quantiles(timings, n=100, method='inclusive')
+    return {
+        'method': method,
+        'url': url,
+        'p50_ms': round(percentiles[49], 3),
+        'p95_ms': round(percentiles[94], 3),
+        'p99_ms': round(percentiles[98], 3),
+        'rps': round(requests / elapsed, 1),
+        'errors': sum(1 for _, status in samples if status >= 400),
+    }
+
+
+def calibrate(repeat=5):
+    '''
+    Returns the best time in seconds of a fixed pure Python workload, a measure of the speed of the machine.
+    '''
+    data = [{'id': n, 'amount': f'{n}.00', 'type': 'deposit'} for n in range(2000)]
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(20):
+            json.loads(json.dumps(data))
+            sorted(data, key=lambda row: row['amount'])
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def median(rounds):
+    '''
+    Combines the statistics of several rounds into their medians, errors are summed.
+    '''
+    result = dict(rounds[0])
+    for key in ('p50_ms', 'p95_ms', 'p99_ms', 'rps'):
+        result[key] = statistics.median(stats[key] for stats in rounds)
+    result['errors'] = sum(stats['errors'] for stats in rounds)
+    return result
+
+
+def compare(results, baseline, tolerance, speed=1):
+    '''
+    Returns the list of failures of results against the baseline results.
+    speed is the calibration time of this run divided by that of the baseline run.
+    '''
+    failures = []
+    for label, result in results.items():
+        if result['errors']:
+            failures.append(f'{label}: {result["errors"]} error response(s)')
+        base = baseline.get(label)
+        if base is None:
+            continue
+        rps = base['rps'] / speed
+        if result['rps'] < rps * (1 - tolerance):
+            failures.append(f'{label}: {result["rps"]:.0f} req/s, baseline {rps:.0f} req/s (scaled)')
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--transactions', type=int, default=100000)
+    parser.add_argument('--requests', type=int, default=100, help='Requests per URL and round')
+    parser.add_argument('--rounds', type=int, default=3, help='Rounds per URL')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--db', help='SQLite database to create or reuse, a scratch database by default')
+    parser.add_argument('--output', default='suite-results.json', help='File the results are written to')
+    parser.add_argument('--baseline', help='Results of an earlier run to compare with')
+    parser.add_argument('--update-baseline', action='store_true', help='Write the results to --baseline instead')
+    parser.add_argument('--tolerance', type=float, default=0.3, help='Allowed relative drop of the throughput')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    from app.tests.currency_stub import CurrencyStub
+
+    stub = CurrencyStub().start()
+    setupDjango(args.db, CURRENCY_API_URL=stub.url)
+    import django
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.test import Client
+    from app.models import History
+
+    if not History.objects.exists():
+        started = time.perf_counter()
+        call_command(
+            'generate_ledger', users=args.users, transactions=args.transactions,
+            distribution='zipf', seed=args.seed, checkpoints=True, prefix='bench',
+        )
+        print(f'Generated the ledger in {time.perf_counter() - started:.1f}s')
+
+    clients = []
+    for user in User.objects.order_by('pk')[:args.concurrency]:
+        client = Client()
+        client.force_login(user)
+        clients.append(client)
+
+    calibration = calibrate()
+    results = {}
+    print(f'{"url":<28}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"req/s":>9}{"errors":>8}')
+    for plan in plans():
+        rounds = [drive(clients, plan, args.requests, args.concurrency) for _ in range(args.rounds)]
+        result = results[plan[0]] = median(rounds)
+        print(f'{plan[0]:<28}{result["p50_ms"]:>9.1f}{result["p95_ms"]:>9.1f}{result["p99_ms"]:>9.1f}'
+              f'{result["rps"]:>9.0f}{result["errors"]:>8}')
+    stub.stop()
+    calibration = min(calibration, calibrate())
+
+    report = {
+        'meta': {
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'transactions': History.objects.count(),
+            'users': User.objects.count(),
+            'requests': args.requests,
+            'rounds': args.rounds,
+            'concurrency': args.concurrency,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'calibration_s': round(calibration, 5),
+        },
+        'results': results,
+        'skipped': SKIPPED,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f'Baseline written to {args.baseline}')
+        return 0
+    baseline, speed = {}, 1
+    if args.baseline:
+        with open(args.baseline) as file:
+            stored = json.load(file)
+        baseline = stored['results']
+        speed = calibration / stored['meta']['calibration_s']
+        print(f'Calibration {calibration:.4f}s, baseline {stored["meta"]["calibration_s"]:.4f}s')
+    failures = compare(results, baseline, args.tolerance, speed)
+    for failure in failures:
+        print(f'FAIL {failure}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -48,16 +49,28 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'app.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'project.urls'
 
+# Templates are compiled once per process and kept by the cached loader, also with DEBUG on:
+# the development server's autoreloader clears it whenever a template file changes.
+# The pages extend app/base.html, whose asset blocks and navbar are cached with {% cache %}
+# in CACHES['template_fragments']
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with the render time recorded by the request metrics
+        'BACKEND': 'app.metrics.InstrumentedTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -71,6 +84,109 @@ TEMPLATES = [
 WSGI_APPLICATION = 'project.wsgi.application'
 
 LOGIN_URL = "login"
+
+# Number of transactions on one page of the history, the page_size query parameter
+# can change it up to HISTORY_MAX_PAGE_SIZE
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+
+# Number of rows fetched from the database at a time by the history export
+HISTORY_EXPORT_CHUNK_SIZE = 2000
+
+# The balance_checkpoints command writes a new balance checkpoint for a user once
+# at least this many transactions were added since the previous one
+BALANCE_CHECKPOINT_EVERY = 1000
+
+# Maximum number of operations in one request to the batch operations API
+API_BATCH_MAX_OPERATIONS = 1000
+
+# Maximum number of conversions in one request to the batch currency exchange API
+API_BATCH_MAX_CONVERSIONS = 10000
+
+# Request metrics served at /metrics/ in the Prometheus text format, see app/metrics.py
+# METRICS_ALLOWED_IPS - client addresses that may read them, requests forwarded by a proxy never may
+# METRICS_N_PLUS_ONE_THRESHOLD - a request that runs the same query this many times logs a warning
+
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+METRICS_N_PLUS_ONE_THRESHOLD = 10
+
+# Request profiling, see app/profiling.py and the profile_report management command
+# PROFILE_SAMPLE_RATE - fraction of requests profiled, 0 disables sampling
+# PROFILE_TOKEN - requests with this value in the X-Profile header are always profiled, None disables the header
+# PROFILE_DIR - directory the profiles are written to, at most PROFILE_MAX_FILES of them
+
+PROFILE_SAMPLE_RATE = 0
+PROFILE_TOKEN = None
+PROFILE_DIR = BASE_DIR / 'profiles'
+PROFILE_MAX_FILES = 1000
+
+# Currency exchange rates
+# CURRENCY_RATES_TTL - seconds a rates snapshot is used without contacting the API
+# CURRENCY_RATES_STALE_TTL - seconds after the TTL during which the old snapshot is served
+# while it is refreshed in the background
+# CURRENCY_API_RETRIES - extra attempts after a connection error, timeout or 5xx response,
+# separated by a jittered exponential backoff starting at CURRENCY_API_BACKOFF seconds
+# CURRENCY_API_BREAKER_THRESHOLD - consecutive failed calls after which the API is not
+# contacted for CURRENCY_API_BREAKER_RESET seconds
+
+CURRENCY_API_URL = 'https://fake-api.apps.berlintech.ai/api/currency_exchange'
+CURRENCY_API_CONNECT_TIMEOUT = 3.05
+CURRENCY_API_READ_TIMEOUT = 5
+CURRENCY_API_RETRIES = 2
+CURRENCY_API_BACKOFF = 0.2
+CURRENCY_API_POOL_SIZE = 10
+CURRENCY_API_BREAKER_THRESHOLD = 5
+CURRENCY_API_BREAKER_RESET = 30
+CURRENCY_RATES_TTL = 60
+CURRENCY_RATES_STALE_TTL = 300
+
+# Per-user cache of the balance, history and main menu fragments and of the balance and history API, see app/viewcache.py
+# VIEW_CACHE_ALIAS - the cache in CACHES that holds the entries, None disables the view cache.
+# Local memory is private to a process: with more than one server process use a shared cache
+# (e.g. django.core.cache.backends.redis.RedisCache), or a process serves entries another one invalidated
+# VIEW_CACHE_TIMEOUT - seconds an entry is kept; invalidated entries are not deleted, they expire
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'views': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'views',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Fragments of {% cache %} in the templates. Some are kept forever, so this cache must be private
+    # to the process (cleared on every restart, i.e. deploy): never point it at a shared cache
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'template_fragments',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+VIEW_CACHE_ALIAS = 'views'
+VIEW_CACHE_TIMEOUT = 300
+
+# SQLite production profile, see app/sqlite.py
+# SQLITE_PRODUCTION - sets SQLITE_PRAGMAS on every connection and keeps connections open between requests
+# SQLITE_PRAGMAS - WAL journal mode, commits without fsync (a power loss may lose the last commits, never
+# corrupts the database), 5 s busy timeout, 64 MiB page cache, 256 MiB memory mapped I/O, WAL file trimmed to 64 MiB
+# SQLITE_WRITE_QUEUE - operations are written by one writer thread per process with group commit,
+# at most SQLITE_WRITE_QUEUE_BATCH of them per transaction
+
+SQLITE_PRODUCTION = False
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'cache_size': -65536,
+    'mmap_size': 268435456,
+    'temp_store': 'memory',
+    'journal_size_limit': 67108864,
+}
+SQLITE_WRITE_QUEUE = SQLITE_PRODUCTION
+SQLITE_WRITE_QUEUE_BATCH = 100
+
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
@@ -81,6 +197,11 @@ DATABASES = {
     }
 }
 
+if SQLITE_PRODUCTION:
+    # Reuse connections for 10 minutes, checked before every request
+    DATABASES['default']['CONN_MAX_AGE'] = 600
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -115,8 +236,29 @@ USE_TZ = True
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.0/howto/static-files/
+# Bootstrap and jQuery are vendored in app/static/app/vendor and served by the app, see app/assets.py.
+# Without DEBUG the build step is: python manage.py collectstatic --noinput
+# It copies the files to STATIC_ROOT with content hashes in their names and writes .gz
+# (and .br, with the brotli package installed) variants; the app serves them under STATIC_URL.
+# STATIC_MAX_AGE - seconds browsers and proxies keep hashed files, without revalidating them
+# STATIC_UNHASHED_MAX_AGE - the same for files requested by their original name
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+STATIC_UNHASHED_MAX_AGE = 60 * 60
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'app.assets.CompressedManifestStaticFilesStorage'
+        ),
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
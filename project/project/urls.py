@@ -14,10 +14,14 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
+from app.assets import serveStatic
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # The collected static files; with DEBUG the development server serves the apps' static directories first
+    path(settings.STATIC_URL.lstrip('/') + '<path:path>', serveStatic, name='static'),
     path('', include("app.urls")),
 ]